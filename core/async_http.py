@@ -0,0 +1,282 @@
+"""
+Minimal asyncio HTTP/1.1 server for the chat bridge (stdlib only).
+
+Endpoints are declared up front as Route(methods, path, handler) entries.
+Plain function handlers take a Request and return a Response, or a dict/list
+that is sent as JSON; they run on a thread pool because nearly all of them
+touch SQLite, TTS or subprocesses. Coroutine handlers run on the event loop
+itself — that is how SSE is served: an EventStream wraps an async iterator of
+events, so an idle stream costs a pending await instead of a parked thread.
+
+Every response carries the bridge's permissive CORS headers, OPTIONS
+preflights are answered for all paths, and request bodies above
+`max_body` bytes are refused with 413 before they are read. Text responses
+of GZIP_MIN_BYTES or more are gzipped when the client accepts it.
+"""
+
+import asyncio
+import concurrent.futures
+import gzip
+import inspect
+import json
+import urllib.parse
+from http import HTTPStatus
+
+MAX_BODY_BYTES = 32 * 1024 * 1024     # base64 screenshots in /chat can be several MB
+MAX_HEADER_BYTES = 64 * 1024
+KEEPALIVE_TIMEOUT_SEC = 15
+EXECUTOR_WORKERS = 16
+GZIP_MIN_BYTES = 16 * 1024
+GZIP_LEVEL = 5
+_GZIP_TYPES = ('application/json', 'text/')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+    'Access-Control-Expose-Headers': 'ETag',
+}
+
+
+class HTTPError(Exception):
+    """Raise from a handler to answer with `status` and a JSON error body."""
+
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+        self.message = message or HTTPStatus(status).phrase
+
+
+class Request:
+
+    def __init__(self, method, target, headers, body=b''):
+        parsed = urllib.parse.urlsplit(target)
+        self.method = method
+        self.path = parsed.path
+        self.query = urllib.parse.parse_qs(parsed.query)
+        self.headers = headers      # lower-cased names
+        self.body = body
+        self.tail = ''              # remainder of the path after a prefix route
+
+    def arg(self, name, default=''):
+        """First value of query parameter `name`, or `default` when missing/empty."""
+        return (self.query.get(name) or [''])[0] or default
+
+    def json(self):
+        """Decoded JSON body ({} when the body is empty)."""
+        if not self.body:
+            return {}
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+
+
+class Response:
+
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+def json_response(data, status=200, headers=None):
+    return Response(json.dumps(data), status=status, headers=headers)
+
+
+def _finish(req, result):
+    """Turn a handler result into a Response, gzipping large text bodies."""
+    if isinstance(result, (dict, list)):
+        result = json_response(result)
+    if not isinstance(result, Response) or result.status == 304:
+        return result
+    if result.content_type.startswith(_GZIP_TYPES) and 'Content-Encoding' not in result.headers:
+        result.headers.setdefault('Vary', 'Accept-Encoding')
+        if len(result.body) >= GZIP_MIN_BYTES and 'gzip' in req.headers.get('accept-encoding', ''):
+            result.body = gzip.compress(result.body, GZIP_LEVEL)
+            result.headers['Content-Encoding'] = 'gzip'
+    return result
+
+
+class EventStream:
+    """SSE response: `events` is an async iterator of JSON-serialisable messages."""
+
+    def __init__(self, events):
+        self.events = events
+
+
+class Route:
+
+    def __init__(self, methods, path, handler, prefix=False):
+        self.methods = (methods,) if isinstance(methods, str) else tuple(methods)
+        self.path = path
+        self.handler = handler
+        self.prefix = prefix
+        self.is_async = inspect.iscoroutinefunction(handler)
+
+    def matches(self, path):
+        return path.startswith(self.path) if self.prefix else path == self.path
+
+
+class AsyncHTTPServer:
+
+    def __init__(self, routes, host='', port=8001, max_body=MAX_BODY_BYTES, workers=EXECUTOR_WORKERS):
+        self.routes = list(routes)
+        self.host = host or None
+        self.port = port
+        self.max_body = max_body
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bridge-http')
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        asyncio.get_running_loop().set_default_executor(self.executor)
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+        async with server:
+            await server.serve_forever()
+
+    # ---- connection handling -------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT_SEC)
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, json_response({"error": "Request header too large"}, 431), False)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                parsed = self._parse_head(head)
+                if parsed is None:
+                    await self._send(writer, json_response({"error": "Bad Request"}, 400), False)
+                    break
+                method, target, version, headers = parsed
+
+                if 'transfer-encoding' in headers:
+                    await self._send(writer, json_response({"error": "Content-Length required"}, 411), False)
+                    break
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send(writer, json_response({"error": "Bad Content-Length"}, 400), False)
+                    break
+                if length > self.max_body:
+                    # Refuse before reading; the unread body makes the connection unusable.
+                    await self._send(writer, json_response(
+                        {"error": f"Request body too large ({length} > {self.max_body} bytes)"}, 413), False)
+                    break
+                try:
+                    body = await reader.readexactly(length) if length else b''
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                conn_header = headers.get('connection', '').lower()
+                keep_alive = conn_header != 'close' if version == 'HTTP/1.1' else conn_header == 'keep-alive'
+
+                response = await self._dispatch(Request(method, target, headers, body))
+                if isinstance(response, EventStream):
+                    await self._stream(writer, response)
+                    break
+                await self._send(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _parse_head(head):
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split(' ', 2)
+        except (UnicodeDecodeError, ValueError):
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                return None
+            headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, version.strip(), headers
+
+    async def _dispatch(self, req):
+        if req.method == 'OPTIONS':
+            return Response()
+        route = next((r for r in self.routes if r.matches(req.path)), None)
+        if route is None:
+            return json_response({"error": "Not Found"}, 404)
+        if req.method not in route.methods:
+            return json_response({"error": "Method Not Allowed"}, 405,
+                                 headers={'Allow': ', '.join(route.methods + ('OPTIONS',))})
+        if route.prefix:
+            req.tail = req.path[len(route.path):]
+        try:
+            if route.is_async:
+                return _finish(req, await route.handler(req))
+            # Serialising and compressing big payloads happens on the worker too.
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, lambda: _finish(req, route.handler(req)))
+        except HTTPError as e:
+            return json_response({"error": e.message}, e.status)
+        except Exception as e:
+            print(f"HTTP Handler Error ({req.method} {req.path}): {e}")
+            return json_response({"error": str(e)}, 500)
+
+    # ---- writing -------------------------------------------------------
+
+    @staticmethod
+    def _head(status, headers):
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{k}: {v}" for k, v in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send(self, writer, resp, keep_alive):
+        headers = {
+            'Content-Type': resp.content_type,
+            'Content-Length': str(len(resp.body)),
+            **CORS_HEADERS,
+            'Connection': 'keep-alive' if keep_alive else 'close',
+            **resp.headers,
+        }
+        writer.write(self._head(resp.status, headers) + resp.body)
+        await writer.drain()
+
+    async def _stream(self, writer, stream):
+        headers = {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            **CORS_HEADERS,
+            'Connection': 'close',
+        }
+        events = stream.events
+        try:
+            writer.write(self._head(200, headers))
+            await writer.drain()
+            async for msg in events:
+                writer.write(f"data: {json.dumps(msg)}\n\n".encode('utf-8'))
+                await writer.drain()
+        except ConnectionError as e:
+            print(f"SSE Broken Pipe: {e}")
+        finally:
+            aclose = getattr(events, 'aclose', None)
+            if aclose is not None:
+                await aclose()
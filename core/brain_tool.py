@@ -2,6 +2,9 @@ import json
 import os
 import re
 import db_manager
+from ollama_client import ollama
+from model_residency import residency
+from subject_matcher import subject_matcher
 
 class BrainTool:
     def __init__(self):
@@ -9,25 +12,21 @@ class BrainTool:
 
     def _ensure_model_exists(self, model_id):
         """Checks if a model exists in Ollama, otherwise finds a fallback."""
-        import urllib.request
         try:
-            # First check if the requested one is there
-            tags_req = urllib.request.Request("http://localhost:11434/api/tags")
-            with urllib.request.urlopen(tags_req) as tags_resp:
-                tags_data = json.loads(tags_resp.read().decode('utf-8'))
-                available = [m.get('name') for m in tags_data.get('models', [])]
-                if model_id in available:
-                    return model_id
-                
-                # If not, try common variants or the first available
-                for m in available:
-                    if model_id.split(':')[0] in m:
-                        print(f"--- Brain Tool: Fallback to variant '{m}' ---")
-                        return m
-                
-                if available:
-                    print(f"--- Brain Tool: Total Fallback to '{available[0]}' ---")
-                    return available[0]
+            # First check if the requested one is there (cached model list)
+            available = ollama.list_models()
+            if model_id in available:
+                return model_id
+
+            # If not, try common variants or the first available
+            for m in available:
+                if model_id.split(':')[0] in m:
+                    print(f"--- Brain Tool: Fallback to variant '{m}' ---")
+                    return m
+
+            if available:
+                print(f"--- Brain Tool: Total Fallback to '{available[0]}' ---")
+                return available[0]
         except Exception as e:
             print(f"--- Brain Tool: Model check failed: {e}")
         return model_id # Hope for the best
@@ -37,22 +36,21 @@ class BrainTool:
             model_id = "fimbulvetr-v2.1:latest" # Default
             
         model_id = self._ensure_model_exists(model_id)
+        # Waits rather than evicting the resident chat model (see model_residency).
+        model_id, keep_alive = residency.background(model_id, workload='memory')
         
-        import urllib.request
-        url = "http://localhost:11434/api/generate"
         payload = {
             "model": model_id,
             "prompt": user_msg,
             "system": system_msg,
             "stream": False,
-            "keep_alive": 0
+            "keep_alive": keep_alive
         }
         
         try:
-            req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'))
-            with urllib.request.urlopen(req) as response:
-                res_data = json.loads(response.read().decode('utf-8'))
-                return res_data.get('response', '').strip()
+            res_data = ollama.generate(payload)
+            residency.record('memory', model_id, res_data)
+            return res_data.get('response', '').strip()
         except Exception as e:
             print(f"BrainTool direct Ollama call failed: {e}")
             return ""
@@ -147,11 +145,7 @@ class BrainTool:
 
         # Aggregate child data
         summary_parts = [b['content'] for b in blocks]
-        all_concepts = set()
-        for b in blocks:
-            try:
-                all_concepts.update(json.loads(b['concepts']))
-            except: pass
+        all_concepts = db_manager.get_block_concepts([b['block_id'] for b in blocks])
             
         start_t = blocks[-1]['start_time'] # Blocks are DESC, so last is earliest
         end_t = blocks[0]['end_time']
@@ -180,18 +174,6 @@ class BrainTool:
 
     def _link_to_kg(self, actor_id, block_id, text):
         """Finds KG subjects mentioned in the text and links them to the block."""
-        # Simple heuristic: fetch all subjects for this actor and check if name is in text
-        # In a real RAG system, this would be an embedding search or NER.
-        subjects = db_manager.kg_get_contexts(actor_id) # Technically returns names of non-internal contexts
-        # Better: get all subjects
-        import sqlite3
-        conn = sqlite3.connect(os.path.join(self.project_root, "core/persistence.db"))
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT subject_id, canonical_name FROM kg_subjects WHERE actor_id = ?", (actor_id,))
-        rows = cursor.fetchall()
-        
-        for r in rows:
-            if r['canonical_name'].lower() in text.lower():
-                db_manager.kg_link_memory(r['subject_id'], block_id)
-        conn.close()
+        # Names and aliases, word-boundary matched by the shared automaton (see subject_matcher).
+        for subject_id in subject_matcher.subject_ids(actor_id, text):
+            db_manager.kg_link_memory(subject_id, block_id)
@@ -1,6 +1,5 @@
 import json
 import re
-import urllib.request
 import urllib.parse
 import uuid
 import time
@@ -10,15 +9,23 @@ import subprocess
 import shutil
 import threading
 import queue
-from http.server import HTTPServer, BaseHTTPRequestHandler, ThreadingHTTPServer
+import collections
+import asyncio
+import zlib
 from media_pipeline import process_audio_for_lipsync
 from brain_tool import BrainTool
 from tts_engine import TTSEngine
 import db_manager
-from prompt_composer import PromptComposer
+from prompt_composer import PromptComposer, PROMPT_LAYOUT_STABLE_PREFIX
+from token_budget import TokenBudget
 from search_util import search_and_summarize
-
-_composer = PromptComposer()
+from json_stream import IncrementalJSONFieldParser, split_complete_sentences
+from chat_scheduler import ChatScheduler, classify_priority, PRIORITY_NAMES, PRIORITY_PULSE
+from memory_worker import MemoryConsolidator
+from kg_vectors import SubjectVectorIndex, make_embedder
+from ollama_client import ollama, OllamaError
+from model_residency import residency
+from async_http import AsyncHTTPServer, Route, Response, EventStream, HTTPError, json_response
 
 def get_default_actor_id():
     try:
@@ -36,46 +43,142 @@ _bridge_initialized = False
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TEMP_DIR = os.path.join(PROJECT_ROOT, "web/temp")
 OUTPUT_DIR = TEMP_DIR 
+# Consume Ollama's NDJSON token stream and start speaking finished sentences of
+# 'response' while the model is still writing kg_entries / memory_note.
+OLLAMA_TOKEN_STREAMING = True
+# Speech pipeline: worker threads per stage and max chunks buffered between TTS and lipsync.
+# Keep TTS at 1 unless the TTS backend is safe to call concurrently.
+TTS_WORKERS = 1
+LIPSYNC_WORKERS = 2
+SPEECH_PIPELINE_DEPTH = 4
+# SSE: max events buffered per subscriber / per turn backlog, how long a
+# finished turn stays subscribable for late clients, and how long an unfinished
+# turn nobody is subscribed to is kept (its client left, or it never closed).
+STREAM_CHANNEL_MAXLEN = 256
+STREAM_TURN_RETENTION_SEC = 120
+STREAM_TURN_IDLE_SEC = 600
+# Chat turns allowed in flight at once (always at most one per actor).
+CHAT_CONCURRENCY = 2
+# Queued observer/audiobook pulses older than this are dropped, not answered.
+PULSE_MAX_AGE_SEC = 90
+# Memory consolidation waits at most this long for user/NPC turns to drain.
+CONSOLIDATION_MAX_YIELD_SEC = 120
+# System prompt section order; stable_prefix keeps the static sections first so
+# Ollama can reuse its KV cache across turns (see prompt_composer).
+PROMPT_LAYOUT = PROMPT_LAYOUT_STABLE_PREFIX
+# Context window: the prompt is trimmed (history, KG, background, extra context)
+# to leave OLLAMA_NUM_PREDICT tokens for the reply. With DYNAMIC_NUM_CTX, num_ctx
+# grows in 2048-token steps up to MAX_NUM_CTX instead (each change reloads the model).
+OLLAMA_NUM_CTX = 4096
+OLLAMA_NUM_PREDICT = 1024
+DYNAMIC_NUM_CTX = False
+MAX_NUM_CTX = 16384
+# Semantic KG recall in the prompt: None matches subjects by name only; 'ollama'
+# adds subjects close in meaning, via KG_EMBED_MODEL (/api/embeddings). That is
+# a second resident model, so only useful with OLLAMA_MAX_LOADED_MODELS >= 2.
+KG_EMBEDDER = None
+KG_EMBED_MODEL = "nomic-embed-text"
 
 # --- GLOBAL TOOLS ---
+_subject_index = SubjectVectorIndex(make_embedder(KG_EMBEDDER, KG_EMBED_MODEL)) if KG_EMBEDDER else None
+_composer = PromptComposer(layout=PROMPT_LAYOUT, subject_index=_subject_index)
+_token_budget = TokenBudget(num_ctx=OLLAMA_NUM_CTX, num_predict=OLLAMA_NUM_PREDICT,
+                            dynamic_ctx=DYNAMIC_NUM_CTX, max_ctx=MAX_NUM_CTX)
+_token_reports = collections.deque(maxlen=50)   # recent per-call budget reports for /prompt_stats
 brain_tool = BrainTool()
 tts_engine = TTSEngine() # Fast Standalone TTS
+# Caps concurrent TTS calls process-wide, across all in-flight turns.
+_tts_slots = threading.BoundedSemaphore(TTS_WORKERS)
 
 # --- QUEUEING SYSTEM ---
-chat_queue = queue.Queue()
+_PULSE_RE = re.compile(r'^(\[[A-Z_]+_PULSE\][^\n]*)(?:\n\nTranscript:\n"(.*)")?\s*$', re.DOTALL)
+
+def _merge_pulse_requests(older, newer):
+    """Latest-wins merge of two queued pulses: joined transcripts, newest image."""
+    m_old = _PULSE_RE.match(older.get('message') or '')
+    m_new = _PULSE_RE.match(newer.get('message') or '')
+    if not (m_old and m_new):
+        return None
+    # Only merge pulses of the same kind (observer with observer, audiobook with audiobook).
+    if m_old.group(1).split(']')[0] != m_new.group(1).split(']')[0]:
+        return None
+    transcript = " ".join(t.strip() for t in (m_old.group(2), m_new.group(2)) if t and t.strip())
+    message = m_new.group(1)
+    if transcript:
+        message += "\n\nTranscript:\n\"" + transcript + "\""
+    merged = dict(newer)
+    merged['message'] = message
+    merged['images'] = newer.get('images') or older.get('images') or []
+    return merged
+
+def _discard_pulse(req_data, reason):
+    """Close the SSE turn of a pulse that was merged away or expired in the queue."""
+    stream = streamer.turn(req_data.get('turn_id'))
+    label = "merged into a newer pulse" if reason == 'merged' else "dropped (stale)"
+    print(f"--- Queue: Pulse for {req_data.get('actor_id')} {label} ---")
+    stream.push("system_warn", {"text": f"⏭️ Observation {label}"})
+    stream.push("done", {"skipped": reason})
+
+chat_queue = ChatScheduler(
+    max_concurrency=CHAT_CONCURRENCY,
+    pulse_max_age=PULSE_MAX_AGE_SEC,
+    merge_pulse=_merge_pulse_requests,
+    on_discard=_discard_pulse,
+)
+
+# Pages/chapters/books are written off the chat path, yielding to user/NPC turns.
+consolidator = MemoryConsolidator(
+    brain_tool,
+    should_yield=chat_queue.interactive_load,
+    notify=lambda text: streamer.push("system_warn", {"text": text}),
+    yield_max_sec=CONSOLIDATION_MAX_YIELD_SEC,
+)
 
 def chat_worker():
-    """Consumes requests from chat_queue and executes them one-by-one."""
+    """Runs scheduled chat turns; CHAT_CONCURRENCY of these share chat_queue."""
     while True:
         try:
-            req_data = chat_queue.get()
-            if req_data is None: break # Shutdown signal
+            job = chat_queue.next_job()
+            if job is None: break # Shutdown signal
+            req_data = job['req']
             
-            print(f"--- Queue: Processing request for {req_data['actor_id']} ---")
+            wait_sec = job['started_at'] - job['enqueued_at']
+            print(f"--- Queue: Processing {PRIORITY_NAMES.get(job['priority'])} request for {req_data['actor_id']} (waited {wait_sec:.1f}s) ---")
+            stream = streamer.turn(req_data.get('turn_id'))
             try:
+                messages = req_data.get('messages')
+                if messages is None:
+                    # Pulses are logged only when they actually run (after coalescing).
+                    db_manager.log_dialogue(req_data['actor_id'], "user", req_data['message'])
+                    messages = db_manager.get_recent_history(req_data['actor_id'], limit=15)
                 generate_and_stream(
-                    req_data['messages'], 
+                    messages, 
                     req_data['actor_id'], 
                     req_data['model'], 
                     req_data['voice_desc'], 
                     req_data['images'],
                     req_data.get('active_context'),
-                    extra_data=req_data.get('extra_data')
+                    extra_data=req_data.get('extra_data'),
+                    turn_id=req_data.get('turn_id')
                 )
             except Exception as ge:
                 error_msg = f"Generation failed: {str(ge)}"
                 print(f"--- Queue: Generation Error: {ge} ---")
-                streamer.push("error", error_msg)
-                streamer.push("system_warn", {"text": f"🧠 Brain Halt: {error_msg}"})
-            
-            chat_queue.task_done()
+                stream.push("system_warn", {"text": f"🧠 Brain Halt: {error_msg}"})
+                stream.push("error", error_msg)
+            finally:
+                chat_queue.task_done(job)
         except Exception as e:
             print(f"--- Queue Worker Critical Error: {e} ---")
             streamer.push("system_warn", {"text": f"🚨 Queue Worker Failure: {str(e)}"})
             time.sleep(1)
 
-def clean_text_for_speech(text):
-    """Strips markdown, parentheticals, and stage cues for clean TTS."""
+def clean_text_for_speech(text, strip_cues=True):
+    """Strips markdown, parentheticals, and stage cues for clean TTS.
+
+    Pass strip_cues=False when text continues a line that was already spoken,
+    so a mid-line sentence containing a colon is not mistaken for a cue.
+    """
     import re
     
     # 1. Strip markdown bold **text** and other markers first
@@ -84,7 +187,8 @@ def clean_text_for_speech(text):
     
     # 2. Strip stage cues like "Pilot's Voice:" or "Assistant:" 
     # Must handle both start-of-line and mid-text if the LLM is weird
-    text = re.sub(r'^[A-Za-z0-9 ’\'-]+:', '', text, flags=re.MULTILINE)
+    if strip_cues:
+        text = re.sub(r'^[A-Za-z0-9 ’\'-]+:', '', text, flags=re.MULTILINE)
     
     # 3. Strip parenthetical narration (actions)
     text = re.sub(r'\(.*?\)', '', text)
@@ -105,50 +209,6 @@ def clean_text_for_speech(text):
     return text
 
 
-def _clean_kg_token(text, max_len=80):
-    """Normalize noisy LLM token strings before KG validation."""
-    if text is None:
-        return ""
-    out = str(text).strip().strip('"').strip("'")
-    out = out.replace('*', '')
-    out = re.sub(r'\s+', ' ', out).strip()
-    if len(out) > max_len:
-        out = out[:max_len].rstrip()
-    return out
-
-
-def _is_valid_kg_name(name):
-    """Named entities should be concise noun-like labels, not full sentences."""
-    if not name:
-        return False
-    if len(name) < 2 or len(name) > 80:
-        return False
-    if name.endswith(('.', '?', '!', ':', ';')):
-        return False
-    # Block obvious sentence-like fragments.
-    lowered = name.lower()
-    bad_starts = (
-        "i ", "i'm ", "im ", "my ", "we ", "we're ", "you ", "the ", "this ", "that "
-    )
-    if lowered.startswith(bad_starts):
-        return False
-    if len(name.split()) > 8:
-        return False
-    return True
-
-
-def _is_valid_kg_predicate(predicate):
-    """Predicates should be compact verb labels (no sentence punctuation)."""
-    if not predicate:
-        return False
-    p = predicate.strip().lower()
-    if len(p) < 2 or len(p) > 32:
-        return False
-    if any(ch in p for ch in ".!?,:;"):
-        return False
-    return bool(re.match(r'^[a-z0-9_ -]+$', p))
-
-
 def _canonical_emotion_state(raw_state):
     """Map arbitrary mood labels to HUD canonical states."""
     s = (str(raw_state or "")).strip().lower()
@@ -222,92 +282,414 @@ def _infer_emotion_for_presentation(reasoning_data, thought, ai_text):
 
 def format_action_library():
     """Formats the indexed animations into a concise string for LLM awareness."""
-    anims = db_manager.get_all_animations()
-    if not anims:
-        return "No special actions available."
-    
-    lib_str = "Available Actions:\n"
-    for a in anims:
-        lib_str += f"- {a['filename']} (Purpose: {a['action_purpose']}, Trigger: {a['trigger_condition']})\n"
-    return lib_str
+    return _composer.action_library()
 
 # --- STREAMING INFRASTRUCTURE ---
-class StreamHandler:
-    def __init__(self):
-        self.msg_queue = queue.Queue()
-        self.active = False
+# Events a full channel may shed first; speech and terminal events are kept.
+_DROPPABLE_EVENTS = {"ping", "system_warn", "kg_write", "thinking", "reasoning", "emotion"}
+
+
+class StreamChannel:
+    """Bounded event buffer for one SSE subscriber."""
+
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen or STREAM_CHANNEL_MAXLEN
+        self.dropped = 0
+        self._events = collections.deque()
+        self._cond = threading.Condition()
+        self._waiters = []      # (loop, asyncio.Event) of event-loop consumers parked in aget()
+
+    def put(self, msg):
+        with self._cond:
+            if len(self._events) >= self.maxlen:
+                # Drop policy: shed the oldest low-value event, else the oldest event.
+                victim = next((m for m in self._events if m.get("type") in _DROPPABLE_EVENTS), None)
+                if victim is not None:
+                    self._events.remove(victim)
+                else:
+                    self._events.popleft()
+                self.dropped += 1
+            self._events.append(msg)
+            self._cond.notify()
+            waiters, self._waiters = self._waiters, []
+        for loop, wakeup in waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass    # loop already closed
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._events and not self._cond.wait_for(lambda: self._events, timeout=timeout):
+                raise queue.Empty
+            return self._events.popleft()
+
+    async def aget(self, timeout=None):
+        """get() for event-loop consumers: awaits without holding a thread."""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        with self._cond:
+            if self._events:
+                return self._events.popleft()
+            self._waiters.append((loop, wakeup))
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            if (loop, wakeup) in self._waiters:
+                self._waiters.remove((loop, wakeup))
+            if not self._events:
+                raise queue.Empty
+            return self._events.popleft()
+
+    def snapshot(self):
+        with self._cond:
+            return list(self._events)
+
+
+class TurnStream:
+    """Push handle bound to one turn; what generation code writes to."""
+
+    def __init__(self, hub, turn_id):
+        self.hub = hub
+        self.turn_id = turn_id
 
     def push(self, event_type, data):
-        self.msg_queue.put({"type": event_type, "data": data})
+        self.hub.push(event_type, data, turn_id=self.turn_id)
 
-    def get(self, timeout=None):
-        return self.msg_queue.get(timeout=timeout)
 
-# Global stream instance (Persistent Singleton)
+class StreamHandler:
+    """
+    Routes events to per-turn SSE subscribers plus a fan-out observer feed.
+
+    /chat opens a turn and returns its id; /stream_audio?turn_id=... replays
+    that turn's backlog and then follows it until 'done'/'error', so several
+    clients can watch the same turn without stealing each other's events and
+    nothing from an earlier turn leaks in. Observers (mind map, overlays) see
+    every event from every turn via /stream_events.
+
+    A turn is dropped when its last subscriber disconnects after it closed,
+    STREAM_TURN_RETENTION_SEC after it closed unwatched, or once it has had no
+    subscribers for STREAM_TURN_IDLE_SEC without closing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._turns = {}        # turn_id -> {"backlog", "subscribers", "closed_at", "idle_since"}
+        self._observers = set()
+        self._latest_turn_id = None
+
+    def open_turn(self, turn_id):
+        with self._lock:
+            self._purge_finished_locked()
+            self._turns[turn_id] = {
+                "backlog": StreamChannel(),
+                "subscribers": set(),
+                "closed_at": None,
+                "idle_since": time.time(),     # None while someone is subscribed
+            }
+            self._latest_turn_id = turn_id
+        return TurnStream(self, turn_id)
+
+    def turn(self, turn_id):
+        return TurnStream(self, turn_id)
+
+    def push(self, event_type, data, turn_id=None):
+        msg = {"type": event_type, "data": data}
+        if turn_id:
+            msg["turn_id"] = turn_id
+        with self._lock:
+            turn = self._turns.get(turn_id) if turn_id else None
+            targets = list(self._observers)
+            if turn is not None:
+                turn["backlog"].put(msg)
+                targets.extend(turn["subscribers"])
+                if event_type in ("done", "error"):
+                    turn["closed_at"] = time.time()
+        for channel in targets:
+            channel.put(msg)
+
+    def subscribe_turn(self, turn_id=None):
+        """Channel primed with the turn's backlog; None turn_id follows the latest turn."""
+        with self._lock:
+            turn_id = turn_id or self._latest_turn_id
+            turn = self._turns.get(turn_id)
+            if turn is None:
+                return None, turn_id
+            channel = StreamChannel()
+            for msg in turn["backlog"].snapshot():
+                channel.put(msg)
+            turn["subscribers"].add(channel)
+            turn["idle_since"] = None
+        return channel, turn_id
+
+    def subscribe_observer(self):
+        channel = StreamChannel()
+        with self._lock:
+            self._observers.add(channel)
+        return channel
+
+    def unsubscribe(self, channel, turn_id=None):
+        with self._lock:
+            self._observers.discard(channel)
+            turn = self._turns.get(turn_id)
+            if turn is not None:
+                turn["subscribers"].discard(channel)
+                if not turn["subscribers"]:
+                    if turn["closed_at"]:
+                        del self._turns[turn_id]
+                    else:
+                        turn["idle_since"] = time.time()
+            self._purge_finished_locked()
+
+    def _purge_finished_locked(self):
+        now = time.time()
+        closed_cutoff = now - STREAM_TURN_RETENTION_SEC
+        idle_cutoff = now - STREAM_TURN_IDLE_SEC
+        for tid in [t for t, v in self._turns.items()
+                    if (v["closed_at"] and v["closed_at"] < closed_cutoff)
+                    or (v["idle_since"] and v["idle_since"] < idle_cutoff)]:
+            del self._turns[tid]
+
+# Global stream hub (Persistent Singleton)
 streamer = StreamHandler()
 
-# Background thread disabled per user request
-def idle_monitor():
-    pass
 
-def run_memory_heartbeat(actor_id):
-    """Create one non-overlapping page per trigger using dialogue id ranges."""
-    step = 15
-    key_processed = f"heartbeat_last_processed_dialogue_id_{actor_id}"
+class SpeechPipeline:
+    """
+    Bounded TTS → lipsync → SSE pipeline for one turn.
+
+    Chunk N+1 is synthesized while chunk N is still in rhubarb. Each stage has
+    its own worker pool; say() only appends to an unbounded hand-off queue so
+    token reading never waits on TTS, while TTS blocks once lipsync is
+    SPEECH_PIPELINE_DEPTH chunks behind. Finished chunks are released to the
+    stream strictly in the order they were said. Workers start on the first
+    chunk, so silent turns and tool-call passes cost no threads.
+    """
 
-    try:
-        last_processed_id = int(db_manager.get_reality(key_processed, "0") or 0)
-    except Exception:
-        last_processed_id = 0
+    def __init__(self, actor_id, energy, stream, tts_workers=None, lipsync_workers=None, depth=None):
+        self.actor_id = actor_id
+        self.energy = energy
+        self.stream = stream
+        self._turn_stamp = int(time.time() * 1000)
+        self._count = 0
+        self._tts_q = queue.Queue()
+        self._sync_q = queue.Queue(maxsize=depth or SPEECH_PIPELINE_DEPTH)
+        self._emit_lock = threading.Lock()
+        self._ready = {}        # chunk index -> [(event_type, data), ...]
+        self._next_emit = 0
+        self._finished = False
+        self._tts_threads = [
+            threading.Thread(target=self._tts_stage, daemon=True)
+            for _ in range(max(1, tts_workers or TTS_WORKERS))
+        ]
+        self._sync_threads = [
+            threading.Thread(target=self._lipsync_stage, daemon=True)
+            for _ in range(max(1, lipsync_workers or LIPSYNC_WORKERS))
+        ]
+        self._started = False
+
+    def say(self, text, mid_line=False):
+        """Queue text for speech; mid_line=True if it continues an already spoken line."""
+        for n, raw_para in enumerate(re.split(r'\n+', text or "")):
+            clean_para = clean_text_for_speech(raw_para, strip_cues=not (mid_line and n == 0))
+            if not clean_para or len(clean_para) < 2:
+                continue
+            if not self._started:
+                self._started = True
+                for t in self._tts_threads + self._sync_threads:
+                    t.start()
+            self._tts_q.put((self._count, clean_para))
+            self._count += 1
+
+    def finish(self):
+        """Block until every chunk said so far has been emitted. Safe to call twice."""
+        if self._finished:
+            return
+        self._finished = True
+        if not self._started:
+            return
+        for _ in self._tts_threads:
+            self._tts_q.put(None)
+        for t in self._tts_threads:
+            t.join()
+        for _ in self._sync_threads:
+            self._sync_q.put(None)
+        for t in self._sync_threads:
+            t.join()
+
+    def _tts_stage(self):
+        while True:
+            item = self._tts_q.get()
+            if item is None:
+                break
+            i, clean_para = item
+            audio_id = f"stream_{self._turn_stamp}_{i}"
+            print(f"--- Processing Chunk {i+1} ({audio_id}): {clean_para[:50]}... ---")
+            wav_path = os.path.join(TEMP_DIR, f"{audio_id}.wav")
+            try:
+                voice_ref = db_manager.get_actor_trait(self.actor_id, "voice_reference_audio", None)
+                with _tts_slots:
+                    tts_engine.generate(clean_para, wav_path, voice_reference_audio=voice_ref)
+            except Exception as e:
+                print(f"TTS Fail: {e}")
+                # Degrade gracefully: keep chat functional even when voice backend is down.
+                self._complete(i, self._text_only(clean_para, f"TTS unavailable for this chunk: {e}"))
+                continue
+            self._sync_q.put((i, clean_para, audio_id, wav_path))
 
-    max_id = db_manager.get_max_dialogue_id(actor_id)
-    if max_id <= last_processed_id:
-        return
+    def _lipsync_stage(self):
+        while True:
+            item = self._sync_q.get()
+            if item is None:
+                break
+            i, clean_para, audio_id, wav_path = item
+            vis_path = os.path.join(TEMP_DIR, f"{audio_id}_visemes.json")
+            try:
+                process_audio_for_lipsync(wav_path, vis_path)
+            except Exception as e:
+                print(f"Lipsync Fail: {e}")
+                self._complete(i, self._text_only(clean_para, f"Lipsync failed for this chunk: {e}"))
+                continue
+            self._complete(i, [("audio", {
+                "audioUrl": f"./temp/{audio_id}.wav",
+                "visemeUrl": f"./temp/{audio_id}_visemes.json",
+                "text": clean_para,
+                "stats": {"energy": self.energy}
+            })])
+
+    def _text_only(self, clean_para, warn):
+        return [
+            ("system_warn", {"text": warn}),
+            ("assistant_text", {"text": clean_para, "stats": {"energy": self.energy}}),
+        ]
+
+    def _complete(self, i, events):
+        # Release every contiguous finished chunk; later chunks wait for earlier ones.
+        with self._emit_lock:
+            self._ready[i] = events
+            while self._next_emit in self._ready:
+                for event_type, data in self._ready.pop(self._next_emit):
+                    self.stream.push(event_type, data)
+                self._next_emit += 1
+
+
+class StreamingReply:
+    """
+    Watches a token-streamed JSON reply and releases side effects early.
 
-    chunk = db_manager.get_dialogue_after_id(actor_id, last_processed_id, limit=step)
-    if len(chunk) < step:
-        return
+    Nothing is released until both tool fields (search_query / memory_query)
+    have closed empty — otherwise a follow-up call will replace this reply.
+    After that, an explicit emotion field and the action decision are pushed
+    as soon as they close, and whole sentences of 'response' are handed to
+    the speech pipeline while the rest of the object is still being generated.
+    """
 
-    start_id = int(chunk[0]['id'])
-    end_id = int(chunk[-1]['id'])
-    start_t = chunk[0].get('timestamp')
-    end_t = chunk[-1].get('timestamp')
+    _EMOTION_KEYS = ("emotion_state", "emotion", "facial_mood", "avatar_mood", "mood")
+
+    def __init__(self, stream, speech=None):
+        self.parser = IncrementalJSONFieldParser()
+        self.stream = stream
+        self.speech = speech
+        self.spoken_text = ""       # decoded prefix of 'response' already spoken
+        self.emotion_pushed = False
+        self.action_decided = False
+
+    def _is_final_pass(self):
+        f = self.parser.fields
+        if 'search_query' not in f or 'memory_query' not in f:
+            return False
+        return not any(isinstance(f[k], str) and f[k].strip() for k in ('search_query', 'memory_query'))
+
+    def feed(self, piece):
+        self.parser.feed(piece)
+        if not self._is_final_pass():
+            return
+        f = self.parser.fields
+
+        if not self.emotion_pushed and any(k in f for k in self._EMOTION_KEYS):
+            emo_state, emo_intensity, emo_hold_sec, emo_source = _infer_emotion_for_presentation(f, None, None)
+            if emo_source == "explicit":
+                self.emotion_pushed = True
+                self.stream.push("emotion", {
+                    "state": emo_state,
+                    "intensity": emo_intensity,
+                    "hold_sec": emo_hold_sec,
+                    "source": emo_source
+                })
 
-    print(f"--- [Heartbeat: Page] Triggering extraction for {actor_id} over msg_id_{start_id}:{end_id} ---")
-    streamer.push("system_warn", {"text": "📝 Writing a new page in the journal..."})
+        if not self.action_decided and all(k in f for k in ('selection_type', 'action', 'confidence')):
+            self.action_decided = True
+            try:
+                confidence = float(f['confidence'])
+            except Exception:
+                confidence = 0.0
+            if f['selection_type'] == 'appropriate_action' and f['action'] and confidence >= 0.7:
+                self.stream.push("action", {
+                    "url": f"assets/animations/{f['action']}",
+                    "name": f['action']
+                })
 
-    ok = brain_tool.extract_concepts(
-        actor_id,
-        f"msg_id_{start_id}:{end_id}",
-        dialogue_rows=chunk,
-        start_t=start_t,
-        end_t=end_t
-    )
-    if not ok:
-        print(f"--- [Heartbeat WARN] Page extraction fallback failed for msg_id_{start_id}:{end_id} ---")
-        return
+        if self.speech and f.get('response_mode') in ('speak', 'speak_and_absorb'):
+            text = self.parser.partial_string('response')
+            if not text:
+                return
+            if 'response' in f:
+                chunk = text[len(self.spoken_text):]
+            else:
+                chunk, _ = split_complete_sentences(text, len(self.spoken_text))
+            if chunk.strip():
+                mid_line = self._mid_line(self.spoken_text)
+                self.spoken_text += chunk
+                self.speech.say(chunk, mid_line=mid_line)
+
+    @staticmethod
+    def _mid_line(prefix):
+        return bool(prefix) and not prefix.endswith('\n')
+
+    def speak_rest(self, full_text):
+        """Hand the part of the final response text not yet spoken to the speech pipeline."""
+        if full_text.startswith(self.spoken_text):
+            done = len(self.spoken_text)
+        else:
+            # The final parse disagrees with what was streamed; resume after the
+            # longest common prefix rather than dropping the rest of the reply.
+            done = len(os.path.commonprefix([full_text, self.spoken_text]))
+            print(f"--- [Speech] Final response diverges from streamed text at char {done} "
+                  f"({len(self.spoken_text)} already spoken) ---")
+        if self.speech:
+            self.speech.say(full_text[done:], mid_line=self._mid_line(full_text[:done]))
 
-    # Advance marker only after successful write.
-    db_manager.set_reality(key_processed, str(end_id))
+# Background thread disabled per user request
+def idle_monitor():
+    pass
 
-    # Refinement tiers depend on actual persisted page/chapter counts.
-    try:
-        page_count = db_manager.get_block_count(actor_id, block_type='page')
-        if page_count > 0 and page_count % 5 == 0:
-            print(f"--- [Heartbeat: Chapter] Refining 5 pages into a chapter for {actor_id} ---")
-            streamer.push("system_warn", {"text": "📖 Consolidating pages into a new Chapter..."})
-            chapter_text = brain_tool.refine_memory(actor_id, target_type='chapter')
-            if chapter_text:
-                chapter_count = db_manager.get_block_count(actor_id, block_type='chapter')
-                if chapter_count > 0 and chapter_count % 5 == 0:
-                    print(f"--- [Heartbeat: Book] Consolidating 5 chapters into a book for {actor_id} ---")
-                    streamer.push("system_warn", {"text": "📚 Archiving chapters into a new Book of Life..."})
-                    brain_tool.refine_memory(actor_id, target_type='book')
-    except Exception as re:
-        print(f"Memory Refinement Error: {re}")
-
-def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=None, active_context=None, extra_data=None):
+def run_memory_heartbeat(actor_id):
+    """Queue any complete dialogue pages for the background consolidator; returns at once."""
+    queued = consolidator.submit(actor_id)
+    if queued:
+        print(f"--- [Heartbeat] Queued {queued} page(s) for {actor_id} ---")
+    return queued
+
+def _fit_prompt(sections, history, images, model):
+    """Trim prompt sections/history to the token budget; returns (system_msg, plan)."""
+    plan = _token_budget.fit(sections, history, images)
+    system_msg = _composer.join_sections(plan.sections, model)
+    report = plan.report
+    _token_reports.append(dict(report, model=model, at=time.time()))
+    trimmed = f", trimmed {report['trimmed']}" if report['trimmed'] else ""
+    print(f"--- Token Budget: ~{report['prompt_tokens']} prompt tokens, num_ctx {report['num_ctx']}{trimmed} ---")
+
+    prefix = _composer.last_prefix_report(model)
+    if prefix:
+        print(f"--- Prompt Prefix ({prefix['layout']}): reused {prefix['reused_prefix_chars']}/{prefix['prompt_chars']} chars "
+              f"({prefix['reused_ratio']:.0%}), stable {prefix['stable_prefix_chars']} ---")
+    return system_msg, plan
+
+def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=None, active_context=None, extra_data=None, turn_id=None):
     """Background thread function to generate text and stream audio chunks."""
+    stream = streamer.turn(turn_id)
     global _last_activity_time
     _last_activity_time = time.time() # Update activity on start
     
@@ -339,21 +721,26 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         else:
             active_context = "user_dialogue"
 
-    full_system_msg = _composer.build_system_prompt(
+    traits = db_manager.get_actor_traits(actor_id, {
+        "persona": "You are a helpful AI.",
+        "background_memory": "",
+    })
+    prompt_sections = _composer.compose_sections(
         actor_id=actor_id,
         message=trigger_message,
         action_library_str=lib_str,
-        legacy_persona=db_manager.get_actor_trait(actor_id, "persona", "You are a helpful AI."),
-        legacy_background=db_manager.get_actor_trait(actor_id, "background_memory", ""),
+        legacy_persona=traits["persona"],
+        legacy_background=traits["background_memory"],
         extra_context=extra_data.get('extra_context') if extra_data else None,
         known_contexts=known_contexts,
         active_context=active_context,
     )
+    full_system_msg, budget_plan = _fit_prompt(prompt_sections, clean_history, images, requested_model)
+    clean_history = budget_plan.history
     
     # Assemble final payload for Ollama
     ollama_messages = [{"role": "system", "content": full_system_msg}] + clean_history
 
-    ollama_url = "http://localhost:11434/api/chat"
     # If images were provided, attach them to the LAST user message
     if images and len(ollama_messages) > 0:
         for i in range(len(ollama_messages) - 1, -1, -1):
@@ -365,60 +752,71 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         "model": requested_model,
         "messages": ollama_messages,
         "format": "json",
-        "stream": False,
+        "stream": OLLAMA_TOKEN_STREAMING,
         "keep_alive": -1,
         "options": {
             "temperature": 0.85,       # Slight reduction keeps her coherent; default is 0.8–1.0
             "repeat_penalty": 1.15,    # Penalises repeating tokens/phrases; 1.0 = off, >1 = stronger
             "repeat_last_n": 128,      # How many tokens back to scan for repetition
-            "num_predict": 1024,       # Prevent long reasoning/JSON blocks from being truncated
-            "num_ctx": 4096            # Support deep memory retrieval Windows
+            "num_predict": OLLAMA_NUM_PREDICT,  # Prevent long reasoning/JSON blocks from being truncated
+            "num_ctx": budget_plan.num_ctx      # Sized by TokenBudget (fixed unless DYNAMIC_NUM_CTX)
         }
     }
     
     ai_full_text = ""
     reasoning_data = {}
-
-    def _call_ollama_chat(payload):
+    speech = SpeechPipeline(actor_id, new_energy, stream)
+    reply = None
+
+    def _read_ollama_reply(payload, sink):
+        with residency.generating(payload["model"]):
+            if not payload.get("stream"):
+                data = ollama.chat(payload)
+                residency.record('chat', payload["model"], data)
+                return data.get('message', {}).get('content', '{}')
+            # NDJSON: one {"message": {"content": <token>}, "done": bool} object per line.
+            parts = []
+            for chunk in ollama.chat_stream(payload):
+                piece = chunk.get('message', {}).get('content', '')
+                if piece:
+                    parts.append(piece)
+                    if sink:
+                        sink.feed(piece)
+                if chunk.get('done'):
+                    residency.record('chat', payload["model"], chunk)  # final chunk carries load_duration
+            return "".join(parts) or '{}'
+
+    def _call_ollama_chat(payload, sink=None):
         model_name = payload.get("model", requested_model)
-        print(f"--- Calling Ollama Chat (Model: {model_name}) ---")
-        req = urllib.request.Request(ollama_url, data=json.dumps(payload).encode('utf-8'))
+        print(f"--- Calling Ollama Chat (Model: {model_name}, stream={bool(payload.get('stream'))}) ---")
         raw = "{}"
         try:
-            with urllib.request.urlopen(req) as resp:
-                result_data = json.loads(resp.read().decode('utf-8'))
-                raw = result_data.get('message', {}).get('content', '{}')
-        except urllib.error.HTTPError as he:
-            if he.code == 404:
+            raw = _read_ollama_reply(payload, sink)
+        except OllamaError as he:
+            if he.status == 404:
                 warn_msg = f"Model '{model_name}' not found in Ollama."
                 print(f"!!! {warn_msg} Attempting auto-fallback...")
-                streamer.push("system_warn", {"text": f"⚠️ {warn_msg} Trying fallback..."})
+                stream.push("system_warn", {"text": f"⚠️ {warn_msg} Trying fallback..."})
                 try:
-                    tags_req = urllib.request.Request("http://localhost:11434/api/tags")
-                    with urllib.request.urlopen(tags_req) as tags_resp:
-                        tags_data = json.loads(tags_resp.read().decode('utf-8'))
-                        available = tags_data.get('models', [])
-                        if available:
-                            fallback_name = available[0].get('name')
-                            print(f"--- Fallback: Retrying with '{fallback_name}' ---")
-                            streamer.push("system_warn", {"text": f"🔄 Falling back to: {fallback_name}"})
-                            payload['model'] = fallback_name
-                            req = urllib.request.Request(ollama_url, data=json.dumps(payload).encode('utf-8'))
-                            with urllib.request.urlopen(req) as resp2:
-                                res2_data = json.loads(resp2.read().decode('utf-8'))
-                                raw = res2_data.get('message', {}).get('content', '{}')
-                        else:
-                            raise Exception("No fallback models found.")
+                    available = ollama.list_models(refresh=True)
+                    if available:
+                        fallback_name = available[0]
+                        print(f"--- Fallback: Retrying with '{fallback_name}' ---")
+                        stream.push("system_warn", {"text": f"🔄 Falling back to: {fallback_name}"})
+                        payload['model'] = fallback_name
+                        raw = _read_ollama_reply(payload, sink)
+                    else:
+                        raise Exception("No fallback models found.")
                 except Exception as fe:
                     print(f"Fallback Failed: {fe}")
-                    streamer.push("system_warn", {"text": f"❌ All Brain Fallbacks failed: {str(fe)}"})
+                    stream.push("system_warn", {"text": f"❌ All Brain Fallbacks failed: {str(fe)}"})
                     raise he
             else:
                 raise he
         except Exception as oe:
             print(f"Ollama Connection Error: {oe}")
-            streamer.push("system_warn", {"text": f"🌐 Ollama Connection Error: {str(oe)}"})
-            streamer.push("error", f"Brain disconnect: {str(oe)}")
+            stream.push("system_warn", {"text": f"🌐 Ollama Connection Error: {str(oe)}"})
+            stream.push("error", f"Brain disconnect: {str(oe)}")
             raise oe
         return raw
 
@@ -453,12 +851,12 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         except Exception as je:
             print(f"JSON Parse Error: {je}")
             print(f"Raw was: {raw_json_text}")
-            streamer.push("system_warn", {"text": f"🧩 Brain Salad (JSON Error): {str(je)}"})
+            stream.push("system_warn", {"text": f"🧩 Brain Salad (JSON Error): {str(je)}"})
             # Attempt to use regex as a last resort
             found_response = re.search(r'"response":\s*"(.*?)"', raw_json_text, re.DOTALL)
             if found_response:
                 out["reasoning_data"] = {"response": found_response.group(1), "response_mode": "speak"}
-                streamer.push("system_warn", {"text": "🩹 Recovered dialogue via regex fallback."})
+                stream.push("system_warn", {"text": "🩹 Recovered dialogue via regex fallback."})
 
         rd = out["reasoning_data"]
         out["ai_full_text"] = rd.get('response') or rd.get('text') or rd.get('dialogue') or ""
@@ -490,7 +888,9 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         return out
 
     try:
-        parsed = _extract_reasoning(_call_ollama_chat(ollama_payload))
+        if ollama_payload["stream"]:
+            reply = StreamingReply(stream, speech)
+        parsed = _extract_reasoning(_call_ollama_chat(ollama_payload, reply))
         reasoning_data = parsed["reasoning_data"]
         thought = parsed["thought"]
         intent = parsed["intent"]
@@ -508,26 +908,29 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
             followup_user_msg = ""
             if search_query:
                 print(f"--- Triggering Web Research: {search_query} ---")
-                streamer.push("system_warn", {"text": f"🔍 Researching: {search_query}"})
+                stream.push("system_warn", {"text": f"🔍 Researching: {search_query}"})
                 try:
                     research_results = search_and_summarize(search_query)
                     followup_user_msg = f"[RESEARCH_RESULT] Search query: '{search_query}'\nFindings:\n{research_results}"
                 except Exception as se:
                     print(f"Web Research Error: {se}")
-                    streamer.push("system_warn", {"text": f"🕳️ Research Failed: {str(se)}"})
+                    stream.push("system_warn", {"text": f"🕳️ Research Failed: {str(se)}"})
                     followup_user_msg = (
                         f"[RESEARCH_RESULT] Search query: '{search_query}'\n"
                         f"Findings:\nSearch failed: {str(se)}"
                     )
             else:
                 print(f"--- Triggering Memory Research: {memory_query} ---")
-                streamer.push("system_warn", {"text": f"🧠 Recalling: {memory_query}"})
+                stream.push("system_warn", {"text": f"🧠 Recalling: {memory_query}"})
                 try:
                     kg_context = db_manager.kg_retrieve_context(
                         actor_id,
                         [memory_query],
                         active_context=active_context
                     )
+                    if not kg_context:
+                        # Not a known subject: fall back to full-text search over what was said.
+                        kg_context = db_manager.memory_search_context(actor_id, memory_query)
                     if kg_context:
                         followup_user_msg = f"[MEMORY_RESULT] Memory query: '{memory_query}'\nFindings:\n{kg_context}"
                     else:
@@ -537,7 +940,7 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
                         )
                 except Exception as me:
                     print(f"Memory Research Error: {me}")
-                    streamer.push("system_warn", {"text": f"🕳️ Memory Recall Failed: {str(me)}"})
+                    stream.push("system_warn", {"text": f"🕳️ Memory Recall Failed: {str(me)}"})
                     followup_user_msg = (
                         f"[MEMORY_RESULT] Memory query: '{memory_query}'\n"
                         f"Findings:\nMemory retrieval failed: {str(me)}"
@@ -549,26 +952,30 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
             ]
             followup_clean_history = [m for m in followup_messages if m.get('role') in ('user', 'assistant')]
             followup_trigger = followup_messages[-1]['content'] if followup_messages else trigger_message
-            followup_system_msg = _composer.build_system_prompt(
+            followup_sections = _composer.compose_sections(
                 actor_id=actor_id,
                 message=followup_trigger,
                 action_library_str=lib_str,
-                legacy_persona=db_manager.get_actor_trait(actor_id, "persona", "You are a helpful AI."),
-                legacy_background=db_manager.get_actor_trait(actor_id, "background_memory", ""),
+                legacy_persona=traits["persona"],
+                legacy_background=traits["background_memory"],
                 extra_context=extra_data.get('extra_context') if extra_data else None,
                 known_contexts=db_manager.kg_get_contexts(actor_id),
                 active_context=active_context,
             )
+            followup_system_msg, followup_plan = _fit_prompt(
+                followup_sections, followup_clean_history, None, ollama_payload.get("model", requested_model))
             followup_payload = {
                 "model": ollama_payload.get("model", requested_model),
-                "messages": [{"role": "system", "content": followup_system_msg}] + followup_clean_history,
+                "messages": [{"role": "system", "content": followup_system_msg}] + followup_plan.history,
                 "format": "json",
-                "stream": False,
+                "stream": OLLAMA_TOKEN_STREAMING,
                 "keep_alive": -1,
-                "options": ollama_payload.get("options", {})
+                "options": dict(ollama_payload.get("options", {}), num_ctx=followup_plan.num_ctx)
             }
 
-            parsed = _extract_reasoning(_call_ollama_chat(followup_payload))
+            if followup_payload["stream"]:
+                reply = StreamingReply(stream, speech)
+            parsed = _extract_reasoning(_call_ollama_chat(followup_payload, reply))
             reasoning_data = parsed["reasoning_data"]
             thought = parsed["thought"]
             intent = parsed["intent"]
@@ -583,7 +990,7 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
             memory_query = None
 
         # Push reasoning info once, after tool resolution.
-        streamer.push("reasoning", {
+        stream.push("reasoning", {
             "thought": thought,
             "intent": intent,
             "selection_type": selection_type,
@@ -592,19 +999,21 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         })
 
         # Emit per-turn emotion signal for real-time avatar expression/overlays.
+        # A token-streamed reply may already have pushed these mid-generation.
         emo_state, emo_intensity, emo_hold_sec, emo_source = _infer_emotion_for_presentation(
             reasoning_data, thought, ai_full_text
         )
-        streamer.push("emotion", {
-            "state": emo_state,
-            "intensity": emo_intensity,
-            "hold_sec": emo_hold_sec,
-            "source": emo_source
-        })
+        if not (reply and reply.emotion_pushed):
+            stream.push("emotion", {
+                "state": emo_state,
+                "intensity": emo_intensity,
+                "hold_sec": emo_hold_sec,
+                "source": emo_source
+            })
 
-        if selection_type == 'appropriate_action' and selected_action:
+        if selection_type == 'appropriate_action' and selected_action and not (reply and reply.action_decided):
             viewer_path = f"assets/animations/{selected_action}"
-            streamer.push("action", {
+            stream.push("action", {
                 "url": viewer_path,
                 "name": selected_action
             })
@@ -627,13 +1036,12 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         if will_absorb and memory_note:
             print(f"--- Memory Absorbed: {memory_note} ---")
             db_manager.log_dialogue(actor_id, "memory", memory_note)
-            streamer.push("thinking", {"note": memory_note})
+            stream.push("thinking", {"note": memory_note})
 
         # --- Memory Heartbeat (Hierarchical Life Story) ---
+        # Only queues work; pages/chapters/books are written by the consolidator thread.
         try:
-            msg_count = db_manager.get_dialogue_count(actor_id)
-            if msg_count > 0:
-                run_memory_heartbeat(actor_id)
+            run_memory_heartbeat(actor_id)
         except Exception as heartbreaker:
             print(f"Memory Heartbeat Error: {heartbreaker}")
 
@@ -641,617 +1049,543 @@ def generate_and_stream(messages, actor_id, requested_model, voice_desc, images=
         raw_kg = reasoning_data.get('kg_entries') or reasoning_data.get('kg_entry')
         if raw_kg:
             kg_list = raw_kg if isinstance(raw_kg, list) else [raw_kg]
-            for kg_entry in kg_list:
-                if not isinstance(kg_entry, dict):
-                    continue
-                
-                subj   = _clean_kg_token(kg_entry.get('subject'))
-                stype  = _clean_kg_token(kg_entry.get('subject_type'), max_len=40)
-                src    = _clean_kg_token(kg_entry.get('source_context'), max_len=64)
-                desc   = _clean_kg_token(kg_entry.get('description'), max_len=240)
-                rel    = _clean_kg_token(kg_entry.get('relation'), max_len=32)
-                obj    = _clean_kg_token(kg_entry.get('object'))
-
-                # Fix: Skip if predicate (relation) is missing or nonsensical
-                if not _is_valid_kg_predicate(rel):
-                    print(f"--- [KG SKIP] Skipping malformed relation: '{rel}' ---")
-                    continue
-
-                # Validate required fields
-                missing = [f for f, v in [('subject', subj), ('subject_type', stype), ('source_context', src)] if not v]
-                if missing:
-                    warn = f"KG entry missing required fields: {', '.join(missing)}"
-                    print(f"--- [KG WARN] {warn} ---")
-                    streamer.push("system_warn", {"text": warn, "entry": kg_entry})
+            try:
+                outcomes = db_manager.kg_apply_entries(actor_id, kg_list)
+            except Exception as ke:
+                outcomes = [{'status': 'error', 'text': f"KG write failed: {ke}", 'entry': None}]
+            for outcome in outcomes:
+                status, text, kg_entry = outcome['status'], outcome['text'], outcome['entry']
+                if status == 'written':
+                    print(f"--- [KG WRITE] {text} ---")
+                    stream.push("kg_write", {"text": text, "entry": kg_entry})
+                elif status == 'skipped':
+                    print(f"--- [KG SKIP] {text} ---")
+                elif status == 'warn':
+                    print(f"--- [KG WARN] {text} ---")
+                    stream.push("system_warn", {"text": text, "entry": kg_entry})
                 else:
-                    if not _is_valid_kg_name(subj):
-                        print(f"--- [KG SKIP] Subject failed quality gate: '{subj}' ---")
-                        continue
-                    if obj and not _is_valid_kg_name(obj):
-                        print(f"--- [KG SKIP] Object failed quality gate: '{obj}' ---")
-                        continue
-
-                    # Validate source context:
-                    # Accept: always-valid builtins, existing DB contexts, OR any new
-                    # well-formed "type:Title" string (allows creating new contexts on the fly).
-                    # Reject: malformed strings with spaces, missing colon, or garbage chars.
-                    import re as _re
-                    always_valid = {'user_dialogue', 'manual', 'observer'}
-                    known_contexts_now = db_manager.kg_get_contexts(actor_id)
-                    _valid_format = bool(_re.match(r'^[a-zA-Z0-9_]+:[a-zA-Z0-9_]+$', src))
-                    _is_valid = src in always_valid or src in known_contexts_now or _valid_format
-
-                    if not _is_valid:
-                        warn = f"Malformed source_context '{src}'. Use format type:Title (e.g. show:Death_Note, audiobook:Dune)"
-                        print(f"--- [KG WARN] {warn} ---")
-                        streamer.push("system_warn", {"text": warn, "entry": kg_entry})
-
-                    else:
-                        try:
-                            sid = db_manager.kg_add_subject(
-                                actor_id, subj, stype,
-                                description=desc or None,
-                                source=src, confidence=0.85
-                            )
-                            if rel and obj:
-                                # Resolve object to an ID so relations link properly in both directions
-                                existing_obj = db_manager.kg_get_subject(actor_id, obj)
-                                if existing_obj:
-                                    oid = existing_obj['subject_id']
-                                else:
-                                    oid = db_manager.kg_add_subject(
-                                        actor_id, obj, "Entity",
-                                        description=None,
-                                        source=src, confidence=0.85
-                                    )
-                                db_manager.kg_add_relation(
-                                    actor_id, sid, rel,
-                                    object_id=oid, object_literal=obj, source=src
-                                )
-                            confirm = f"{subj} [{stype}, ctx: {src}]"
-                            if rel and obj:
-                                confirm += f" → {rel} → {obj}"
-                            print(f"--- [KG WRITE] {confirm} ---")
-                            streamer.push("kg_write", {"text": confirm, "entry": kg_entry})
-                        except Exception as ke:
-                            warn = f"KG write failed: {ke}"
-                            print(f"--- [KG ERROR] {warn} ---")
-                            streamer.push("system_warn", {"text": warn})
+                    print(f"--- [KG ERROR] {text} ---")
+                    stream.push("system_warn", {"text": text})
 
         # C. TTS pipeline — only when speaking
+        # Sentences already handed over during token streaming are not repeated.
         if will_speak and spoken_text.strip():
-            import re
-            raw_paragraphs = re.split(r'\n+', spoken_text)
-            
-            for i, raw_para in enumerate(raw_paragraphs):
-                clean_para = clean_text_for_speech(raw_para)
-                if not clean_para or len(clean_para) < 2:
-                    continue
-                    
-                print(f"--- Processing Chunk {i+1} (Paragraph): {clean_para[:50]}... ---")
-                
-                audio_id = f"stream_{int(time.time())}_{i}"
-                wav_path = os.path.join(TEMP_DIR, f"{audio_id}.wav")
-                voice_ref = db_manager.get_actor_trait(actor_id, "voice_reference_audio", None)
-                
-                try:
-                    tts_engine.generate(clean_para, wav_path, voice_reference_audio=voice_ref)
-                except Exception as e:
-                    warn = f"TTS unavailable for this chunk: {e}"
-                    print(f"TTS Fail: {e}")
-                    # Degrade gracefully: keep chat functional even when voice backend is down.
-                    streamer.push("system_warn", {"text": warn})
-                    streamer.push("assistant_text", {
-                        "text": clean_para,
-                        "stats": {"energy": new_energy}
-                    })
-                    continue
-
-                vis_path = os.path.join(TEMP_DIR, f"{audio_id}_visemes.json")
-                process_audio_for_lipsync(wav_path, vis_path)
-                
-                streamer.push("audio", {
-                    "audioUrl": f"./temp/{audio_id}.wav",
-                    "visemeUrl": f"./temp/{audio_id}_visemes.json",
-                    "text": clean_para,
-                    "stats": {"energy": new_energy}
-                })
+            # Split on the raw text: clean_text_for_speech collapses paragraph breaks.
+            if reply:
+                reply.speak_rest(ai_full_text)
+            else:
+                speech.say(ai_full_text)
+        speech.finish()
 
-        streamer.push("done", {})
+        stream.push("done", {})
         print("--- Stream Complete ---")
         
     except Exception as e:
         print(f"Stream Error: {e}")
-        streamer.push("error", str(e))
-
-class ChatBridgeHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, response_code=200):
-        self.send_response(response_code)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-
-    def do_OPTIONS(self):
-        self._set_headers()
-
-    def do_GET(self):
-        if self.path == '/get_actors':
-            actors = db_manager.get_all_actors()
-            result = {"characters": []}
-            for a in actors:
-                result["characters"].append({
-                    "id": a["actor_id"],
-                    "label": a["manifest_data"].get("label", a["actor_id"]),
-                    "vrm": a["vrm_path"]
-                })
-            self._set_headers()
-            self.wfile.write(json.dumps(result).encode('utf-8'))
-
-        elif self.path == '/get_controls':
-            controls = db_manager.get_ui_controls()
-            tabs_map = {}
-            for c in controls:
-                tid = c["tab_id"]
-                if tid not in tabs_map:
-                    tabs_map[tid] = {"id": tid, "label": tid.capitalize(), "sliders": []}
-                tabs_map[tid]["sliders"].append({
-                    "id": c["control_id"],
-                    "label": c["label"],
-                    "min": c["min"],
-                    "max": c["max"],
-                    "step": c["step"],
-                    "default": c["default"]
-                })
-            self._set_headers()
-            self.wfile.write(json.dumps({"tabs": list(tabs_map.values())}).encode('utf-8'))
-
-        elif self.path.startswith('/get_interests'):
-            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-            aid = (qs.get('actor_id') or [''])[0] or get_default_actor_id()
-            interests = db_manager.get_actor_interests(aid)
-            self._set_headers()
-            self.wfile.write(json.dumps({'interests': interests}).encode('utf-8'))
-
-        elif self.path.startswith('/get_memory_blocks'):
-            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-            aid = (qs.get('actor_id') or [''])[0] or get_default_actor_id()
-            limit = int((qs.get('limit') or ['15'])[0])
-            btype = (qs.get('type') or ['page'])[0]
-            blocks = db_manager.get_memory_blocks(aid, limit=limit, block_type=btype)
-            self._set_headers()
-            self.wfile.write(json.dumps({'blocks': blocks}).encode('utf-8'))
-
-        elif self.path.startswith('/onboarding_status'):
-            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-            aid = (qs.get('actor_id') or [''])[0] or get_default_actor_id()
-            actor = db_manager.get_actor(aid)
-            manifest = (actor or {}).get('manifest_data', {}) or {}
-            persona = str(manifest.get('persona', '') or '').strip()
-            voice = str(manifest.get('voice_description', '') or '').strip()
-            model = str(manifest.get('llm_model', '') or '').strip()
-            dialogue_count = int(db_manager.get_dialogue_count(aid) or 0)
-            animation_count = int(db_manager.get_animation_count() or 0)
-            payload = {
-                "actor_id": aid,
-                "traits_present": bool(persona or voice or model),
-                "dialogue_count": dialogue_count,
-                "has_dialogue": dialogue_count > 0,
-                "animation_count": animation_count,
-                "has_indexed_animations": animation_count > 0,
-            }
-            self._set_headers()
-            self.wfile.write(json.dumps(payload).encode('utf-8'))
-
-        elif self.path.startswith('/preflight'):
-            qs = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-            model = (qs.get('model') or [''])[0].strip()
-            cmd = [sys.executable, str(os.path.join(PROJECT_ROOT, "tools", "bootstrap.py")), "--check", "--json"]
-            if model:
-                cmd.extend(["--model", model])
-            try:
-                proc = subprocess.run(
-                    cmd,
-                    cwd=PROJECT_ROOT,
-                    text=True,
-                    capture_output=True,
-                    timeout=120
-                )
-                out = (proc.stdout or "").strip()
-                err = (proc.stderr or "").strip()
-                data = None
-                for candidate in (out, err):
-                    if not candidate:
-                        continue
-                    try:
-                        data = json.loads(candidate)
-                        break
-                    except Exception:
-                        continue
-                if data is None:
-                    data = {"ok_count": 0, "total": 0, "all_passed": False, "checks": []}
-                data["returncode"] = proc.returncode
-                if err:
-                    data["stderr"] = err
-                self._set_headers(200)
-                self.wfile.write(json.dumps(data).encode('utf-8'))
-            except Exception as e:
-                self._set_headers(500)
-                self.wfile.write(json.dumps({"error": str(e)}).encode('utf-8'))
+        speech.finish()
+        stream.push("error", str(e))
 
-        elif self.path == '/get_models':
-            try:
-                req = urllib.request.Request("http://localhost:11434/api/tags")
-                with urllib.request.urlopen(req) as response:
-                    data = json.loads(response.read().decode('utf-8'))
-                    models = [m['name'] for m in data.get('models', [])]
-                    self._set_headers()
-                    self.wfile.write(json.dumps({"models": models}).encode('utf-8'))
-            except Exception as e:
-                # Fallback if Ollama is not reachable or returns error
-                self._set_headers()
-                self.wfile.write(json.dumps({"models": ["fimbulvetr-v2.1:latest", "mistral", "llama3"]}).encode('utf-8'))
-
-        elif self.path == '/stream_audio':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            print("--- Client Connected to SSE Stream ---")
-            
-            # Keep connection open until client disconnects or we break
-            while True:
-                try:
-                    try:
-                        import queue
-                        msg = streamer.get(timeout=5)
-                    except queue.Empty:
-                        # Send an SSE event instead of a comment, so the frontend onmessage triggers and resets the watchdog
-                        ping_msg = {"type": "ping", "data": "keep-alive"}
-                        event_data = f"data: {json.dumps(ping_msg)}\n\n"
-                        self.wfile.write(event_data.encode('utf-8'))
-                        self.wfile.flush()
-                        continue
-                        
-                    event_data = f"data: {json.dumps(msg)}\n\n"
-                    self.wfile.write(event_data.encode('utf-8'))
-                    self.wfile.flush()
-                    
-                    if msg['type'] == 'done' or msg['type'] == 'error':
-                        break
-                except Exception as e:
-                    print(f"SSE Broken Pipe: {e}")
-                    break
-            print("--- SSE Stream Closed ---")
-
-        elif self.path == '/kg_contexts':
-            # GET /kg_contexts?actor_id=...
-            actor_id_param = urllib.parse.urlparse(self.path)
-            from urllib.parse import parse_qs
-            qs = parse_qs(urllib.parse.urlparse(self.path).query)
-            aid = (qs.get('actor_id') or [''])[0] or get_default_actor_id()
-            contexts = db_manager.kg_get_contexts(aid)
-            self._set_headers()
-            self.wfile.write(json.dumps({'contexts': contexts}).encode('utf-8'))
-
-        elif self.path == '/scan_animations':
-            unindexed = scan_and_clean_animations()
-            self._set_headers()
-            self.wfile.write(json.dumps(unindexed).encode('utf-8'))
-
-        elif self.path == '/get_registry_animations':
-            anims = db_manager.get_all_animations()
-            self._set_headers()
-            self.wfile.write(json.dumps(anims).encode('utf-8'))
-
-        # ---- Persona Editor API ----
-        elif self.path.startswith('/persona/'):
-            actor_id = urllib.parse.unquote(self.path.split('/persona/')[1].split('?')[0])
-            identity = db_manager.get_actor_identity(actor_id)
-            moods = db_manager.get_all_moods(actor_id)
-            modes = db_manager.get_all_mode_prompts(actor_id)
-            current_mood = db_manager.get_current_mood(actor_id)
-            self._set_headers()
-            self.wfile.write(json.dumps({
-                'identity': identity,
-                'moods': moods,
-                'modes': modes,
-                'current_mood': current_mood,
-            }).encode('utf-8'))
-
-        # ---- Knowledge Graph API ----
-        elif self.path.startswith('/kg/'):
-            actor_id = urllib.parse.unquote(self.path.split('/kg/')[1].split('?')[0])
-            subjects = db_manager.kg_get_all_subjects(actor_id)
-            # Enrich each subject with its relations
-            for s in subjects:
-                s['relations'] = db_manager.kg_get_relations(actor_id, s['subject_id'], min_confidence=0.0)
-                s['ancestors'] = db_manager.kg_get_ancestors(s['subject_id'])
-            self._set_headers()
-            self.wfile.write(json.dumps({'subjects': subjects}).encode('utf-8'))
+# --- HTTP API ---
+# Plain handlers run on the server's thread pool (they block on SQLite, TTS,
+# Ollama or subprocesses); the SSE handlers are coroutines on the event loop.
 
-        else:
-            self._set_headers(404)
-            self.wfile.write(b'{"error": "Not Found"}')
+def _request_actor_id(req):
+    return req.arg('actor_id') or get_default_actor_id()
 
 
-    def do_POST(self):
-        if self.path == '/chat':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            user_message = data.get('message', '')
-            actor_id = data.get('actor_id') or get_default_actor_id()
-            
-            # --- REGION 2: Fetch Persistent Traits ---
-            persona = data.get('system')
-            if not persona:
-                persona = db_manager.get_actor_trait(actor_id, "persona", "You are a helpful AI.")
-            
-            voice_desc = db_manager.get_actor_trait(actor_id, "voice_description", "A warm, gentle female voice.")
+async def _sse_events(channel, turn_id, follow=False):
+    if channel is None:
+        yield {"type": "error", "data": f"Unknown or expired turn: {turn_id}"}
+        return
+
+    print(f"--- Client Connected to SSE Stream (turn: {turn_id or 'observer'}) ---")
 
-            print(f"--- Chat Request (Actor: {actor_id}) ---")
-            print(f"User: {user_message}")
+    # Keep the stream open until the client disconnects or the turn ends
+    try:
+        while True:
             try:
-                # --- REGION 1: Reality Update ---
-                db_manager.set_reality("active_actor", actor_id)
-                global _active_actor_id, _last_activity_time
-                _active_actor_id = actor_id
-                _last_activity_time = time.time()
-                
-                # --- REGION 3: Memory Logging (User) ---
-                db_manager.log_dialogue(actor_id, "user", user_message)
-
-                # --- REGION 3: History Retrieval ---
-                history = db_manager.get_recent_history(actor_id, limit=15)
-                
-                # --- START BACKGROUND STREAMING ---
-                requested_model = data.get('model')
-                images = data.get('images', [])
-
-                if not requested_model:
-                    requested_model = db_manager.get_actor_trait(actor_id, "llm_model", "fimbulvetr-v2.1:latest")
-
-                # --- PUSH TO SERIAL QUEUE ---
-                chat_queue.put({
-                    "messages": history,
-                    "actor_id": actor_id,
-                    "model": requested_model,
-                    "voice_desc": voice_desc,
-                    "images": images,
-                    "extra_data": {
-                        "extra_context": data.get('extra_context')
-                    }
-                })
-                
-                # Return success immediately so client can subscribe to SSE
-                self._set_headers()
-                self.wfile.write(json.dumps({"status": "queued"}).encode('utf-8'))
-                
-            except Exception as e:
-                print(f"Chat POST Error: {e}")
-                self.send_response(500)
-                self.end_headers()
-                self.wfile.write(str(e).encode('utf-8'))
-
-        elif self.path == '/reset_memory':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            actor_id = data.get('actor_id') or get_default_actor_id()
-            db_manager.reset_recent_history(actor_id)
-            self._set_headers()
-            self.wfile.write(json.dumps({"status": "success"}).encode('utf-8'))
-
-        elif self.path == '/mind_maintenance':
-            content_length = int(self.headers.get('Content-Length', 0))
-            data = {}
-            if content_length > 0:
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
-
-            actor_id = data.get('actor_id') or get_default_actor_id()
-            apply_mode = bool(data.get('apply', True))
-            mode_flag = '--apply' if apply_mode else '--dry-run'
-
-            script_path = os.path.join(PROJECT_ROOT, 'tools', 'mind_maintenance.py')
-            cmd = [sys.executable, script_path, '--actor', actor_id, mode_flag]
+                msg = await channel.aget(timeout=5)
+            except queue.Empty:
+                # Send an SSE event instead of a comment, so the frontend onmessage triggers and resets the watchdog
+                msg = {"type": "ping", "data": "keep-alive"}
+            yield msg
+
+            if not follow and msg['type'] in ('done', 'error'):
+                break
+    finally:
+        streamer.unsubscribe(channel, turn_id)
+        if channel.dropped:
+            print(f"--- SSE Stream dropped {channel.dropped} events (slow client) ---")
+        print("--- SSE Stream Closed ---")
+
+
+async def handle_stream_audio(req):
+    # GET /stream_audio?turn_id=... (no turn_id follows the latest turn)
+    channel, turn_id = streamer.subscribe_turn(req.arg('turn_id') or None)
+    return EventStream(_sse_events(channel, turn_id))
 
+
+async def handle_stream_events(req):
+    # Observer feed: every event of every turn, until the client disconnects.
+    return EventStream(_sse_events(streamer.subscribe_observer(), None, follow=True))
+
+
+def handle_queue_status(req):
+    return chat_queue.stats()
+
+
+def handle_memory_status(req):
+    # Background consolidation: pending pages/chapters/books per actor, running job, counters.
+    return consolidator.stats()
+
+
+def handle_model_status(req):
+    # Loaded Ollama models, which model each workload uses, load events and deferred background jobs.
+    return residency.stats()
+
+
+def handle_prompt_stats(req):
+    # Latest prefix-reuse report per model (KV cache) and section cache counters, see PromptComposer.
+    return {
+        'prefix_reports': _composer.prefix_reports(),
+        'section_cache': _composer.cache_stats(),
+        'token_budget': list(_token_reports),
+        'subject_index': _subject_index.stats() if _subject_index else None,
+    }
+
+
+def handle_get_actors(req):
+    actors = db_manager.get_all_actors()
+    result = {"characters": []}
+    for a in actors:
+        result["characters"].append({
+            "id": a["actor_id"],
+            "label": a["manifest_data"].get("label", a["actor_id"]),
+            "vrm": a["vrm_path"]
+        })
+    return result
+
+
+def handle_get_controls(req):
+    controls = db_manager.get_ui_controls()
+    tabs_map = {}
+    for c in controls:
+        tid = c["tab_id"]
+        if tid not in tabs_map:
+            tabs_map[tid] = {"id": tid, "label": tid.capitalize(), "sliders": []}
+        tabs_map[tid]["sliders"].append({
+            "id": c["control_id"],
+            "label": c["label"],
+            "min": c["min"],
+            "max": c["max"],
+            "step": c["step"],
+            "default": c["default"]
+        })
+    return {"tabs": list(tabs_map.values())}
+
+
+def handle_get_interests(req):
+    interests = db_manager.get_actor_interests(_request_actor_id(req))
+    return {'interests': interests}
+
+
+def handle_get_memory_blocks(req):
+    aid = _request_actor_id(req)
+    limit = int(req.arg('limit', '15'))
+    btype = req.arg('type', 'page')
+    blocks = db_manager.get_memory_blocks(aid, limit=limit, block_type=btype)
+    return {'blocks': blocks}
+
+
+def handle_onboarding_status(req):
+    aid = _request_actor_id(req)
+    actor = db_manager.get_actor(aid)
+    manifest = (actor or {}).get('manifest_data', {}) or {}
+    persona = str(manifest.get('persona', '') or '').strip()
+    voice = str(manifest.get('voice_description', '') or '').strip()
+    model = str(manifest.get('llm_model', '') or '').strip()
+    dialogue_count = int(db_manager.get_dialogue_count(aid) or 0)
+    animation_count = int(db_manager.get_animation_count() or 0)
+    return {
+        "actor_id": aid,
+        "traits_present": bool(persona or voice or model),
+        "dialogue_count": dialogue_count,
+        "has_dialogue": dialogue_count > 0,
+        "animation_count": animation_count,
+        "has_indexed_animations": animation_count > 0,
+    }
+
+
+def handle_preflight(req):
+    model = req.arg('model').strip()
+    cmd = [sys.executable, str(os.path.join(PROJECT_ROOT, "tools", "bootstrap.py")), "--check", "--json"]
+    if model:
+        cmd.extend(["--model", model])
+    try:
+        proc = subprocess.run(
+            cmd,
+            cwd=PROJECT_ROOT,
+            text=True,
+            capture_output=True,
+            timeout=120
+        )
+        out = (proc.stdout or "").strip()
+        err = (proc.stderr or "").strip()
+        data = None
+        for candidate in (out, err):
+            if not candidate:
+                continue
             try:
-                proc = subprocess.run(
-                    cmd,
-                    cwd=PROJECT_ROOT,
-                    capture_output=True,
-                    text=True,
-                    timeout=120,
-                    check=False,
-                )
-            except Exception as e:
-                self._set_headers(500)
-                self.wfile.write(json.dumps({"error": f"Failed to run maintenance: {str(e)}"}).encode('utf-8'))
-                return
+                data = json.loads(candidate)
+                break
+            except Exception:
+                continue
+        if data is None:
+            data = {"ok_count": 0, "total": 0, "all_passed": False, "checks": []}
+        data["returncode"] = proc.returncode
+        if err:
+            data["stderr"] = err
+        return data
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
 
-            output = (proc.stdout or "").strip()
-            err = (proc.stderr or "").strip()
-            if proc.returncode != 0:
-                self._set_headers(500)
-                self.wfile.write(json.dumps({
-                    "error": "Mind maintenance failed.",
-                    "stdout": output,
-                    "stderr": err,
-                    "returncode": proc.returncode
-                }).encode('utf-8'))
-                return
 
-            summary = {}
-            for line in output.splitlines():
-                line = line.strip()
-                m = re.match(r"^- ([a-z_]+):\s+([0-9]+)$", line)
-                if m:
-                    summary[m.group(1)] = int(m.group(2))
-
-            self._set_headers()
-            self.wfile.write(json.dumps({
-                "status": "success",
-                "actor_id": actor_id,
-                "mode": "apply" if apply_mode else "dry-run",
-                "summary": summary,
-                "stdout": output,
-            }).encode('utf-8'))
-
-        elif self.path == '/update_trait':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            actor_id = data.get('actor_id') or get_default_actor_id()
-            trait = data.get('trait')
-            value = data.get('value')
-            if trait and value:
-                db_manager.update_actor_trait(actor_id, trait, value)
-                self._set_headers()
-                self.wfile.write(json.dumps({"status": "success"}).encode('utf-8'))
-            else:
-                self.send_response(400)
-                self.end_headers()
-
-        elif self.path == '/get_traits':
-            content_length = int(self.headers.get('Content-Length', 0))
-            actor_id = get_default_actor_id()
-            if content_length > 0:
-                post_data = self.rfile.read(content_length)
-                data = json.loads(post_data.decode('utf-8'))
-                actor_id = data.get('actor_id') or get_default_actor_id()
-            actor = db_manager.get_actor(actor_id)
-            traits = actor['manifest_data'] if actor else {}
-            self._set_headers()
-            self.wfile.write(json.dumps(traits).encode('utf-8'))
-
-        elif self.path == '/get_models': # Legacy POST support
-            self.do_GET()
-
-        elif self.path == '/get_actors': # Legacy POST support
-            self.do_GET()
-
-        elif self.path == '/get_controls': # Legacy POST support
-            self.do_GET()
-
-        elif self.path == '/index_animation':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            # extract fields
-            filename = data.get('filename')
-            category = data.get('category')
-            trigger = data.get('trigger', '')
-            purpose = data.get('purpose', '')
-            effect = data.get('effect', '')
-            
-            if filename and category and trigger and purpose:
-                db_manager.register_animation(filename, category, trigger, purpose, effect)
-                self._set_headers()
-                self.wfile.write(json.dumps({"status": "success"}).encode('utf-8'))
-            else:
-                self.send_response(400)
-                self.end_headers()
-                self.wfile.write(b"Missing required fields")
-
-        elif self.path == '/get_animation_metadata':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            filename = data.get('filename')
-            
-            if filename:
-                meta = db_manager.get_animation_by_path(filename)
-                if meta:
-                    self._set_headers()
-                    self.wfile.write(json.dumps(meta).encode('utf-8'))
-                else:
-                    self.send_response(404)
-                    self.end_headers()
-                    self.wfile.write(b"Animation not found in registry")
-            else:
-                self.send_response(400)
-                self.end_headers()
+def handle_get_models(req):
+    try:
+        return {"models": ollama.list_models()}
+    except Exception as e:
+        # Fallback if Ollama is not reachable or returns error
+        return {"models": ["fimbulvetr-v2.1:latest", "mistral", "llama3"]}
 
-        # ---- Persona Editor Save Endpoints ----
 
-        elif self.path == '/save_identity':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            db_manager.set_actor_identity(
-                d['actor_id'], d['name'],
-                d.get('core_traits',''), d.get('speech_style',''), d.get('values','')
-            )
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok'}).encode())
-
-        elif self.path == '/save_mood':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            db_manager.set_mood(
-                d['actor_id'], d['mood_id'], d['display_name'], d['behavioral_text'],
-                d.get('transition_up'), d.get('transition_down')
-            )
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok'}).encode())
-
-        elif self.path == '/set_mood':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            db_manager.set_current_mood(d['actor_id'], d['mood_id'])
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok'}).encode())
-
-        elif self.path == '/save_mode':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            db_manager.set_mode_prompt(
-                d['actor_id'], d['mode_id'], d['display_name'],
-                d['system_text'], d.get('trigger_prefix')
-            )
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok'}).encode())
-
-        # ---- Knowledge Graph Save Endpoints ----
-
-        elif self.path == '/kg_save_subject':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            import json as _json
-            aliases = d.get('aliases', [])
-            if isinstance(aliases, str):
-                aliases = [a.strip() for a in aliases.split(',') if a.strip()]
-            sid = db_manager.kg_add_subject(
-                d['actor_id'], d['canonical_name'], d['subject_type'],
-                d.get('description'), aliases, float(d.get('confidence', 1.0)),
-                d.get('source', 'manual')
-            )
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok', 'subject_id': sid}).encode())
-
-        elif self.path == '/kg_save_relation':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            db_manager.kg_add_relation(
-                d['actor_id'], int(d['subject_id']), d['predicate'],
-                int(d['object_id']) if d.get('object_id') else None,
-                d.get('object_literal'), float(d.get('confidence', 1.0)),
-                d.get('source', 'manual')
-            )
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok'}).encode())
-
-        elif self.path == '/kg_delete_subject':
-            d = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
-            conn = db_manager.get_connection()
-            c = conn.cursor()
-            sid = int(d['subject_id'])
-            c.execute('DELETE FROM kg_relations WHERE subject_id=? OR object_id=?', (sid, sid))
-            c.execute('DELETE FROM kg_hierarchy WHERE child_id=? OR parent_id=?', (sid, sid))
-            c.execute('DELETE FROM kg_subjects WHERE subject_id=?', (sid,))
-            conn.commit(); conn.close()
-            self._set_headers()
-            self.wfile.write(json.dumps({'status': 'ok'}).encode())
+def handle_kg_contexts(req):
+    # GET /kg_contexts?actor_id=...
+    contexts = db_manager.kg_get_contexts(_request_actor_id(req))
+    return {'contexts': contexts}
+
+
+def handle_scan_animations(req):
+    return scan_and_clean_animations()
+
+
+def handle_get_registry_animations(req):
+    return db_manager.get_all_animations()
+
+
+# ---- Persona Editor API ----
+
+def handle_persona(req):
+    # GET /persona/<actor_id>
+    actor_id = urllib.parse.unquote(req.tail)
+    return {
+        'identity': db_manager.get_actor_identity(actor_id),
+        'moods': db_manager.get_all_moods(actor_id),
+        'modes': db_manager.get_all_mode_prompts(actor_id),
+        'current_mood': db_manager.get_current_mood(actor_id),
+    }
+
+
+# ---- Knowledge Graph API ----
+
+def handle_kg_graph(req):
+    # GET /kg/<actor_id>[?limit=N&cursor=...&fields=a,b,...]
+    # The ETag is the actor's KG revision plus the query, so unchanged polls get a 304.
+    actor_id = urllib.parse.unquote(req.tail)
+    variant = zlib.crc32(json.dumps(sorted(req.query.items())).encode('utf-8'))
+    etag = f'"kg-{db_manager.kg_get_revision(actor_id)}-{variant:08x}"'
+    if etag in _etag_candidates(req.headers.get('if-none-match', '')):
+        return Response(status=304, headers={'ETag': etag})
+    try:
+        limit = int(req.arg('limit', 0)) or None
+    except ValueError:
+        raise HTTPError(400, "limit must be an integer")
+    fields = [f.strip() for f in req.arg('fields').split(',') if f.strip()] or None
+    try:
+        graph = db_manager.kg_get_graph(actor_id, limit=limit, cursor_token=req.arg('cursor') or None,
+                                        fields=fields)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    # Tag with the revision the payload was actually read at.
+    etag = f'"kg-{graph["revision"]}-{variant:08x}"'
+    return json_response(graph, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+
+def _etag_candidates(header):
+    tags = (tag.strip() for tag in header.split(','))
+    return {tag[2:] if tag.startswith('W/') else tag for tag in tags if tag}
+
+
+def handle_chat(req):
+    data = req.json()
+
+    user_message = data.get('message', '')
+    actor_id = data.get('actor_id') or get_default_actor_id()
+
+    # --- REGION 2: Fetch Persistent Traits ---
+    traits = db_manager.get_actor_traits(actor_id, {
+        "persona": "You are a helpful AI.",
+        "voice_description": "A warm, gentle female voice.",
+        "llm_model": "fimbulvetr-v2.1:latest",
+    })
+    persona = data.get('system') or traits["persona"]
+    voice_desc = traits["voice_description"]
+
+    print(f"--- Chat Request (Actor: {actor_id}) ---")
+    print(f"User: {user_message}")
+    try:
+        # --- REGION 1: Reality Update ---
+        db_manager.set_reality("active_actor", actor_id)
+        global _active_actor_id, _last_activity_time
+        _active_actor_id = actor_id
+        _last_activity_time = time.time()
+
+        priority = classify_priority(user_message)
+        history = None
+        if priority != PRIORITY_PULSE:
+            # --- REGION 3: Memory Logging (User) ---
+            db_manager.log_dialogue(actor_id, "user", user_message)
+
+            # --- REGION 3: History Retrieval ---
+            history = db_manager.get_recent_history(actor_id, limit=15)
+
+        # --- START BACKGROUND STREAMING ---
+        requested_model = data.get('model')
+        images = data.get('images', [])
+
+        if not requested_model:
+            requested_model = traits["llm_model"]
+
+        # --- PUSH TO SERIAL QUEUE ---
+        # Each turn gets its own SSE channel; the client subscribes with this id.
+        turn_id = uuid.uuid4().hex
+        streamer.open_turn(turn_id)
+        chat_queue.put({
+            "turn_id": turn_id,
+            "priority": priority,
+            "message": user_message,
+            "messages": history,
+            "actor_id": actor_id,
+            "model": requested_model,
+            "voice_desc": voice_desc,
+            "images": images,
+            "extra_data": {
+                "extra_context": data.get('extra_context')
+            }
+        })
+
+        # Return success immediately so client can subscribe to SSE
+        return {"status": "queued", "turn_id": turn_id}
+
+    except Exception as e:
+        print(f"Chat POST Error: {e}")
+        return Response(str(e), status=500, content_type='text/plain')
+
+
+def handle_reset_memory(req):
+    data = req.json()
+    actor_id = data.get('actor_id') or get_default_actor_id()
+    consolidator.forget(actor_id)
+    db_manager.reset_recent_history(actor_id)
+    return {"status": "success"}
+
+
+def handle_mind_maintenance(req):
+    data = req.json()
+
+    actor_id = data.get('actor_id') or get_default_actor_id()
+    apply_mode = bool(data.get('apply', True))
+    mode_flag = '--apply' if apply_mode else '--dry-run'
+
+    script_path = os.path.join(PROJECT_ROOT, 'tools', 'mind_maintenance.py')
+    cmd = [sys.executable, script_path, '--actor', actor_id, mode_flag]
+
+    try:
+        proc = subprocess.run(
+            cmd,
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            timeout=120,
+            check=False,
+        )
+    except Exception as e:
+        return json_response({"error": f"Failed to run maintenance: {str(e)}"}, 500)
+
+    output = (proc.stdout or "").strip()
+    err = (proc.stderr or "").strip()
+    if proc.returncode != 0:
+        return json_response({
+            "error": "Mind maintenance failed.",
+            "stdout": output,
+            "stderr": err,
+            "returncode": proc.returncode
+        }, 500)
+
+    summary = {}
+    for line in output.splitlines():
+        line = line.strip()
+        m = re.match(r"^- ([a-z_]+):\s+([0-9]+)$", line)
+        if m:
+            summary[m.group(1)] = int(m.group(2))
+    # The script edits the KG from its own process, so no change notification reached us.
+    if apply_mode and _subject_index:
+        _subject_index.request_sync(actor_id)
+
+    return {
+        "status": "success",
+        "actor_id": actor_id,
+        "mode": "apply" if apply_mode else "dry-run",
+        "summary": summary,
+        "stdout": output,
+    }
+
+
+def handle_update_trait(req):
+    data = req.json()
+    actor_id = data.get('actor_id') or get_default_actor_id()
+    trait = data.get('trait')
+    value = data.get('value')
+    if not (trait and value):
+        raise HTTPError(400, "Missing trait or value")
+    db_manager.update_actor_trait(actor_id, trait, value)
+    return {"status": "success"}
+
+
+def handle_get_traits(req):
+    data = req.json()
+    actor_id = data.get('actor_id') or get_default_actor_id()
+    actor = db_manager.get_actor(actor_id)
+    return actor['manifest_data'] if actor else {}
+
+
+def handle_index_animation(req):
+    data = req.json()
+
+    # extract fields
+    filename = data.get('filename')
+    category = data.get('category')
+    trigger = data.get('trigger', '')
+    purpose = data.get('purpose', '')
+    effect = data.get('effect', '')
+
+    if not (filename and category and trigger and purpose):
+        raise HTTPError(400, "Missing required fields")
+    db_manager.register_animation(filename, category, trigger, purpose, effect)
+    return {"status": "success"}
+
+
+def handle_get_animation_metadata(req):
+    filename = req.json().get('filename')
+    if not filename:
+        raise HTTPError(400, "Missing filename")
+    meta = db_manager.get_animation_by_path(filename)
+    if not meta:
+        raise HTTPError(404, "Animation not found in registry")
+    return meta
+
+
+# ---- Persona Editor Save Endpoints ----
+
+def handle_save_identity(req):
+    d = req.json()
+    db_manager.set_actor_identity(
+        d['actor_id'], d['name'],
+        d.get('core_traits',''), d.get('speech_style',''), d.get('values','')
+    )
+    return {'status': 'ok'}
+
+
+def handle_save_mood(req):
+    d = req.json()
+    db_manager.set_mood(
+        d['actor_id'], d['mood_id'], d['display_name'], d['behavioral_text'],
+        d.get('transition_up'), d.get('transition_down')
+    )
+    return {'status': 'ok'}
+
+
+def handle_set_mood(req):
+    d = req.json()
+    db_manager.set_current_mood(d['actor_id'], d['mood_id'])
+    return {'status': 'ok'}
+
+
+def handle_save_mode(req):
+    d = req.json()
+    db_manager.set_mode_prompt(
+        d['actor_id'], d['mode_id'], d['display_name'],
+        d['system_text'], d.get('trigger_prefix')
+    )
+    return {'status': 'ok'}
+
+
+# ---- Knowledge Graph Save Endpoints ----
+
+def handle_kg_save_subject(req):
+    d = req.json()
+    aliases = d.get('aliases', [])
+    if isinstance(aliases, str):
+        aliases = [a.strip() for a in aliases.split(',') if a.strip()]
+    sid = db_manager.kg_add_subject(
+        d['actor_id'], d['canonical_name'], d['subject_type'],
+        d.get('description'), aliases, float(d.get('confidence', 1.0)),
+        d.get('source', 'manual')
+    )
+    return {'status': 'ok', 'subject_id': sid}
+
+
+def handle_kg_save_relation(req):
+    d = req.json()
+    db_manager.kg_add_relation(
+        d['actor_id'], int(d['subject_id']), d['predicate'],
+        int(d['object_id']) if d.get('object_id') else None,
+        d.get('object_literal'), float(d.get('confidence', 1.0)),
+        d.get('source', 'manual')
+    )
+    return {'status': 'ok'}
+
+
+def handle_kg_delete_subject(req):
+    d = req.json()
+    db_manager.kg_delete_subject(int(d['subject_id']))
+    return {'status': 'ok'}
+
+
+# First match wins; prefix routes go last. POST on the GET lookups is legacy support.
+ROUTES = [
+    Route('GET', '/stream_audio', handle_stream_audio),
+    Route('GET', '/stream_events', handle_stream_events),
+    Route('GET', '/queue_status', handle_queue_status),
+    Route('GET', '/memory_status', handle_memory_status),
+    Route('GET', '/prompt_stats', handle_prompt_stats),
+    Route('GET', '/model_status', handle_model_status),
+    Route(('GET', 'POST'), '/get_actors', handle_get_actors),
+    Route(('GET', 'POST'), '/get_controls', handle_get_controls),
+    Route(('GET', 'POST'), '/get_models', handle_get_models),
+    Route('GET', '/get_interests', handle_get_interests),
+    Route('GET', '/get_memory_blocks', handle_get_memory_blocks),
+    Route('GET', '/onboarding_status', handle_onboarding_status),
+    Route('GET', '/preflight', handle_preflight),
+    Route('GET', '/kg_contexts', handle_kg_contexts),
+    Route('GET', '/scan_animations', handle_scan_animations),
+    Route('GET', '/get_registry_animations', handle_get_registry_animations),
+    Route('POST', '/chat', handle_chat),
+    Route('POST', '/reset_memory', handle_reset_memory),
+    Route('POST', '/mind_maintenance', handle_mind_maintenance),
+    Route('POST', '/update_trait', handle_update_trait),
+    Route('POST', '/get_traits', handle_get_traits),
+    Route('POST', '/index_animation', handle_index_animation),
+    Route('POST', '/get_animation_metadata', handle_get_animation_metadata),
+    Route('POST', '/save_identity', handle_save_identity),
+    Route('POST', '/save_mood', handle_save_mood),
+    Route('POST', '/set_mood', handle_set_mood),
+    Route('POST', '/save_mode', handle_save_mode),
+    Route('POST', '/kg_save_subject', handle_kg_save_subject),
+    Route('POST', '/kg_save_relation', handle_kg_save_relation),
+    Route('POST', '/kg_delete_subject', handle_kg_delete_subject),
+    Route('GET', '/persona/', handle_persona, prefix=True),
+    Route('GET', '/kg/', handle_kg_graph, prefix=True),
+]
 
 
 def cleanup_temp():
@@ -1351,10 +1685,22 @@ def scan_and_clean_animations():
 def run_server(port=8001):
     db_manager.init_db() # Ensure tables exist
     cleanup_temp() # Clean up on startup
-    server_address = ('', port)
-    httpd = ThreadingHTTPServer(server_address, ChatBridgeHandler)
-    # Start Chat Worker Thread
-    threading.Thread(target=chat_worker, daemon=True).start()
+    httpd = AsyncHTTPServer(ROUTES, port=port)
+    # Start Chat Worker Threads (one per concurrent turn)
+    for _ in range(CHAT_CONCURRENCY):
+        threading.Thread(target=chat_worker, daemon=True).start()
+    # Start the memory consolidator and catch up on pages left over from the last run
+    consolidator.start()
+    for actor in db_manager.get_all_actors():
+        try:
+            run_memory_heartbeat(actor['actor_id'])
+        except Exception as e:
+            print(f"Memory Heartbeat Error: {e}")
+    # Embed KG subjects in the background (only new or edited ones are re-embedded)
+    if _subject_index:
+        _subject_index.start()
+        for actor in db_manager.get_all_actors():
+            _subject_index.request_sync(actor['actor_id'])
     # Start Idle Monitor Thread
     threading.Thread(target=idle_monitor, daemon=True).start()
     
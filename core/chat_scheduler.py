@@ -0,0 +1,220 @@
+"""
+ChatScheduler — multi-lane replacement for the single serial chat queue.
+
+Requests are queued into one lane per actor. Each lane runs at most one turn
+at a time (an actor's history, heartbeat and KG writes stay strictly ordered),
+while different actors run concurrently up to a global limit. When several
+lanes are ready, the highest priority class wins, then the oldest request:
+
+  0. user   — direct user dialogue
+  1. npc    — [NPC_...] messages
+  2. pulse  — [OBSERVER_PULSE] / [AUDIOBOOK_PULSE] / [IDLE_PULSE] background traffic
+
+Pulse-class requests are background traffic, so only the newest one matters:
+a new pulse is merged into a pulse still waiting in the same lane (latest
+wins, via the `merge_pulse` callback), and pulses that have waited longer than
+`pulse_max_age` seconds are discarded instead of run. Both outcomes are
+reported through `on_discard` and counted.
+
+stats() reports per-lane and per-class depth, in-flight turns, wait times and
+the merged/dropped pulse counters. interactive_load() lets background workers
+(memory consolidation) yield while user/NPC turns are waiting or running.
+"""
+
+import threading
+import time
+from collections import deque
+
+PRIORITY_USER = 0
+PRIORITY_NPC = 1
+PRIORITY_PULSE = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_USER: 'user',
+    PRIORITY_NPC: 'npc',
+    PRIORITY_PULSE: 'pulse',
+}
+
+_PULSE_PREFIXES = ('[OBSERVER_PULSE]', '[AUDIOBOOK_PULSE]', '[IDLE_PULSE]')
+
+
+def classify_priority(message: str) -> int:
+    """Map a trigger message to its priority class."""
+    message = message or ''
+    if message.startswith(_PULSE_PREFIXES):
+        return PRIORITY_PULSE
+    if message.startswith('[NPC_'):
+        return PRIORITY_NPC
+    return PRIORITY_USER
+
+
+class ChatScheduler:
+
+    def __init__(self, max_concurrency=1, wait_window=50, pulse_max_age=None,
+                 merge_pulse=None, on_discard=None):
+        """
+        Args:
+            max_concurrency: Turns allowed in flight across all lanes.
+            wait_window:     Number of recent queue waits kept for stats.
+            pulse_max_age:   Seconds a pulse may wait before it is dropped (None = forever).
+            merge_pulse:     fn(older_req, newer_req) -> merged req, or None if they must not merge.
+            on_discard:      fn(req, reason) for merged/expired requests. May run under the
+                             scheduler lock, so it must not call back into the scheduler.
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.pulse_max_age = pulse_max_age
+        self.merge_pulse = merge_pulse
+        self.on_discard = on_discard
+        self.pulses_merged = 0
+        self.pulses_dropped = 0
+        self._cond = threading.Condition()
+        self._lanes = {}            # actor_id -> deque of pending jobs
+        self._busy = {}             # actor_id -> priority of its turn in flight
+        self._seq = 0
+        self._closed = False
+        self._recent_waits = deque(maxlen=wait_window)
+        self._completed = 0
+
+    # ---- producer side -------------------------------------------------
+
+    def put(self, req_data, priority=None):
+        """Queue a chat request. `priority` defaults to req_data['priority'] or user."""
+        if priority is None:
+            priority = req_data.get('priority', PRIORITY_USER)
+        discarded = None
+        with self._cond:
+            self._seq += 1
+            job = {
+                'actor_id': req_data.get('actor_id'),
+                'priority': int(priority),
+                'seq': self._seq,
+                'enqueued_at': time.time(),
+                'req': req_data,
+            }
+            lane = self._lanes.setdefault(job['actor_id'], deque())
+            pending = None
+            if job['priority'] == PRIORITY_PULSE and self.merge_pulse:
+                pending = next((j for j in reversed(lane) if j['priority'] == PRIORITY_PULSE), None)
+            merged = self.merge_pulse(pending['req'], req_data) if pending else None
+            if merged is not None:
+                # Latest wins: the waiting pulse takes the merged payload and the new
+                # timestamp, but keeps its place in the lane.
+                discarded = pending['req']
+                pending['req'] = merged
+                pending['enqueued_at'] = job['enqueued_at']
+                pending['merged'] = pending.get('merged', 0) + 1
+                self.pulses_merged += 1
+                job = pending
+            else:
+                lane.append(job)
+            self._cond.notify_all()
+        if discarded is not None and self.on_discard:
+            self.on_discard(discarded, 'merged')
+        return job
+
+    def close(self):
+        """Wake all workers; next_job() returns None once closed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # ---- consumer side -------------------------------------------------
+
+    def next_job(self):
+        """Block until a job from an idle lane may run, then claim its lane."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                self._expire_pulses_locked()
+                job = self._pick_locked()
+                if job is not None:
+                    self._lanes[job['actor_id']].popleft()
+                    self._busy[job['actor_id']] = job['priority']
+                    job['started_at'] = time.time()
+                    self._recent_waits.append(job['started_at'] - job['enqueued_at'])
+                    return job
+                self._cond.wait(timeout=self.pulse_max_age)
+
+    def task_done(self, job):
+        """Release the job's lane so its next request (or another lane) can run."""
+        with self._cond:
+            self._busy.pop(job['actor_id'], None)
+            lane = self._lanes.get(job['actor_id'])
+            if lane is not None and not lane:
+                del self._lanes[job['actor_id']]
+            self._completed += 1
+            self._cond.notify_all()
+
+    def interactive_load(self):
+        """User/NPC turns queued or in flight; background work yields while this is non-zero."""
+        with self._cond:
+            running = sum(1 for p in self._busy.values() if p < PRIORITY_PULSE)
+            queued = sum(1 for lane in self._lanes.values() for j in lane if j['priority'] < PRIORITY_PULSE)
+            return running + queued
+
+    def _expire_pulses_locked(self):
+        if not self.pulse_max_age:
+            return
+        cutoff = time.time() - self.pulse_max_age
+        for lane in self._lanes.values():
+            stale = [j for j in lane if j['priority'] == PRIORITY_PULSE and j['enqueued_at'] < cutoff]
+            for job in stale:
+                lane.remove(job)
+                self.pulses_dropped += 1
+                if self.on_discard:
+                    self.on_discard(job['req'], 'expired')
+
+    def _pick_locked(self):
+        if len(self._busy) >= self.max_concurrency:
+            return None
+        best = None
+        for actor_id, lane in self._lanes.items():
+            if not lane or actor_id in self._busy:
+                continue
+            # A lane is ordered FIFO, but its most urgent request sets its rank.
+            head = min(lane, key=lambda j: (j['priority'], j['seq']))
+            if best is None or (head['priority'], head['seq']) < (best['priority'], best['seq']):
+                best = head
+        if best is None:
+            return None
+        lane = self._lanes[best['actor_id']]
+        if lane[0] is not best:
+            # Let an urgent request overtake older background work in the same lane.
+            lane.remove(best)
+            lane.appendleft(best)
+        return best
+
+    # ---- introspection -------------------------------------------------
+
+    def stats(self):
+        now = time.time()
+        with self._cond:
+            lanes = {}
+            by_class = {name: 0 for name in PRIORITY_NAMES.values()}
+            oldest_wait = 0.0
+            for actor_id, lane in self._lanes.items():
+                lanes[actor_id] = {
+                    'depth': len(lane),
+                    'busy': actor_id in self._busy,
+                    'oldest_wait_sec': round(now - lane[0]['enqueued_at'], 3) if lane else 0.0,
+                }
+                for job in lane:
+                    by_class[PRIORITY_NAMES.get(job['priority'], str(job['priority']))] += 1
+                    oldest_wait = max(oldest_wait, now - job['enqueued_at'])
+            for actor_id in self._busy:
+                lanes.setdefault(actor_id, {'depth': 0, 'busy': True, 'oldest_wait_sec': 0.0})
+            waits = list(self._recent_waits)
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': len(self._busy),
+                'queued': sum(len(l) for l in self._lanes.values()),
+                'queued_by_class': by_class,
+                'oldest_wait_sec': round(oldest_wait, 3),
+                'avg_wait_sec': round(sum(waits) / len(waits), 3) if waits else 0.0,
+                'max_wait_sec': round(max(waits), 3) if waits else 0.0,
+                'completed': self._completed,
+                'pulses_merged': self.pulses_merged,
+                'pulses_dropped': self.pulses_dropped,
+                'lanes': lanes,
+            }
@@ -1,260 +1,722 @@
 import sqlite3
 import json
 import os
+import re
+import threading
+import time
+import zlib
+import copy
+import sys
+from array import array
+from contextlib import contextmanager
 from datetime import datetime
 
 # Path relative to project root or absolute
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(PROJECT_ROOT, "core/persistence.db")
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    """Builds the Three Regions foundational schema."""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    print(f"Initializing SQL Authority at {DB_PATH}...")
-
-    # --- Region 2: Artifacts (Existence) ---
-    
-    # Character Registry
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registry_actors (
-            actor_id TEXT PRIMARY KEY,
-            vrm_path TEXT NOT NULL,
-            manifest_data TEXT, -- Full JSON for deep traits
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # UI Controls Registry
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registry_ui_controls (
-            control_id TEXT PRIMARY KEY,
-            tab_id TEXT NOT NULL,
-            label TEXT,
-            min REAL,
-            max REAL,
-            step REAL,
-            "default" REAL,
-            sort_order INTEGER
-        )
-    ''')
-
-    # Workflow Registry
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registry_workflows (
-            workflow_id TEXT PRIMARY KEY,
-            path TEXT NOT NULL,
-            node_mappings TEXT -- JSON mapping labels to node IDs
-        )
-    ''')
-
-    # Animation Registry (Actions & Metadata)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registry_animations (
-            anim_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT UNIQUE NOT NULL,
-            category TEXT NOT NULL,
-            trigger_condition TEXT,
-            action_purpose TEXT,
-            action_effect TEXT,
-            indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+# --- Connection management ---
+# Each thread keeps one connection for its lifetime (sqlite3 connections can't
+# be shared across threads) instead of opening one per query. WAL lets readers
+# run while a writer commits; synchronous=NORMAL is durable in WAL except for
+# the last transactions on power loss.
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16 * 1024
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
 
-    # --- Region 1: Reality (Truth Right Now) ---
-    
-    # Global System State
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reality_state (
-            key TEXT PRIMARY KEY,
-            value TEXT,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+_local = threading.local()
 
-    # Live Performance State (Sliders/Weights)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reality_performance (
-            actor_id TEXT,
-            param_id TEXT,
-            value REAL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (actor_id, param_id)
-        )
-    ''')
+def _configure(conn):
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')   # persistent; a no-op once the file is in WAL
+    except sqlite3.OperationalError as e:
+        print(f"WAL not enabled ({e}); continuing with the current journal mode.")
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE_BYTES}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    # Used by the memory_dialogue_all view to read archived (compressed) dialogue.
+    conn.create_function('dialogue_text', 1, _dialogue_text, deterministic=True)
+    # Name lookup key for kg_aliases; the triggers that fill it call this too.
+    conn.create_function('norm_name', 1, _norm_name, deterministic=True)
+    _create_connection_triggers(conn)
+    return conn
 
-    # Live Actor Stats (Energy/Stamina)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reality_actor_stats (
-            actor_id TEXT PRIMARY KEY,
-            stamina REAL DEFAULT 1.0,
-            energy REAL DEFAULT 1.0,
-            mood TEXT DEFAULT 'Neutral',
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def _dialogue_text(blob):
+    return zlib.decompress(blob).decode('utf-8') if blob is not None else None
 
-    # --- Region 3: Memory (Past Artifacts) ---
-    
-    # Dialogue History
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS memory_dialogue (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            actor_id TEXT,
-            role TEXT, -- 'user' or 'assistant'
-            content TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def _norm_name(text):
+    """Trimmed, case-folded name. SQLite's lower() and NOCASE only fold ASCII."""
+    return text.strip().casefold() if isinstance(text, str) else text
 
-    # Stat Logs (Heartbeats)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS memory_stats_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            actor_id TEXT,
-            stamina REAL,
-            energy REAL,
-            mood TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def get_connection():
+    """A new, caller-owned connection with the standard PRAGMAs. Prefer transaction()."""
+    return _configure(sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000))
+
+def _thread_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        # Autocommit mode: transaction() issues BEGIN/COMMIT itself.
+        conn = _configure(sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None))
+        _local.conn, _local.path, _local.depth, _local.readonly = conn, DB_PATH, 0, False
+    return conn
 
-    # Memory Blocks (Condensed Concepts)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS memory_blocks (
-            block_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            actor_id TEXT,
-            block_type TEXT DEFAULT 'page', -- 'page'|'chapter'|'book'
-            content TEXT, -- Human/LLM-readable summary
-            concepts TEXT, -- JSON list of extracted tags/ideas
-            source_range TEXT, -- e.g. "msg_id_start:msg_id_end"
-            start_time TIMESTAMP,
-            end_time TIMESTAMP,
-            parent_block_id INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+@contextmanager
+def transaction(readonly=False):
+    """
+    Run a block as one transaction on this thread's connection; yields a cursor.
+    Commits on success, rolls back on error. Nested calls join the outer
+    transaction. Writers take the write lock up front (BEGIN IMMEDIATE) so they
+    wait out busy_timeout instead of failing halfway through; a write nested in
+    a read-only transaction would have to upgrade its lock mid-way (and can hit
+    SQLITE_BUSY there), so it raises sqlite3.ProgrammingError instead.
+    """
+    conn = _thread_connection()
+    if _local.depth:
+        if not readonly and _local.readonly:
+            raise sqlite3.ProgrammingError("write transaction nested inside a read-only transaction")
+        _local.depth += 1
+        try:
+            yield conn.cursor()
+        finally:
+            _local.depth -= 1
+        return
+    conn.execute('BEGIN' if readonly else 'BEGIN IMMEDIATE')
+    _local.depth, _local.readonly = 1, readonly
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+    finally:
+        _local.depth = 0
+
+# --- Change notifications ---
+# In-process caches (e.g. PromptComposer's section cache) register here and are
+# told after a write changes data they hold. Topics: 'identity', 'interests',
+# 'mood', 'mode', 'animations', 'kg' (subjects added, changed or deleted).
+_change_listeners = []
+
+def add_change_listener(fn):
+    """Register fn(topic, actor_id) to run after cache-relevant writes."""
+    _change_listeners.append(fn)
+
+def _notify_change(topic, actor_id=None):
+    for fn in list(_change_listeners):
+        try:
+            fn(topic, actor_id)
+        except Exception as e:
+            print(f"Change listener error ({topic}): {e}")
+
+def _fts5_available(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+_FTS_DIALOGUE_ROW = "{row}.id, {row}.content, {row}.actor_id, {row}.role, {row}.timestamp"
+_FTS_BLOCK_ROW = "{row}.block_id, {row}.content, {row}.concepts, {row}.actor_id, {row}.block_type, {row}.timestamp"
+_FTS_DIALOGUE_COLS = "rowid, content, actor_id, role, timestamp"
+_FTS_BLOCK_COLS = "rowid, content, concepts, actor_id, block_type, timestamp"
+
+_FTS_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_memory_dialogue_fts_insert AFTER INSERT ON memory_dialogue BEGIN
+        INSERT INTO memory_dialogue_fts ({_FTS_DIALOGUE_COLS}) VALUES ({_FTS_DIALOGUE_ROW.format(row='NEW')});
+    END''',
+    # A row moved to the archive (archive_dialogue inserts there first) stays indexed.
+    f'''CREATE TRIGGER IF NOT EXISTS trg_memory_dialogue_fts_delete AFTER DELETE ON memory_dialogue
+    WHEN NOT EXISTS (SELECT 1 FROM memory_dialogue_archive WHERE id = OLD.id) BEGIN
+        INSERT INTO memory_dialogue_fts (memory_dialogue_fts, {_FTS_DIALOGUE_COLS})
+        VALUES ('delete', {_FTS_DIALOGUE_ROW.format(row='OLD')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_memory_dialogue_fts_update AFTER UPDATE ON memory_dialogue BEGIN
+        INSERT INTO memory_dialogue_fts (memory_dialogue_fts, {_FTS_DIALOGUE_COLS})
+        VALUES ('delete', {_FTS_DIALOGUE_ROW.format(row='OLD')});
+        INSERT INTO memory_dialogue_fts ({_FTS_DIALOGUE_COLS}) VALUES ({_FTS_DIALOGUE_ROW.format(row='NEW')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_memory_blocks_fts_insert AFTER INSERT ON memory_blocks BEGIN
+        INSERT INTO memory_blocks_fts ({_FTS_BLOCK_COLS}) VALUES ({_FTS_BLOCK_ROW.format(row='NEW')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_memory_blocks_fts_delete AFTER DELETE ON memory_blocks BEGIN
+        INSERT INTO memory_blocks_fts (memory_blocks_fts, {_FTS_BLOCK_COLS})
+        VALUES ('delete', {_FTS_BLOCK_ROW.format(row='OLD')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_memory_blocks_fts_update AFTER UPDATE ON memory_blocks BEGIN
+        INSERT INTO memory_blocks_fts (memory_blocks_fts, {_FTS_BLOCK_COLS})
+        VALUES ('delete', {_FTS_BLOCK_ROW.format(row='OLD')});
+        INSERT INTO memory_blocks_fts ({_FTS_BLOCK_COLS}) VALUES ({_FTS_BLOCK_ROW.format(row='NEW')});
+    END''',
+]
+
+# Un-indexes deleted archive rows. Their text is only readable through
+# dialogue_text(), which plain sqlite3 connections lack, so this is a TEMP
+# trigger that _configure creates on db_manager's own connections: a delete
+# from any other connection succeeds and leaves the index stale (rebuild_fts()).
+_FTS_ARCHIVE_DELETE_TRIGGER = f'''
+    CREATE TEMP TRIGGER IF NOT EXISTS trg_memory_dialogue_archive_fts_delete
+    AFTER DELETE ON main.memory_dialogue_archive
+    BEGIN
+        INSERT INTO memory_dialogue_fts (memory_dialogue_fts, {_FTS_DIALOGUE_COLS})
+        VALUES ('delete', OLD.id, dialogue_text(OLD.content_z), OLD.actor_id, OLD.role, OLD.timestamp);
+    END'''
+
+def _create_connection_triggers(conn):
+    """Per-connection TEMP triggers; a no-op until init_db has created their tables."""
+    present = conn.execute('''
+        SELECT COUNT(*) FROM main.sqlite_master
+        WHERE name IN ('memory_dialogue_archive', 'memory_dialogue_fts')
+    ''').fetchone()[0]
+    if present == 2:
+        conn.execute(_FTS_ARCHIVE_DELETE_TRIGGER)
+
+# Identity of a relation: the object is its subject_id when linked, else its literal.
+_KG_RELATION_KEY = ("actor_id, subject_id, predicate, COALESCE(object_id, 0), "
+                    "CASE WHEN object_id IS NULL THEN COALESCE(object_literal, '') ELSE '' END")
+
+# Tables whose writes bump kg_revision, with how to find the row's actor.
+_KG_REVISION_SOURCES = [
+    ('kg_subjects',  '{row}.actor_id'),
+    ('kg_relations', '{row}.actor_id'),
+    ('kg_hierarchy', '(SELECT actor_id FROM kg_subjects WHERE subject_id = {row}.child_id)'),
+]
+
+def _kg_alias_fill_sql(row):
+    """
+    Statements that index a subject's canonical name and JSON aliases in
+    kg_aliases. `row` is 'NEW' inside a trigger, or 'kg_subjects' to backfill
+    every subject at once.
+    """
+    source = '' if row == 'NEW' else f'FROM {row}'
+    joined = '' if row == 'NEW' else f'{row},'
+    return f'''
+        INSERT OR IGNORE INTO kg_aliases (actor_id, alias_norm, subject_id, is_canonical)
+        SELECT {row}.actor_id, norm_name({row}.canonical_name), {row}.subject_id, 1 {source}
+        WHERE trim({row}.canonical_name) != '';
+        INSERT OR IGNORE INTO kg_aliases (actor_id, alias_norm, subject_id, is_canonical)
+        SELECT {row}.actor_id, norm_name(j.value), {row}.subject_id, 0
+        FROM {joined} json_each(CASE WHEN json_valid({row}.aliases) THEN {row}.aliases ELSE '[]' END) AS j
+        WHERE j.type = 'text' AND trim(j.value) != '';
+    '''
+
+def _block_concept_fill_sql(row):
+    """
+    Statement that indexes a memory block's JSON concepts in
+    memory_block_concepts. `row` is 'NEW' inside a trigger, or 'memory_blocks'
+    to backfill every block at once.
+    """
+    joined = '' if row == 'NEW' else f'{row},'
+    return f'''
+        INSERT OR IGNORE INTO memory_block_concepts (block_id, concept_norm, concept, actor_id, block_time)
+        SELECT {row}.block_id, norm_name(j.value), trim(j.value), {row}.actor_id,
+               COALESCE({row}.end_time, {row}.timestamp)
+        FROM {joined} json_each(CASE WHEN json_valid({row}.concepts) THEN {row}.concepts ELSE '[]' END) AS j
+        WHERE j.type = 'text' AND trim(j.value) != '';
+    '''
 
-    # Bridge between narrative and facts
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS kg_memory_links (
-            subject_id INTEGER REFERENCES kg_subjects(subject_id),
-            block_id INTEGER REFERENCES memory_blocks(block_id),
-            PRIMARY KEY (subject_id, block_id)
-        )
-    ''')
+def init_db():
+    """Builds the Three Regions foundational schema."""
+    with transaction() as cursor:
+        print(f"Initializing SQL Authority at {DB_PATH}...")
 
-    # =========================================================
-    # --- Modular Persona System ---
-    # =========================================================
+        # --- Region 2: Artifacts (Existence) ---
 
-    # Structured identity (replaces flat manifest_data.persona)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS actor_identity (
-            actor_id     TEXT PRIMARY KEY,
-            name         TEXT NOT NULL,
-            core_traits  TEXT,   -- Who she fundamentally is (2-3 sentences)
-            speech_style TEXT,   -- Voice fingerprint: pacing, vocabulary, quirks
-            "values"     TEXT,   -- What she protects / won't do
-            updated_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+        # Character Registry
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS registry_actors (
+                actor_id TEXT PRIMARY KEY,
+                vrm_path TEXT NOT NULL,
+                manifest_data TEXT, -- Full JSON for deep traits
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # UI Controls Registry
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS registry_ui_controls (
+                control_id TEXT PRIMARY KEY,
+                tab_id TEXT NOT NULL,
+                label TEXT,
+                min REAL,
+                max REAL,
+                step REAL,
+                "default" REAL,
+                sort_order INTEGER
+            )
+        ''')
+
+        # Workflow Registry
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS registry_workflows (
+                workflow_id TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                node_mappings TEXT -- JSON mapping labels to node IDs
+            )
+        ''')
+
+        # Animation Registry (Actions & Metadata)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS registry_animations (
+                anim_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT UNIQUE NOT NULL,
+                category TEXT NOT NULL,
+                trigger_condition TEXT,
+                action_purpose TEXT,
+                action_effect TEXT,
+                indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # --- Region 1: Reality (Truth Right Now) ---
+
+        # Global System State
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reality_state (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Live Performance State (Sliders/Weights)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reality_performance (
+                actor_id TEXT,
+                param_id TEXT,
+                value REAL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (actor_id, param_id)
+            )
+        ''')
+
+        # Live Actor Stats (Energy/Stamina)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reality_actor_stats (
+                actor_id TEXT PRIMARY KEY,
+                stamina REAL DEFAULT 1.0,
+                energy REAL DEFAULT 1.0,
+                mood TEXT DEFAULT 'Neutral',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # --- Region 3: Memory (Past Artifacts) ---
+
+        # Dialogue History
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_dialogue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                actor_id TEXT,
+                role TEXT, -- 'user' or 'assistant'
+                content TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Dialogue Archive — rows the heartbeat already condensed into pages,
+        # moved out of the hot table by archive_dialogue(). Same ids, zlib content.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_dialogue_archive (
+                id INTEGER PRIMARY KEY,
+                actor_id TEXT,
+                role TEXT,
+                content_z BLOB,
+                timestamp TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_dialogue_archive_actor '
+                       'ON memory_dialogue_archive(actor_id, id)')
+        # Hot + archived dialogue as one table. Needs the dialogue_text() function
+        # that _configure registers, so open connections through get_connection();
+        # plain sqlite3 connections can read memory_dialogue but not this view.
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS memory_dialogue_all AS
+            SELECT id, actor_id, role, dialogue_text(content_z) AS content, timestamp, 1 AS archived
+            FROM memory_dialogue_archive
+            UNION ALL
+            SELECT id, actor_id, role, content, timestamp, 0 AS archived
+            FROM memory_dialogue
+        ''')
+
+        # Stat Logs (Heartbeats)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_stats_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                actor_id TEXT,
+                stamina REAL,
+                energy REAL,
+                mood TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Memory Blocks (Condensed Concepts)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_blocks (
+                block_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                actor_id TEXT,
+                block_type TEXT DEFAULT 'page', -- 'page'|'chapter'|'book'
+                content TEXT, -- Human/LLM-readable summary
+                concepts TEXT, -- JSON list of extracted tags/ideas
+                source_range TEXT, -- e.g. "msg_id_start:msg_id_end"
+                start_time TIMESTAMP,
+                end_time TIMESTAMP,
+                parent_block_id INTEGER,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Concept index — one row per (block, normalised concept) from the JSON
+        # concepts column, kept in sync by triggers so blocks by concept and
+        # concept frequencies are index lookups instead of JSON scans.
+        # block_time is the end of the period the block covers.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS memory_block_concepts (
+                block_id     INTEGER NOT NULL REFERENCES memory_blocks(block_id),
+                concept_norm TEXT NOT NULL,   -- norm_name(): trimmed, case-folded concept
+                concept      TEXT,            -- as first written
+                actor_id     TEXT,
+                block_time   TIMESTAMP,
+                PRIMARY KEY (block_id, concept_norm)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_block_concepts_actor_concept '
+                       'ON memory_block_concepts(actor_id, concept_norm, block_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_block_concepts_actor_time '
+                       'ON memory_block_concepts(actor_id, block_time)')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_memory_block_concepts_insert AFTER INSERT ON memory_blocks
+            BEGIN {_block_concept_fill_sql('NEW')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_memory_block_concepts_update
+            AFTER UPDATE OF actor_id, concepts, end_time, timestamp ON memory_blocks
+            BEGIN
+                DELETE FROM memory_block_concepts WHERE block_id = OLD.block_id;
+                {_block_concept_fill_sql('NEW')}
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_memory_block_concepts_delete AFTER DELETE ON memory_blocks
+            BEGIN DELETE FROM memory_block_concepts WHERE block_id = OLD.block_id; END
+        ''')
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS memory_concept_frequency AS
+            SELECT actor_id, concept_norm, MIN(concept) AS concept, COUNT(*) AS block_count,
+                   MIN(block_time) AS first_seen, MAX(block_time) AS last_seen
+            FROM memory_block_concepts
+            GROUP BY actor_id, concept_norm
+        ''')
+
+        # Full-text search — external-content FTS5 indexes over dialogue (hot and
+        # archived, via the memory_dialogue_all view) and memory blocks, kept in
+        # sync by triggers. Skipped when this SQLite build lacks FTS5.
+        if _fts5_available(cursor):
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS memory_dialogue_fts USING fts5(
+                    content, actor_id UNINDEXED, role UNINDEXED, timestamp UNINDEXED,
+                    content='memory_dialogue_all', content_rowid='id',
+                    tokenize='porter unicode61 remove_diacritics 2'
+                )
+            ''')
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS memory_blocks_fts USING fts5(
+                    content, concepts, actor_id UNINDEXED, block_type UNINDEXED, timestamp UNINDEXED,
+                    content='memory_blocks', content_rowid='block_id',
+                    tokenize='porter unicode61 remove_diacritics 2'
+                )
+            ''')
+            for trigger in _FTS_TRIGGERS:
+                cursor.execute(trigger)
+            # Connections opened from now on get it from _configure.
+            _create_connection_triggers(cursor.connection)
+
+        # Bridge between narrative and facts
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_memory_links (
+                subject_id INTEGER REFERENCES kg_subjects(subject_id),
+                block_id INTEGER REFERENCES memory_blocks(block_id),
+                PRIMARY KEY (subject_id, block_id)
+            )
+        ''')
+
+        # =========================================================
+        # --- Modular Persona System ---
+        # =========================================================
+
+        # Structured identity (replaces flat manifest_data.persona)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS actor_identity (
+                actor_id     TEXT PRIMARY KEY,
+                name         TEXT NOT NULL,
+                core_traits  TEXT,   -- Who she fundamentally is (2-3 sentences)
+                speech_style TEXT,   -- Voice fingerprint: pacing, vocabulary, quirks
+                "values"     TEXT,   -- What she protects / won't do
+                updated_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Mood registry — each mood carries behavioral instructions
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS actor_moods (
+                actor_id        TEXT NOT NULL,
+                mood_id         TEXT NOT NULL,
+                display_name    TEXT NOT NULL,
+                behavioral_text TEXT NOT NULL,  -- How she speaks in this mood
+                transition_up   TEXT,           -- mood_id this escalates to
+                transition_down TEXT,           -- mood_id this de-escalates to
+                PRIMARY KEY (actor_id, mood_id)
+            )
+        ''')
+
+        # Mode prompt registry — per activity context
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS actor_mode_prompts (
+                actor_id       TEXT NOT NULL,
+                mode_id        TEXT NOT NULL,
+                display_name   TEXT NOT NULL,
+                system_text    TEXT NOT NULL,  -- Environmental/behavioral instructions for this mode
+                trigger_prefix TEXT,           -- Message prefix that auto-activates (nullable = manual only)
+                is_active      INTEGER DEFAULT 1,
+                PRIMARY KEY (actor_id, mode_id)
+            )
+        ''')
+
+        # =========================================================
+        # --- Knowledge Graph (KG) ---
+        # =========================================================
+
+        # Subjects — entities she knows about
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_subjects (
+                subject_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+                actor_id       TEXT NOT NULL,
+                canonical_name TEXT NOT NULL,
+                aliases        TEXT,           -- JSON list of alternate names
+                subject_type   TEXT NOT NULL,  -- "character"|"place"|"concept"|"event"|"object"
+                description    TEXT,
+                confidence     REAL DEFAULT 1.0,
+                source         TEXT,           -- "observer"|"user_statement"|"manual"
+                first_seen     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_updated   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_subjects_actor ON kg_subjects(actor_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_subjects_name ON kg_subjects(canonical_name)')
+
+        # Aliases — one row per lookup name (canonical name + each JSON alias).
+        # Kept in sync by triggers, so writers that edit kg_subjects directly
+        # (mind_maintenance, kg_cleanup, the bridge) never leave it stale.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_aliases (
+                actor_id     TEXT NOT NULL,
+                alias_norm   TEXT NOT NULL,     -- norm_name(): trimmed, case-folded name
+                subject_id   INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
+                is_canonical INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (actor_id, alias_norm, subject_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_aliases_subject ON kg_aliases(subject_id)')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_kg_aliases_insert AFTER INSERT ON kg_subjects
+            BEGIN {_kg_alias_fill_sql('NEW')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_kg_aliases_update
+            AFTER UPDATE OF actor_id, canonical_name, aliases ON kg_subjects
+            BEGIN
+                DELETE FROM kg_aliases WHERE subject_id = OLD.subject_id;
+                {_kg_alias_fill_sql('NEW')}
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_kg_aliases_delete AFTER DELETE ON kg_subjects
+            BEGIN DELETE FROM kg_aliases WHERE subject_id = OLD.subject_id; END
+        ''')
 
-    # Mood registry — each mood carries behavioral instructions
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS actor_moods (
-            actor_id        TEXT NOT NULL,
-            mood_id         TEXT NOT NULL,
-            display_name    TEXT NOT NULL,
-            behavioral_text TEXT NOT NULL,  -- How she speaks in this mood
-            transition_up   TEXT,           -- mood_id this escalates to
-            transition_down TEXT,           -- mood_id this de-escalates to
-            PRIMARY KEY (actor_id, mood_id)
-        )
-    ''')
+        # Subject hierarchy — taxonomy / ontology tree
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_hierarchy (
+                child_id       INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
+                parent_id      INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
+                relation_label TEXT DEFAULT "is_a",  -- "is_a"|"part_of"|"instance_of"
+                PRIMARY KEY (child_id, parent_id)
+            )
+        ''')
+
+        # Relations — subject-predicate-object triples
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_relations (
+                relation_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+                actor_id        TEXT NOT NULL,
+                subject_id      INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
+                predicate       TEXT NOT NULL,    -- Verb/action: "hates", "works_with", "wants"
+                object_id       INTEGER REFERENCES kg_subjects(subject_id),
+                object_literal  TEXT,             -- For non-entity objects
+                confidence      REAL DEFAULT 1.0,
+                source          TEXT,
+                timestamp       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_relations_subject ON kg_relations(subject_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_relations_object ON kg_relations(object_id)')
+
+        # Revision — bumped by triggers on every KG write, per actor, so
+        # readers (the /kg/ endpoint's ETag) can tell cheaply whether anything changed.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_revision (
+                actor_id TEXT PRIMARY KEY,
+                revision INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for table, actor_expr in _KG_REVISION_SOURCES:
+            for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_revision_{event.lower()}
+                    AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO kg_revision (actor_id, revision)
+                        SELECT actor_id, 1 FROM (SELECT {actor_expr.format(row=row)} AS actor_id)
+                        WHERE actor_id IS NOT NULL
+                        ON CONFLICT(actor_id) DO UPDATE SET revision = revision + 1;
+                    END
+                ''')
+
+        # Embeddings — vector search layer (see kg_vectors)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS kg_embeddings (
+                subject_id     INTEGER REFERENCES kg_subjects(subject_id),
+                embedding_json TEXT,   -- legacy JSON float array, superseded by embedding
+                model_used     TEXT,
+                indexed_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                embedding      BLOB,   -- float32 little-endian, L2-normalised
+                dim            INTEGER,
+                text_hash      TEXT,   -- hash of the embedded subject text; a mismatch means stale
+                PRIMARY KEY (subject_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS kg_subjects_embedding_ad AFTER DELETE ON kg_subjects BEGIN
+                DELETE FROM kg_embeddings WHERE subject_id = OLD.subject_id;
+            END
+        ''')
 
-    # Mode prompt registry — per activity context
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS actor_mode_prompts (
-            actor_id       TEXT NOT NULL,
-            mode_id        TEXT NOT NULL,
-            display_name   TEXT NOT NULL,
-            system_text    TEXT NOT NULL,  -- Environmental/behavioral instructions for this mode
-            trigger_prefix TEXT,           -- Message prefix that auto-activates (nullable = manual only)
-            is_active      INTEGER DEFAULT 1,
-            PRIMARY KEY (actor_id, mode_id)
-        )
-    ''')
+        _apply_migrations(cursor)
+    print("Authority established. 🏛️🛡️")
 
-    # =========================================================
-    # --- Knowledge Graph (KG) ---
-    # =========================================================
 
-    # Subjects — entities she knows about
+# --- Schema migrations ---
+# init_db creates missing tables; everything an existing install also needs
+# (indexes, backfills, data fixes) is a numbered migration, applied once, in
+# order, inside init_db's transaction and recorded in schema_version.
+# Append new migrations; never renumber or edit one that has shipped.
+
+def _migrate_kg_aliases_backfill(cursor):
+    # Databases created before kg_aliases existed; new rows are indexed by triggers.
+    cursor.execute('DELETE FROM kg_aliases')
+    for stmt in _kg_alias_fill_sql('kg_subjects').split(';'):
+        if stmt.strip():
+            cursor.execute(stmt)
+
+def _migrate_kg_uniqueness(cursor):
+    # One subject per name (case-insensitive) and one row per relation triple,
+    # so concurrent writers upsert instead of duplicating. Existing duplicates
+    # have to be merged before the indexes can be built.
+    stats = _kg_merge_duplicates(cursor)
+    if any(stats.values()):
+        print(f"Deduplicated knowledge graph: {stats}")
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS kg_subjects (
-            subject_id     INTEGER PRIMARY KEY AUTOINCREMENT,
-            actor_id       TEXT NOT NULL,
-            canonical_name TEXT NOT NULL,
-            aliases        TEXT,           -- JSON list of alternate names
-            subject_type   TEXT NOT NULL,  -- "character"|"place"|"concept"|"event"|"object"
-            description    TEXT,
-            confidence     REAL DEFAULT 1.0,
-            source         TEXT,           -- "observer"|"user_statement"|"manual"
-            first_seen     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_updated   TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_kg_subjects_unique_name
+        ON kg_subjects(actor_id, canonical_name COLLATE NOCASE)
     ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_subjects_actor ON kg_subjects(actor_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_subjects_name ON kg_subjects(canonical_name)')
-
-    # Subject hierarchy — taxonomy / ontology tree
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS kg_hierarchy (
-            child_id       INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
-            parent_id      INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
-            relation_label TEXT DEFAULT "is_a",  -- "is_a"|"part_of"|"instance_of"
-            PRIMARY KEY (child_id, parent_id)
-        )
+    cursor.execute(f'''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_kg_relations_unique_triple
+        ON kg_relations({_KG_RELATION_KEY})
     ''')
 
-    # Relations — subject-predicate-object triples
+def _migrate_hot_path_indexes(cursor):
+    # History/heartbeat reads, block listings, per-subject relations and the
+    # downward hierarchy lookups used by deletes and merges.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_dialogue_actor_id ON memory_dialogue(actor_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_blocks_actor_type_time '
+                   'ON memory_blocks(actor_id, block_type, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_relations_actor_subject_conf '
+                   'ON kg_relations(actor_id, subject_id, confidence)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_hierarchy_parent ON kg_hierarchy(parent_id)')
+
+def _migrate_fts_backfill(cursor):
+    # Index rows written before the FTS tables and their triggers existed.
+    cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('memory_dialogue_fts', 'memory_blocks_fts')")
+    for row in cursor.fetchall():
+        cursor.execute(f"INSERT INTO {row['name']} ({row['name']}) VALUES ('rebuild')")
+
+def _migrate_kg_embeddings_blob(cursor):
+    # kg_embeddings stored JSON text; vectors are now float32 BLOBs. Nothing
+    # wrote the JSON column, but convert whatever a hand-run script left there.
+    cursor.execute('PRAGMA table_info(kg_embeddings)')
+    columns = {row['name'] for row in cursor.fetchall()}
+    for column, decl in (('embedding', 'BLOB'), ('dim', 'INTEGER'), ('text_hash', 'TEXT')):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE kg_embeddings ADD COLUMN {column} {decl}')
+    cursor.execute('SELECT subject_id, embedding_json FROM kg_embeddings '
+                   'WHERE embedding IS NULL AND embedding_json IS NOT NULL')
+    for row in cursor.fetchall():
+        try:
+            vector = array('f', json.loads(row['embedding_json']))
+        except (TypeError, ValueError):
+            continue
+        if sys.byteorder != 'little':
+            vector.byteswap()
+        cursor.execute('UPDATE kg_embeddings SET embedding = ?, dim = ?, embedding_json = NULL WHERE subject_id = ?',
+                       (vector.tobytes(), len(vector), row['subject_id']))
+    cursor.execute('DELETE FROM kg_embeddings WHERE subject_id NOT IN (SELECT subject_id FROM kg_subjects)')
+
+def _migrate_block_concepts_backfill(cursor):
+    # Blocks written before memory_block_concepts existed; new ones are indexed by triggers.
+    cursor.execute('DELETE FROM memory_block_concepts')
+    cursor.execute(_block_concept_fill_sql('memory_blocks'))
+
+MIGRATIONS = [
+    (1, "backfill kg_aliases", _migrate_kg_aliases_backfill),
+    (2, "merge KG duplicates, unique subject/relation indexes", _migrate_kg_uniqueness),
+    (3, "hot-path indexes (dialogue, blocks, relations, hierarchy)", _migrate_hot_path_indexes),
+    (4, "build full-text indexes for dialogue and memory blocks", _migrate_fts_backfill),
+    (5, "float32 BLOB columns for kg_embeddings", _migrate_kg_embeddings_blob),
+    (6, "backfill memory_block_concepts", _migrate_block_concepts_backfill),
+]
+
+def _apply_migrations(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS kg_relations (
-            relation_id     INTEGER PRIMARY KEY AUTOINCREMENT,
-            actor_id        TEXT NOT NULL,
-            subject_id      INTEGER NOT NULL REFERENCES kg_subjects(subject_id),
-            predicate       TEXT NOT NULL,    -- Verb/action: "hates", "works_with", "wants"
-            object_id       INTEGER REFERENCES kg_subjects(subject_id),
-            object_literal  TEXT,             -- For non-entity objects
-            confidence      REAL DEFAULT 1.0,
-            source          TEXT,
-            timestamp       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_relations_subject ON kg_relations(subject_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kg_relations_object ON kg_relations(object_id)')
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    current = cursor.fetchone()[0]
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Applying schema migration {version}: {description}")
+        migrate(cursor)
+        cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)', (version, description))
 
-    # Embeddings — vector search layer (Phase 2)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS kg_embeddings (
-            subject_id     INTEGER REFERENCES kg_subjects(subject_id),
-            embedding_json TEXT,   -- JSON float array
-            model_used     TEXT,
-            indexed_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (subject_id)
-        )
-    ''')
+def rebuild_fts():
+    """Rebuild the full-text indexes from their tables, e.g. after deleting dialogue outside db_manager."""
+    with transaction() as cursor:
+        _migrate_fts_backfill(cursor)
 
-    conn.commit()
-    conn.close()
-    print("Authority established. 🏛️🛡️")
+def get_schema_version():
+    with transaction(readonly=True) as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+        if not cursor.fetchone():
+            return 0
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        return cursor.fetchone()[0]
 
 
 # --- CRUD Methods ---
@@ -262,78 +724,112 @@ def init_db():
 # --- Reality (Region 1) ---
 
 def set_reality(key, value):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO reality_state (key, value, updated_at)
-        VALUES (?, ?, CURRENT_TIMESTAMP)
-    ''', (key, str(value)))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO reality_state (key, value, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', (key, str(value)))
 
 def get_reality(key, default=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT value FROM reality_state WHERE key = ?', (key,))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT value FROM reality_state WHERE key = ?', (key,))
+        row = cursor.fetchone()
     return row['value'] if row else default
 
 def set_performance(actor_id, param_id, value):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO reality_performance (actor_id, param_id, value, updated_at)
-        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (actor_id, param_id, float(value)))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO reality_performance (actor_id, param_id, value, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (actor_id, param_id, float(value)))
 
 def get_performance(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT param_id, value FROM reality_performance WHERE actor_id = ?', (actor_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT param_id, value FROM reality_performance WHERE actor_id = ?', (actor_id,))
+        rows = cursor.fetchall()
     return {r['param_id']: r['value'] for r in rows}
 
 def set_actor_stats(actor_id, stamina, energy, mood='Neutral'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO reality_actor_stats (actor_id, stamina, energy, mood, updated_at)
-        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (actor_id, float(stamina), float(energy), mood))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO reality_actor_stats (actor_id, stamina, energy, mood, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (actor_id, float(stamina), float(energy), mood))
 
 def get_actor_stats(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM reality_actor_stats WHERE actor_id = ?', (actor_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM reality_actor_stats WHERE actor_id = ?', (actor_id,))
+        row = cursor.fetchone()
     return dict(row) if row else {"actor_id": actor_id, "stamina": 1.0, "energy": 1.0, "mood": "Neutral"}
 
 # --- Artifacts (Region 2) ---
 
+# Actor manifests are read several times per chat turn (and per TTS
+# paragraph), so parsed rows are cached per actor_id. register_actor and
+# update_actor_trait write through; entries still expire after
+# ACTOR_CACHE_TTL_SEC so edits made by other processes (HUD, ingest tools)
+# show up. The per-actor version stops a read that raced a write from caching
+# the older row.
+ACTOR_CACHE_TTL_SEC = 5.0
+
+_actor_cache = {}           # actor_id -> (row dict, loaded_at)
+_actor_versions = {}        # actor_id -> bumped on every write
+_actor_cache_lock = threading.Lock()
+
+def _read_actor(cursor, actor_id):
+    cursor.execute('SELECT * FROM registry_actors WHERE actor_id = ?', (actor_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    d = dict(row)
+    d['manifest_data'] = json.loads(d['manifest_data']) if d['manifest_data'] else {}
+    return d
+
+def _actor_written(actor_id, actor):
+    with _actor_cache_lock:
+        _actor_versions[actor_id] = _actor_versions.get(actor_id, 0) + 1
+        if actor is None:
+            _actor_cache.pop(actor_id, None)
+        else:
+            _actor_cache[actor_id] = (actor, time.monotonic())
+
+def _cached_actor(actor_id):
+    """The shared cached row (callers must not mutate it), loading it on a miss."""
+    with _actor_cache_lock:
+        hit = _actor_cache.get(actor_id)
+        version = _actor_versions.get(actor_id, 0)
+    if hit and time.monotonic() - hit[1] < ACTOR_CACHE_TTL_SEC:
+        return hit[0]
+    with transaction(readonly=True) as cursor:
+        actor = _read_actor(cursor, actor_id)
+    if actor is not None:
+        with _actor_cache_lock:
+            if _actor_versions.get(actor_id, 0) == version:
+                _actor_cache[actor_id] = (actor, time.monotonic())
+    return actor
+
+def invalidate_actor_cache(actor_id=None):
+    """Drop one cached manifest (or all), e.g. after editing registry_actors by hand."""
+    with _actor_cache_lock:
+        if actor_id is None:
+            _actor_cache.clear()
+        else:
+            _actor_cache.pop(actor_id, None)
+
 def register_actor(actor_id, vrm_path, manifest_dict=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    manifest_json = json.dumps(manifest_dict) if manifest_dict else None
-    cursor.execute('''
-        INSERT OR REPLACE INTO registry_actors (actor_id, vrm_path, manifest_data)
-        VALUES (?, ?, ?)
-    ''', (actor_id, vrm_path, manifest_json))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        manifest_json = json.dumps(manifest_dict) if manifest_dict else None
+        cursor.execute('''
+            INSERT OR REPLACE INTO registry_actors (actor_id, vrm_path, manifest_data)
+            VALUES (?, ?, ?)
+        ''', (actor_id, vrm_path, manifest_json))
+        actor = _read_actor(cursor, actor_id)
+    _actor_written(actor_id, actor)
 
 def get_all_actors():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT actor_id, vrm_path, manifest_data FROM registry_actors')
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT actor_id, vrm_path, manifest_data FROM registry_actors')
+        rows = cursor.fetchall()
     actors = []
     for r in rows:
         d = dict(r)
@@ -342,79 +838,69 @@ def get_all_actors():
     return actors
 
 def get_actor(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM registry_actors WHERE actor_id = ?', (actor_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        d = dict(row)
-        d['manifest_data'] = json.loads(d['manifest_data']) if d['manifest_data'] else {}
-        return d
-    return None
+    actor = _cached_actor(actor_id)
+    return copy.deepcopy(actor) if actor else None
 
 def update_actor_trait(actor_id, trait_key, value):
     """Updates a specific key inside the manifest_data JSON."""
-    actor = get_actor(actor_id)
-    if not actor:
-        return False
-    
-    manifest = actor['manifest_data']
-    manifest[trait_key] = value
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE registry_actors SET manifest_data = ? WHERE actor_id = ?
-    ''', (json.dumps(manifest), actor_id))
-    conn.commit()
-    conn.close()
+    # One transaction, so concurrent trait updates can't overwrite each other.
+    # Reads the row itself rather than through the cache, which may lag other processes.
+    with transaction() as cursor:
+        actor = _read_actor(cursor, actor_id)
+        if not actor:
+            return False
+
+        manifest = actor['manifest_data']
+        manifest[trait_key] = value
+
+        cursor.execute('''
+            UPDATE registry_actors SET manifest_data = ? WHERE actor_id = ?
+        ''', (json.dumps(manifest), actor_id))
+    _actor_written(actor_id, actor)
     return True
 
 def get_actor_trait(actor_id, trait_key, default=None):
-    actor = get_actor(actor_id)
-    if not actor:
-        return default
-    return actor['manifest_data'].get(trait_key, default)
+    return get_actor_traits(actor_id, {trait_key: default})[trait_key]
+
+def get_actor_traits(actor_id, traits):
+    """
+    Several manifest traits from one lookup. `traits` is a {key: default} dict
+    or a list of keys (default None); returns {key: value}.
+    """
+    if not isinstance(traits, dict):
+        traits = dict.fromkeys(traits)
+    actor = _cached_actor(actor_id)
+    manifest = actor['manifest_data'] if actor else {}
+    return {key: copy.deepcopy(manifest.get(key, default)) for key, default in traits.items()}
 
 def register_ui_control(control_id, tab_id, label, min_val, max_val, step, default, sort_order=0):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO registry_ui_controls (control_id, tab_id, label, min, max, step, "default", sort_order)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (control_id, tab_id, label, min_val, max_val, step, default, sort_order))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO registry_ui_controls (control_id, tab_id, label, min, max, step, "default", sort_order)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (control_id, tab_id, label, min_val, max_val, step, default, sort_order))
 
 def get_ui_controls(tab_id=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    if tab_id:
-        cursor.execute('SELECT * FROM registry_ui_controls WHERE tab_id = ? ORDER BY sort_order ASC', (tab_id,))
-    else:
-        cursor.execute('SELECT * FROM registry_ui_controls ORDER BY tab_id, sort_order ASC')
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        if tab_id:
+            cursor.execute('SELECT * FROM registry_ui_controls WHERE tab_id = ? ORDER BY sort_order ASC', (tab_id,))
+        else:
+            cursor.execute('SELECT * FROM registry_ui_controls ORDER BY tab_id, sort_order ASC')
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
 def register_workflow(workflow_id, path, node_mappings):
-    conn = get_connection()
-    cursor = conn.cursor()
-    mapping_json = json.dumps(node_mappings) if node_mappings else None
-    cursor.execute('''
-        INSERT OR REPLACE INTO registry_workflows (workflow_id, path, node_mappings)
-        VALUES (?, ?, ?)
-    ''', (workflow_id, path, mapping_json))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        mapping_json = json.dumps(node_mappings) if node_mappings else None
+        cursor.execute('''
+            INSERT OR REPLACE INTO registry_workflows (workflow_id, path, node_mappings)
+            VALUES (?, ?, ?)
+        ''', (workflow_id, path, mapping_json))
 
 def get_workflow(workflow_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM registry_workflows WHERE workflow_id = ?', (workflow_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM registry_workflows WHERE workflow_id = ?', (workflow_id,))
+        row = cursor.fetchone()
     if row:
         d = dict(row)
         d['node_mappings'] = json.loads(d['node_mappings']) if d['node_mappings'] else {}
@@ -424,49 +910,41 @@ def get_workflow(workflow_id):
 # --- Memory (Region 3) ---
 
 def log_dialogue(actor_id, role, content):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO memory_dialogue (actor_id, role, content)
-        VALUES (?, ?, ?)
-    ''', (actor_id, role, content))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO memory_dialogue (actor_id, role, content)
+            VALUES (?, ?, ?)
+        ''', (actor_id, role, content))
 
 def get_recent_history(actor_id, limit=10):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT role, content FROM memory_dialogue 
-        WHERE actor_id = ? 
-        ORDER BY id DESC LIMIT ?
-    ''', (actor_id, limit))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT role, content FROM memory_dialogue 
+            WHERE actor_id = ? 
+            ORDER BY id DESC LIMIT ?
+        ''', (actor_id, limit))
+        rows = cursor.fetchall()
     return [{"role": r['role'], "content": r['content']} for r in reversed(rows)]
 
 def reset_recent_history(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    # 1. Clear raw dialogue
-    cursor.execute('DELETE FROM memory_dialogue WHERE actor_id = ?', (actor_id,))
-    # 2. Clear extracted memory blocks
-    cursor.execute('DELETE FROM memory_blocks WHERE actor_id = ?', (actor_id,))
-    # 3. Clear stats log
-    cursor.execute('DELETE FROM memory_stats_log WHERE actor_id = ?', (actor_id,))
-    # 4. Clear memory links
-    cursor.execute('DELETE FROM kg_memory_links WHERE block_id NOT IN (SELECT block_id FROM memory_blocks)')
-    
-    # 5. Clear Reality State (Interests, Context, etc.)
-    cursor.execute('DELETE FROM reality_state WHERE key LIKE ?', (f'%{actor_id}%',))
-    
-    # 6. Reset Actor Stats (Energy/Stamina)
-    cursor.execute('UPDATE reality_actor_stats SET energy = 1.0, stamina = 1.0 WHERE actor_id = ?', (actor_id,))
-
-    conn.commit()
-    conn.close()
-
-    # 7. Clear Knowledge Graph (Opens its own connection)
+    with transaction() as cursor:
+        # 1. Clear raw dialogue (hot and archived)
+        cursor.execute('DELETE FROM memory_dialogue WHERE actor_id = ?', (actor_id,))
+        cursor.execute('DELETE FROM memory_dialogue_archive WHERE actor_id = ?', (actor_id,))
+        # 2. Clear extracted memory blocks
+        cursor.execute('DELETE FROM memory_blocks WHERE actor_id = ?', (actor_id,))
+        # 3. Clear stats log
+        cursor.execute('DELETE FROM memory_stats_log WHERE actor_id = ?', (actor_id,))
+        # 4. Clear memory links
+        cursor.execute('DELETE FROM kg_memory_links WHERE block_id NOT IN (SELECT block_id FROM memory_blocks)')
+
+        # 5. Clear Reality State (Interests, Context, etc.)
+        cursor.execute('DELETE FROM reality_state WHERE key LIKE ?', (f'%{actor_id}%',))
+
+        # 6. Reset Actor Stats (Energy/Stamina)
+        cursor.execute('UPDATE reality_actor_stats SET energy = 1.0, stamina = 1.0 WHERE actor_id = ?', (actor_id,))
+
+    # 7. Clear Knowledge Graph (Opens its own connection; notifies 'kg' listeners)
     reset_knowledge_graph(actor_id)
 
     # 8. Reset background memory trait (Opens its own connection)
@@ -476,195 +954,339 @@ def reset_recent_history(actor_id):
 
 def reset_knowledge_graph(actor_id):
     """Wipes all semantic facts (subjects, relations, hierarchy) for an actor."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Get all subject IDs for this actor to clean up child tables
-    cursor.execute('SELECT subject_id FROM kg_subjects WHERE actor_id = ?', (actor_id,))
-    sids = [r[0] for r in cursor.fetchall()]
-    
-    if sids:
-        placeholders = ', '.join(['?'] * len(sids))
-        # Clear Relations
-        cursor.execute(f'DELETE FROM kg_relations WHERE actor_id = ?', (actor_id,))
-        # Clear Hierarchy
-        cursor.execute(f'DELETE FROM kg_hierarchy WHERE child_id IN ({placeholders})', sids)
-        cursor.execute(f'DELETE FROM kg_hierarchy WHERE parent_id IN ({placeholders})', sids)
-        # Clear Memory Links
-        cursor.execute(f'DELETE FROM kg_memory_links WHERE subject_id IN ({placeholders})', sids)
-        # Clear Subjects
-        cursor.execute('DELETE FROM kg_subjects WHERE actor_id = ?', (actor_id,))
-
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        # Get all subject IDs for this actor to clean up child tables
+        cursor.execute('SELECT subject_id FROM kg_subjects WHERE actor_id = ?', (actor_id,))
+        sids = [r[0] for r in cursor.fetchall()]
+
+        if sids:
+            placeholders = ', '.join(['?'] * len(sids))
+            # Clear Relations
+            cursor.execute(f'DELETE FROM kg_relations WHERE actor_id = ?', (actor_id,))
+            # Clear Hierarchy
+            cursor.execute(f'DELETE FROM kg_hierarchy WHERE child_id IN ({placeholders})', sids)
+            cursor.execute(f'DELETE FROM kg_hierarchy WHERE parent_id IN ({placeholders})', sids)
+            # Clear Memory Links
+            cursor.execute(f'DELETE FROM kg_memory_links WHERE subject_id IN ({placeholders})', sids)
+            # Clear Subjects
+            cursor.execute('DELETE FROM kg_subjects WHERE actor_id = ?', (actor_id,))
+    _notify_change('kg', actor_id)
     print(f"Knowledge Graph reset for {actor_id}")
 
 def get_dialogue_count(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM memory_dialogue WHERE actor_id = ?', (actor_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
+    """Hot plus archived dialogue rows."""
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM memory_dialogue WHERE actor_id = ?)
+                 + (SELECT COUNT(*) FROM memory_dialogue_archive WHERE actor_id = ?)
+        ''', (actor_id, actor_id))
+        count = cursor.fetchone()[0]
     return count
 
 def get_max_dialogue_id(actor_id):
     """Return latest dialogue row id for an actor, or 0 if none."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT MAX(id) FROM memory_dialogue WHERE actor_id = ?', (actor_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM memory_dialogue WHERE actor_id = ?), 0),
+                       COALESCE((SELECT MAX(id) FROM memory_dialogue_archive WHERE actor_id = ?), 0))
+        ''', (actor_id, actor_id))
+        row = cursor.fetchone()
     return int(row[0] or 0)
 
 def get_dialogue_after_id(actor_id, after_id, limit=15):
     """Return dialogue rows strictly newer than after_id, ascending by id."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, role, content, timestamp
-        FROM memory_dialogue
-        WHERE actor_id = ? AND id > ?
-        ORDER BY id ASC
-        LIMIT ?
-    ''', (actor_id, int(after_id), int(limit)))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT id, role, content, timestamp
+            FROM memory_dialogue
+            WHERE actor_id = ? AND id > ?
+            ORDER BY id ASC
+            LIMIT ?
+        ''', (actor_id, int(after_id), int(limit)))
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
+# --- Dialogue archive ---
+# Only the newest turns (history) and the range the heartbeat hasn't paged yet
+# are ever read from memory_dialogue. Rows at or below the heartbeat watermark
+# are moved to memory_dialogue_archive, compressed, keeping at least
+# HOT_DIALOGUE_KEEP recent rows hot so history never has to look there.
+HOT_DIALOGUE_KEEP = 50
+ARCHIVE_BATCH_ROWS = 2000
+
+def archive_dialogue(actor_id, upto_id, keep_recent=HOT_DIALOGUE_KEEP, batch=ARCHIVE_BATCH_ROWS):
+    """Move this actor's dialogue rows with id <= upto_id to the archive; returns rows moved."""
+    with transaction() as cursor:
+        # Never archive into the newest `keep_recent` rows.
+        cursor.execute('''
+            SELECT id FROM memory_dialogue WHERE actor_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+        ''', (actor_id, max(keep_recent - 1, 0)))
+        row = cursor.fetchone()
+        if not row:
+            return 0
+        limit_id = min(int(upto_id), row['id'] - (1 if keep_recent else 0))
+        cursor.execute('''
+            SELECT id, actor_id, role, content, timestamp FROM memory_dialogue
+            WHERE actor_id = ? AND id <= ? ORDER BY id LIMIT ?
+        ''', (actor_id, limit_id, batch))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+        cursor.executemany('''
+            INSERT OR REPLACE INTO memory_dialogue_archive (id, actor_id, role, content_z, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(r['id'], r['actor_id'], r['role'],
+               zlib.compress(r['content'].encode('utf-8')) if r['content'] is not None else None,
+               r['timestamp']) for r in rows])
+        cursor.execute('DELETE FROM memory_dialogue WHERE actor_id = ? AND id BETWEEN ? AND ?',
+                       (actor_id, rows[0]['id'], rows[-1]['id']))
+    return len(rows)
+
+def get_all_dialogue(actor_id):
+    """Every dialogue row for an actor, hot and archived, oldest first."""
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT id, actor_id, role, content, timestamp FROM memory_dialogue_all
+            WHERE actor_id = ? ORDER BY id
+        ''', (actor_id,))
+        rows = cursor.fetchall()
+    return [dict(r) for r in rows]
+
+# --- Full-text memory search ---
+# Fallback for memory_query when a name isn't a KG subject: BM25-ranked hits
+# from dialogue (hot and archived) and memory blocks, each with a snippet.
+MEMORY_SEARCH_SNIPPET_TOKENS = 16
+
+_FTS_STOPWORDS = {
+    'a', 'an', 'and', 'are', 'about', 'did', 'do', 'for', 'from', 'he', 'her', 'his', 'how', 'i', 'in', 'is',
+    'it', 'me', 'my', 'of', 'on', 'or', 'she', 'that', 'the', 'their', 'they', 'this', 'to', 'was', 'we',
+    'what', 'when', 'where', 'who', 'why', 'with', 'you', 'your',
+}
+
+def _fts_query(text):
+    """
+    Free text -> FTS5 query. Words are quoted (no operator injection) and OR-ed
+    so BM25 ranks fuller matches first; longer words also match as prefixes.
+    """
+    terms = [t for t in re.findall(r'\w+', (text or '').lower()) if t not in _FTS_STOPWORDS]
+    return ' OR '.join(f'"{t}"*' if len(t) >= 4 else f'"{t}"' for t in dict.fromkeys(terms))
+
+def memory_search(actor_id, query, limit=5):
+    """
+    Full-text search over this actor's dialogue and memory blocks.
+    Returns up to `limit` hits, best first:
+    {'kind': 'dialogue'|'block', 'id', 'role'|'block_type', 'timestamp', 'snippet', 'score'}.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    hits = []
+    with transaction(readonly=True) as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('memory_dialogue_fts', 'memory_blocks_fts')")
+        tables = {r['name'] for r in cursor.fetchall()}
+        if 'memory_dialogue_fts' in tables:
+            cursor.execute(f'''
+                SELECT 'dialogue' AS kind, rowid AS id, role, timestamp,
+                       snippet(memory_dialogue_fts, 0, '[', ']', '…', {MEMORY_SEARCH_SNIPPET_TOKENS}) AS snippet,
+                       bm25(memory_dialogue_fts) AS score
+                FROM memory_dialogue_fts
+                WHERE memory_dialogue_fts MATCH ? AND actor_id = ?
+                ORDER BY score LIMIT ?
+            ''', (match, actor_id, limit))
+            hits.extend(dict(r) for r in cursor.fetchall())
+        if 'memory_blocks_fts' in tables:
+            cursor.execute(f'''
+                SELECT 'block' AS kind, rowid AS id, block_type, timestamp,
+                       snippet(memory_blocks_fts, -1, '[', ']', '…', {MEMORY_SEARCH_SNIPPET_TOKENS}) AS snippet,
+                       bm25(memory_blocks_fts) AS score
+                FROM memory_blocks_fts
+                WHERE memory_blocks_fts MATCH ? AND actor_id = ?
+                ORDER BY score LIMIT ?
+            ''', (match, actor_id, limit))
+            hits.extend(dict(r) for r in cursor.fetchall())
+    # bm25() is lower-is-better.
+    hits.sort(key=lambda h: h['score'])
+    return hits[:limit]
+
+def memory_search_context(actor_id, query, limit=5):
+    """memory_search formatted for the prompt, or "" when nothing matches."""
+    hits = memory_search(actor_id, query, limit)
+    if not hits:
+        return ""
+    lines = []
+    for h in hits:
+        source = h['role'] if h['kind'] == 'dialogue' else f"{h['block_type']} summary"
+        lines.append(f"• [{h['timestamp']}] ({source}) {h['snippet']}")
+    return "FROM MY MEMORIES:\n" + "\n".join(lines)
+
 def add_memory_block(actor_id, content, concepts, source_range, 
                      block_type='page', start_time=None, end_time=None, parent_block_id=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    concepts_json = json.dumps(concepts)
-    cursor.execute('''
-        INSERT INTO memory_blocks (actor_id, content, concepts, source_range, block_type, start_time, end_time, parent_block_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (actor_id, content, concepts_json, source_range, block_type, start_time, end_time, parent_block_id))
-    block_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        concepts_json = json.dumps(concepts)
+        cursor.execute('''
+            INSERT INTO memory_blocks (actor_id, content, concepts, source_range, block_type, start_time, end_time, parent_block_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (actor_id, content, concepts_json, source_range, block_type, start_time, end_time, parent_block_id))
+        block_id = cursor.lastrowid
     return block_id
 
 def kg_link_memory(subject_id, block_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO kg_memory_links (subject_id, block_id) VALUES (?, ?)', (subject_id, block_id))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('INSERT OR IGNORE INTO kg_memory_links (subject_id, block_id) VALUES (?, ?)', (subject_id, block_id))
 
 def kg_get_linked_memories(subject_id, limit=10):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT mb.* 
-        FROM memory_blocks mb
-        JOIN kg_memory_links ml ON ml.block_id = mb.block_id
-        WHERE ml.subject_id = ?
-        ORDER BY mb.timestamp DESC LIMIT ?
-    ''', (subject_id, limit))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT mb.* 
+            FROM memory_blocks mb
+            JOIN kg_memory_links ml ON ml.block_id = mb.block_id
+            WHERE ml.subject_id = ?
+            ORDER BY mb.timestamp DESC LIMIT ?
+        ''', (subject_id, limit))
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
 def get_dialogue_timestamp_range(actor_id, limit=15):
     """Returns (start_time, end_time) for the most recent N dialogue messages."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT MIN(timestamp), MAX(timestamp) 
-        FROM (SELECT timestamp FROM memory_dialogue WHERE actor_id = ? ORDER BY id DESC LIMIT ?)
-    ''', (actor_id, limit))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT MIN(timestamp), MAX(timestamp) 
+            FROM (SELECT timestamp FROM memory_dialogue WHERE actor_id = ? ORDER BY id DESC LIMIT ?)
+        ''', (actor_id, limit))
+        row = cursor.fetchone()
     return (row[0], row[1]) if row else (None, None)
 
 def get_memory_blocks(actor_id, limit=5, block_type='page'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM memory_blocks 
-        WHERE actor_id = ? AND block_type = ? 
-        ORDER BY timestamp DESC LIMIT ?
-    ''', (actor_id, block_type, limit))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT * FROM memory_blocks 
+            WHERE actor_id = ? AND block_type = ? 
+            ORDER BY timestamp DESC LIMIT ?
+        ''', (actor_id, block_type, limit))
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
 def get_block_count(actor_id, block_type='page'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM memory_blocks WHERE actor_id = ? AND block_type = ?', (actor_id, block_type))
-    count = cursor.fetchone()[0]
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT COUNT(*) FROM memory_blocks WHERE actor_id = ? AND block_type = ?', (actor_id, block_type))
+        count = cursor.fetchone()[0]
     return count
 
+# --- Memory concepts ---
+# Served from memory_block_concepts / memory_concept_frequency (see init_db);
+# concepts are matched case-insensitively on their trimmed form.
+
 def get_all_concepts(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT concepts FROM memory_blocks WHERE actor_id = ?', (actor_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    
-    all_concepts = set()
-    for r in rows:
-        try:
-            clist = json.loads(r['concepts'])
-            all_concepts.update(clist)
-        except:
-            pass
-    return list(all_concepts)
+    """Every distinct concept in the actor's memory blocks (one spelling per concept)."""
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT concept FROM memory_concept_frequency WHERE actor_id = ?', (actor_id,))
+        return [r['concept'] for r in cursor.fetchall()]
+
+def get_block_concepts(block_ids):
+    """Distinct concepts of the given blocks, in block order and then as written."""
+    block_ids = list(block_ids)
+    if not block_ids:
+        return []
+    with transaction(readonly=True) as cursor:
+        cursor.execute(f'''
+            SELECT block_id, concept_norm, concept FROM memory_block_concepts
+            WHERE block_id IN ({','.join('?' for _ in block_ids)})
+        ''', block_ids)
+        rows = cursor.fetchall()
+    order = {bid: i for i, bid in enumerate(block_ids)}
+    concepts = {}
+    for r in sorted(rows, key=lambda r: order[r['block_id']]):
+        concepts.setdefault(r['concept_norm'], r['concept'])
+    return list(concepts.values())
+
+def get_blocks_by_concept(actor_id, concept, limit=10, block_type=None):
+    """The actor's memory blocks mentioning `concept`, newest period first."""
+    sql = '''
+        SELECT mb.* FROM memory_block_concepts c
+        JOIN memory_blocks mb ON mb.block_id = c.block_id
+        WHERE c.actor_id = ? AND c.concept_norm = ?
+    '''
+    params = [actor_id, _norm_name(concept or '')]
+    if block_type:
+        sql += ' AND mb.block_type = ?'
+        params.append(block_type)
+    sql += ' ORDER BY c.block_time DESC LIMIT ?'
+    params.append(limit)
+    with transaction(readonly=True) as cursor:
+        cursor.execute(sql, params)
+        return [dict(r) for r in cursor.fetchall()]
+
+def get_top_concepts(actor_id, start_time=None, end_time=None, limit=20, block_type=None):
+    """
+    Most frequent concepts in blocks whose period ends within [start_time, end_time]
+    (either bound optional): [{'concept', 'concept_norm', 'block_count', 'first_seen', 'last_seen'}].
+    """
+    where, params = ['c.actor_id = ?'], [actor_id]
+    if start_time:
+        where.append('c.block_time >= ?')
+        params.append(start_time)
+    if end_time:
+        where.append('c.block_time <= ?')
+        params.append(end_time)
+    join = ''
+    if block_type:
+        join = 'JOIN memory_blocks mb ON mb.block_id = c.block_id'
+        where.append('mb.block_type = ?')
+        params.append(block_type)
+    params.append(limit)
+    # With a time bound, '+' stops the planner grouping along the concept index
+    # (a scan of all the actor's concepts) instead of range-seeking the time index.
+    group = '+c.concept_norm' if (start_time or end_time) else 'c.concept_norm'
+    with transaction(readonly=True) as cursor:
+        cursor.execute(f'''
+            SELECT MIN(c.concept) AS concept, c.concept_norm, COUNT(*) AS block_count,
+                   MIN(c.block_time) AS first_seen, MAX(c.block_time) AS last_seen
+            FROM memory_block_concepts c {join}
+            WHERE {' AND '.join(where)}
+            GROUP BY {group}
+            ORDER BY block_count DESC, last_seen DESC
+            LIMIT ?
+        ''', params)
+        return [dict(r) for r in cursor.fetchall()]
 
 def log_stats(actor_id, stamina, energy, mood):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO memory_stats_log (actor_id, stamina, energy, mood)
-        VALUES (?, ?, ?, ?)
-    ''', (actor_id, float(stamina), float(energy), mood))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO memory_stats_log (actor_id, stamina, energy, mood)
+            VALUES (?, ?, ?, ?)
+        ''', (actor_id, float(stamina), float(energy), mood))
 
 # --- Animation Registry (New) ---
 
 def register_animation(filename, category, trigger, purpose, effect=""):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO registry_animations (filename, category, trigger_condition, action_purpose, action_effect, indexed_at)
-        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (filename, category, trigger, purpose, effect))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO registry_animations (filename, category, trigger_condition, action_purpose, action_effect, indexed_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (filename, category, trigger, purpose, effect))
+    _notify_change('animations')
 
 def get_all_animations():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM registry_animations')
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM registry_animations')
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
 def get_animation_count():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM registry_animations')
-    count = cursor.fetchone()[0]
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT COUNT(*) FROM registry_animations')
+        count = cursor.fetchone()[0]
     return int(count or 0)
 
 def delete_animation(anim_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM registry_animations WHERE anim_id = ?', (anim_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM registry_animations WHERE anim_id = ?', (anim_id,))
+    _notify_change('animations')
 
 def get_animation_by_path(path):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM registry_animations WHERE filename = ?', (path,))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM registry_animations WHERE filename = ?', (path,))
+        row = cursor.fetchone()
     return dict(row) if row else None
 
 if __name__ == "__main__":
@@ -678,21 +1300,17 @@ if __name__ == "__main__":
 # --- Identity ---
 
 def set_actor_identity(actor_id, name, core_traits, speech_style, values):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO actor_identity (actor_id, name, core_traits, speech_style, "values", updated_at)
-        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (actor_id, name, core_traits, speech_style, values))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO actor_identity (actor_id, name, core_traits, speech_style, "values", updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (actor_id, name, core_traits, speech_style, values))
+    _notify_change('identity', actor_id)
 
 def get_actor_identity(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM actor_identity WHERE actor_id = ?', (actor_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM actor_identity WHERE actor_id = ?', (actor_id,))
+        row = cursor.fetchone()
     return dict(row) if row else None
 
 
@@ -713,32 +1331,27 @@ def set_actor_interests(actor_id, interests):
     # Cap at 10 interests as per requirement
     interests = interests[:10]
     set_reality(f"actor_interests_{actor_id}", json.dumps(interests))
+    _notify_change('interests', actor_id)
 
 def set_mood(actor_id, mood_id, display_name, behavioral_text, transition_up=None, transition_down=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO actor_moods
-            (actor_id, mood_id, display_name, behavioral_text, transition_up, transition_down)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (actor_id, mood_id, display_name, behavioral_text, transition_up, transition_down))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO actor_moods
+                (actor_id, mood_id, display_name, behavioral_text, transition_up, transition_down)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (actor_id, mood_id, display_name, behavioral_text, transition_up, transition_down))
+    _notify_change('mood', actor_id)
 
 def get_mood(actor_id, mood_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM actor_moods WHERE actor_id = ? AND mood_id = ?', (actor_id, mood_id))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM actor_moods WHERE actor_id = ? AND mood_id = ?', (actor_id, mood_id))
+        row = cursor.fetchone()
     return dict(row) if row else None
 
 def get_all_moods(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM actor_moods WHERE actor_id = ?', (actor_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM actor_moods WHERE actor_id = ?', (actor_id,))
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
 def get_current_mood(actor_id):
@@ -750,36 +1363,31 @@ def set_current_mood(actor_id, mood_id):
     """Updates the live mood in reality_actor_stats."""
     stats = get_actor_stats(actor_id)
     set_actor_stats(actor_id, stats.get('stamina', 1.0), stats.get('energy', 1.0), mood_id)
+    _notify_change('mood', actor_id)
 
 
 # --- Mode Prompts ---
 
 def set_mode_prompt(actor_id, mode_id, display_name, system_text, trigger_prefix=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO actor_mode_prompts
-            (actor_id, mode_id, display_name, system_text, trigger_prefix)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (actor_id, mode_id, display_name, system_text, trigger_prefix))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR REPLACE INTO actor_mode_prompts
+                (actor_id, mode_id, display_name, system_text, trigger_prefix)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (actor_id, mode_id, display_name, system_text, trigger_prefix))
+    _notify_change('mode', actor_id)
 
 def get_mode_prompt(actor_id, mode_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM actor_mode_prompts WHERE actor_id = ? AND mode_id = ? AND is_active = 1',
-                   (actor_id, mode_id))
-    row = cursor.fetchone()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM actor_mode_prompts WHERE actor_id = ? AND mode_id = ? AND is_active = 1',
+                       (actor_id, mode_id))
+        row = cursor.fetchone()
     return dict(row) if row else None
 
 def get_all_mode_prompts(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM actor_mode_prompts WHERE actor_id = ? ORDER BY mode_id', (actor_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM actor_mode_prompts WHERE actor_id = ? ORDER BY mode_id', (actor_id,))
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
 
@@ -789,180 +1397,563 @@ def get_all_mode_prompts(actor_id):
 
 def kg_add_subject(actor_id, canonical_name, subject_type, description=None,
                    aliases=None, confidence=1.0, source='manual'):
-    """Add or update a subject in the knowledge graph.
-    Uniqueness key is (actor_id, canonical_name, source) — two entities with
-    the same name but different source contexts are treated as distinct.
+    """Add or update a subject in the knowledge graph; returns its subject_id.
+    Uniqueness key is (actor_id, canonical_name), case-insensitive and enforced
+    by a unique index — the source context does not split a subject.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    aliases_json = json.dumps(aliases) if aliases else None
-
-    # Check if already exists (by canonical_name for this actor)
-    # We ignore 'source' for uniqueness to prevent identity fragmentation.
-    cursor.execute(
-        'SELECT subject_id, description, confidence FROM kg_subjects WHERE actor_id = ? AND canonical_name = ?',
-        (actor_id, canonical_name)
-    )
-    existing = cursor.fetchone()
+    with transaction() as cursor:
+        subject_id = _kg_upsert_subject(cursor, actor_id, canonical_name, subject_type,
+                                        description, aliases, confidence, source)
+    _notify_change('kg', actor_id)
+    return subject_id
 
-    if existing:
-        # Update if the new info is more descriptive or has higher confidence
-        new_desc = description if description else existing['description']
-        new_conf = max(confidence, existing['confidence'])
+def _kg_upsert_subject(cursor, actor_id, canonical_name, subject_type, description=None,
+                       aliases=None, confidence=1.0, source='manual'):
+    # One subject per (actor_id, canonical_name) regardless of case or source,
+    # to prevent identity fragmentation. An existing subject keeps its type,
+    # aliases and source; a new description replaces the old one and the
+    # higher confidence wins.
+    aliases_json = json.dumps(aliases) if aliases else None
+    cursor.execute('''
+        INSERT INTO kg_subjects (actor_id, canonical_name, aliases, subject_type, description, confidence, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (actor_id, canonical_name COLLATE NOCASE) DO UPDATE SET
+            description  = COALESCE(NULLIF(excluded.description, ''), kg_subjects.description),
+            confidence   = MAX(COALESCE(kg_subjects.confidence, 0), excluded.confidence),
+            last_updated = CURRENT_TIMESTAMP
+    ''', (actor_id, canonical_name, aliases_json, subject_type, description, confidence, source))
+    cursor.execute('SELECT subject_id FROM kg_subjects WHERE actor_id = ? AND canonical_name = ? COLLATE NOCASE',
+                   (actor_id, canonical_name))
+    return cursor.fetchone()['subject_id']
+
+
+def _kg_repoint_subject(cursor, from_id, to_id):
+    """Move every reference from subject `from_id` to `to_id`, dropping references `to_id` already has."""
+    for table, column in (('kg_relations', 'subject_id'), ('kg_relations', 'object_id'),
+                          ('kg_hierarchy', 'child_id'), ('kg_hierarchy', 'parent_id'),
+                          ('kg_memory_links', 'subject_id')):
+        cursor.execute(f'UPDATE OR IGNORE {table} SET {column} = ? WHERE {column} = ?', (to_id, from_id))
+        cursor.execute(f'DELETE FROM {table} WHERE {column} = ?', (from_id,))
+    cursor.execute('DELETE FROM kg_embeddings WHERE subject_id = ?', (from_id,))
+
+
+def _kg_merge_duplicates(cursor):
+    """
+    Merge subjects whose names differ only in case into the oldest one
+    (highest confidence, first non-empty description, union of aliases),
+    then drop duplicate relation triples, keeping the oldest row.
+    """
+    stats = {'subjects_merged': 0, 'relations_deduped': 0}
+    cursor.execute('''
+        SELECT actor_id, canonical_name COLLATE NOCASE AS name
+        FROM kg_subjects
+        GROUP BY actor_id, canonical_name COLLATE NOCASE
+        HAVING COUNT(*) > 1
+    ''')
+    for group in cursor.fetchall():
         cursor.execute('''
-            UPDATE kg_subjects SET description=?, confidence=?, last_updated=CURRENT_TIMESTAMP
-            WHERE subject_id=?
-        ''', (new_desc, new_conf, existing['subject_id']))
-        subject_id = existing['subject_id']
-    else:
+            SELECT * FROM kg_subjects WHERE actor_id = ? AND canonical_name = ? COLLATE NOCASE
+            ORDER BY subject_id
+        ''', (group['actor_id'], group['name']))
+        rows = [dict(r) for r in cursor.fetchall()]
+        keep, losers = rows[0], rows[1:]
+
+        aliases, seen = [], {keep['canonical_name'].lower()}
+        for r in rows:
+            try:
+                names = json.loads(r['aliases'] or '[]')
+            except ValueError:
+                names = []
+            for name in names + [r['canonical_name']]:
+                if isinstance(name, str) and name.strip() and name.lower() not in seen:
+                    seen.add(name.lower())
+                    aliases.append(name)
+        description = next((r['description'] for r in rows if r['description']), None)
+        confidence = max(r['confidence'] or 0 for r in rows)
+
+        for loser in losers:
+            _kg_repoint_subject(cursor, loser['subject_id'], keep['subject_id'])
+            cursor.execute('DELETE FROM kg_subjects WHERE subject_id = ?', (loser['subject_id'],))
         cursor.execute('''
-            INSERT INTO kg_subjects (actor_id, canonical_name, aliases, subject_type, description, confidence, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (actor_id, canonical_name, aliases_json, subject_type, description, confidence, source))
-        subject_id = cursor.lastrowid
+            UPDATE kg_subjects SET aliases = ?, description = ?, confidence = ?, last_updated = CURRENT_TIMESTAMP
+            WHERE subject_id = ?
+        ''', (json.dumps(aliases) if aliases else None, description, confidence, keep['subject_id']))
+        stats['subjects_merged'] += len(losers)
+
+    cursor.execute(f'''
+        DELETE FROM kg_relations
+        WHERE relation_id NOT IN (SELECT MIN(relation_id) FROM kg_relations GROUP BY {_KG_RELATION_KEY})
+    ''')
+    stats['relations_deduped'] = cursor.rowcount
+    return stats
+
+
+def kg_delete_subject(subject_id):
+    """Delete a subject with its relations (either direction), hierarchy edges and memory links."""
+    with transaction() as cursor:
+        cursor.execute('SELECT actor_id FROM kg_subjects WHERE subject_id = ?', (subject_id,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        cursor.execute('DELETE FROM kg_relations WHERE subject_id = ? OR object_id = ?', (subject_id, subject_id))
+        cursor.execute('DELETE FROM kg_hierarchy WHERE child_id = ? OR parent_id = ?', (subject_id, subject_id))
+        cursor.execute('DELETE FROM kg_memory_links WHERE subject_id = ?', (subject_id,))
+        cursor.execute('DELETE FROM kg_subjects WHERE subject_id = ?', (subject_id,))
+    _notify_change('kg', row['actor_id'])
+    return True
 
-    conn.commit()
-    conn.close()
-    return subject_id
+def kg_merge_duplicates():
+    """Merge case-duplicate subjects and duplicate relations; returns counts."""
+    with transaction() as cursor:
+        stats = _kg_merge_duplicates(cursor)
+    if any(stats.values()):
+        _notify_change('kg')
+    return stats
 
 
 def kg_get_contexts(actor_id):
     """Return all distinct source context values for this actor's KG subjects,
     ordered by recency. Used to populate the LLM's available context list."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT DISTINCT source
-        FROM kg_subjects
-        WHERE actor_id = ? AND source IS NOT NULL AND source != ''
-        ORDER BY last_updated DESC
-    ''', (actor_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT DISTINCT source
+            FROM kg_subjects
+            WHERE actor_id = ? AND source IS NOT NULL AND source != ''
+            ORDER BY last_updated DESC
+        ''', (actor_id,))
+        rows = cursor.fetchall()
     return [r['source'] for r in rows]
 
+def _kg_lookup_sql(columns='s.*'):
+    # Canonical-name hits rank before alias hits, newest first.
+    return f'''
+        SELECT {columns}, a.is_canonical
+        FROM kg_aliases a
+        JOIN kg_subjects s ON s.subject_id = a.subject_id
+        WHERE a.actor_id = ? AND a.alias_norm = ?
+        ORDER BY a.is_canonical DESC, s.last_updated DESC, s.subject_id DESC
+    '''
+
 def kg_get_subject(actor_id, name):
     """Look up a subject by canonical name or alias."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    # Direct match
-    cursor.execute('SELECT * FROM kg_subjects WHERE actor_id = ? AND canonical_name = ? COLLATE NOCASE',
-                   (actor_id, name))
-    row = cursor.fetchone()
+    with transaction(readonly=True) as cursor:
+        cursor.execute(_kg_lookup_sql() + ' LIMIT 1', (actor_id, _norm_name(name or '')))
+        row = cursor.fetchone()
     if not row:
-        # Alias scan — check if name appears in any aliases JSON
-        cursor.execute('SELECT * FROM kg_subjects WHERE actor_id = ?', (actor_id,))
-        for r in cursor.fetchall():
-            try:
-                aliases = json.loads(r['aliases'] or '[]')
-                if any(name.lower() == a.lower() for a in aliases):
-                    row = r
-                    break
-            except Exception:
-                pass
-    conn.close()
-    return dict(row) if row else None
+        return None
+    d = dict(row)
+    d.pop('is_canonical', None)
+    return d
 
 def kg_get_all_subjects(actor_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM kg_subjects WHERE actor_id = ? ORDER BY confidence DESC', (actor_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT * FROM kg_subjects WHERE actor_id = ? ORDER BY confidence DESC', (actor_id,))
+        rows = cursor.fetchall()
     return [dict(r) for r in rows]
 
+def kg_get_alias_patterns(actor_id):
+    """
+    (revision, [(alias_norm, subject_id, canonical_name)]) — every name and
+    alias the actor's subjects answer to, read together with the KG revision
+    they belong to (see subject_matcher).
+    """
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT revision FROM kg_revision WHERE actor_id = ?', (actor_id,))
+        row = cursor.fetchone()
+        cursor.execute('''
+            SELECT a.alias_norm, a.subject_id, s.canonical_name
+            FROM kg_aliases a
+            JOIN kg_subjects s ON s.subject_id = a.subject_id
+            WHERE a.actor_id = ?
+        ''', (actor_id,))
+        patterns = [(r['alias_norm'], r['subject_id'], r['canonical_name']) for r in cursor.fetchall()]
+    return (row['revision'] if row else 0), patterns
+
 def kg_add_hierarchy(child_id, parent_id, relation_label='is_a'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR IGNORE INTO kg_hierarchy (child_id, parent_id, relation_label)
-        VALUES (?, ?, ?)
-    ''', (child_id, parent_id, relation_label))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT OR IGNORE INTO kg_hierarchy (child_id, parent_id, relation_label)
+            VALUES (?, ?, ?)
+        ''', (child_id, parent_id, relation_label))
 
 def kg_get_ancestors(subject_id, max_depth=4):
     """Walk the hierarchy upward, returning ancestor subjects."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    ancestors = []
-    current_ids = [subject_id]
-    for _ in range(max_depth):
-        if not current_ids:
-            break
-        placeholders = ','.join('?' for _ in current_ids)
-        cursor.execute(f'''
-            SELECT h.parent_id, s.canonical_name, s.subject_type, h.relation_label
+    with transaction(readonly=True) as cursor:
+        return _kg_ancestry(cursor, [subject_id], max_depth).get(subject_id, [])
+
+def _kg_ancestry(cursor, subject_ids, max_depth=4):
+    """
+    Ancestors of several subjects in one recursive query: {subject_id: [...]},
+    nearest level first. UNION (not UNION ALL) collapses diamonds the same way
+    the old level-by-level walk did.
+    """
+    if not subject_ids:
+        return {}
+    placeholders = ','.join('?' for _ in subject_ids)
+    return _kg_ancestry_of(cursor, placeholders, subject_ids, max_depth)
+
+def _kg_ancestry_of(cursor, seed_sql, seed_params, max_depth=4):
+    """_kg_ancestry for the subjects selected by `seed_sql` (an IN-list body or subquery)."""
+    cursor.execute(f'''
+        WITH RECURSIVE walk(root_id, child_id, parent_id, relation_label, depth) AS (
+            SELECT h.child_id, h.child_id, h.parent_id, h.relation_label, 1
             FROM kg_hierarchy h
             JOIN kg_subjects s ON s.subject_id = h.parent_id
-            WHERE h.child_id IN ({placeholders})
-        ''', current_ids)
-        rows = cursor.fetchall()
-        if not rows:
-            break
-        ancestors.extend([dict(r) for r in rows])
-        current_ids = [r['parent_id'] for r in rows]
-    conn.close()
-    return ancestors
+            WHERE h.child_id IN ({seed_sql})
+            UNION
+            SELECT w.root_id, h.child_id, h.parent_id, h.relation_label, w.depth + 1
+            FROM walk w
+            JOIN kg_hierarchy h ON h.child_id = w.parent_id
+            JOIN kg_subjects s ON s.subject_id = h.parent_id
+            WHERE w.depth < ?
+        )
+        SELECT w.root_id, w.parent_id, s.canonical_name, s.subject_type, w.relation_label
+        FROM walk w
+        JOIN kg_subjects s ON s.subject_id = w.parent_id
+        ORDER BY w.root_id, w.depth, w.child_id, w.parent_id
+    ''', (*seed_params, max_depth))
+    ancestry = {}
+    for r in cursor.fetchall():
+        d = dict(r)
+        ancestry.setdefault(d.pop('root_id'), []).append(d)
+    return ancestry
 
 def kg_add_relation(actor_id, subject_id, predicate, object_id=None,
                     object_literal=None, confidence=1.0, source='manual'):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Check if this exact triple already exists
-    # Uniqueness is now (actor_id, subject_id, predicate, object)
-    # This allows a subject to have multiple distinct objects for the same predicate (e.g. likes: Apples, likes: Oranges)
-    cursor.execute('''
-        SELECT relation_id FROM kg_relations 
-        WHERE actor_id = ? AND subject_id = ? AND predicate = ? AND (object_id = ? OR object_literal = ?)
-    ''', (actor_id, subject_id, predicate, object_id, object_literal))
-    existing = cursor.fetchone()
-    
-    if existing:
+    with transaction() as cursor:
+        _kg_upsert_relation(cursor, actor_id, subject_id, predicate, object_id,
+                            object_literal, confidence, source)
+
+def _kg_upsert_relation(cursor, actor_id, subject_id, predicate, object_id=None,
+                        object_literal=None, confidence=1.0, source='manual'):
+    # Uniqueness is (actor_id, subject_id, predicate, object): a subject can have
+    # several distinct objects for the same predicate (e.g. likes: Apples, likes: Oranges).
+    # Re-stating a known triple refreshes its confidence, source and timestamp.
+    cursor.execute(f'''
+        INSERT INTO kg_relations (actor_id, subject_id, predicate, object_id, object_literal, confidence, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT ({_KG_RELATION_KEY}) DO UPDATE SET
+            confidence = excluded.confidence,
+            source     = excluded.source,
+            timestamp  = CURRENT_TIMESTAMP
+    ''', (actor_id, subject_id, predicate, object_id, object_literal, confidence, source))
+
+KG_GRAPH_FIELDS = ('subject_id', 'actor_id', 'canonical_name', 'aliases', 'subject_type', 'description',
+                   'confidence', 'source', 'first_seen', 'last_updated', 'relations', 'ancestors')
+
+def kg_get_revision(actor_id):
+    """Counter bumped by every write to this actor's subjects, relations or hierarchy."""
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT revision FROM kg_revision WHERE actor_id = ?', (actor_id,))
+        row = cursor.fetchone()
+    return row['revision'] if row else 0
+
+def kg_get_graph(actor_id, limit=None, cursor_token=None, fields=None):
+    """
+    Subjects (highest confidence first) with their relations — incoming and
+    outgoing — and ancestors, built with one query per part rather than per
+    subject. `limit` + `cursor_token` page through the subjects (keyset on
+    confidence, subject_id); `fields` restricts each subject to those keys
+    (relations/ancestors are only queried when asked for).
+    Returns {'subjects', 'revision', 'next_cursor'}.
+    """
+    fields = [f for f in (fields or KG_GRAPH_FIELDS) if f in KG_GRAPH_FIELDS]
+    where, params = 'actor_id = ?', [actor_id]
+    if cursor_token:
+        try:
+            conf, sid = cursor_token.split(':', 1)
+            conf, sid = float(conf), int(sid)
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor_token!r}")
+        where += ' AND (confidence < ? OR (confidence = ? AND subject_id > ?))'
+        params += [conf, conf, sid]
+    page_sql = f'SELECT subject_id FROM kg_subjects WHERE {where} ORDER BY confidence DESC, subject_id'
+    if limit:
+        page_sql += f' LIMIT {int(limit)}'
+
+    with transaction(readonly=True) as cursor:
+        cursor.execute('SELECT revision FROM kg_revision WHERE actor_id = ?', (actor_id,))
+        row = cursor.fetchone()
+        revision = row['revision'] if row else 0
+
+        cursor.execute(f'SELECT * FROM kg_subjects WHERE subject_id IN ({page_sql}) '
+                       f'ORDER BY confidence DESC, subject_id', params)
+        subjects = [dict(r) for r in cursor.fetchall()]
+
+        relations = {}
+        if 'relations' in fields and subjects:
+            cursor.execute(f'''
+                SELECT r.*, ss.canonical_name AS subject_name, os.canonical_name AS object_name
+                FROM kg_relations r
+                JOIN kg_subjects ss ON ss.subject_id = r.subject_id
+                LEFT JOIN kg_subjects os ON os.subject_id = r.object_id
+                WHERE r.actor_id = ?
+                  AND (r.subject_id IN ({page_sql}) OR r.object_id IN ({page_sql}))
+                ORDER BY r.confidence DESC, r.timestamp DESC
+            ''', (actor_id, *params, *params))
+            for r in cursor.fetchall():
+                rel = dict(r)
+                relations.setdefault(rel['subject_id'], []).append(rel)
+                if rel['object_id'] is not None and rel['object_id'] != rel['subject_id']:
+                    relations.setdefault(rel['object_id'], []).append(rel)
+
+        ancestry = {}
+        if 'ancestors' in fields and subjects:
+            ancestry = _kg_ancestry_of(cursor, page_sql, params)
+
+    for subject in subjects:
+        subject['relations'] = relations.get(subject['subject_id'], [])
+        subject['ancestors'] = ancestry.get(subject['subject_id'], [])
+    next_cursor = None
+    if limit and len(subjects) == int(limit):
+        last = subjects[-1]
+        next_cursor = f"{last['confidence']!r}:{last['subject_id']}"
+    return {
+        'subjects': [{f: subject[f] for f in fields} for subject in subjects],
+        'revision': revision,
+        'next_cursor': next_cursor,
+    }
+
+
+# --- Per-turn KG self-write ---
+# The model emits kg_entries ({subject, subject_type, source_context,
+# description, relation, object}) with its reply. kg_apply_entries cleans and
+# validates them and writes the whole batch in one transaction; each entry
+# runs under its own savepoint, so a failing entry is undone without losing
+# the rest.
+KG_ALWAYS_VALID_CONTEXTS = {'user_dialogue', 'manual', 'observer'}
+KG_SELF_WRITE_CONFIDENCE = 0.85
+
+def _kg_clean_token(text, max_len=80):
+    """Normalize noisy LLM token strings before KG validation."""
+    if text is None:
+        return ""
+    out = str(text).strip().strip('"').strip("'")
+    out = out.replace('*', '')
+    out = re.sub(r'\s+', ' ', out).strip()
+    if len(out) > max_len:
+        out = out[:max_len].rstrip()
+    return out
+
+
+def _kg_valid_name(name):
+    """Named entities should be concise noun-like labels, not full sentences."""
+    if not name:
+        return False
+    if len(name) < 2 or len(name) > 80:
+        return False
+    if name.endswith(('.', '?', '!', ':', ';')):
+        return False
+    # Block obvious sentence-like fragments.
+    lowered = name.lower()
+    bad_starts = (
+        "i ", "i'm ", "im ", "my ", "we ", "we're ", "you ", "the ", "this ", "that "
+    )
+    if lowered.startswith(bad_starts):
+        return False
+    if len(name.split()) > 8:
+        return False
+    return True
+
+
+def _kg_valid_predicate(predicate):
+    """Predicates should be compact verb labels (no sentence punctuation)."""
+    if not predicate:
+        return False
+    p = predicate.strip().lower()
+    if len(p) < 2 or len(p) > 32:
+        return False
+    if any(ch in p for ch in ".!?,:;"):
+        return False
+    return bool(re.match(r'^[a-z0-9_ -]+$', p))
+
+
+def _kg_check_entry(entry, known_contexts):
+    """Cleaned fields of one kg_entry, or (status, text) when it can't be written."""
+    if not isinstance(entry, dict):
+        return 'skipped', "KG entry is not an object"
+    fields = {
+        'subject':      _kg_clean_token(entry.get('subject')),
+        'subject_type': _kg_clean_token(entry.get('subject_type'), max_len=40),
+        'source':       _kg_clean_token(entry.get('source_context'), max_len=64),
+        'description':  _kg_clean_token(entry.get('description'), max_len=240),
+        'relation':     _kg_clean_token(entry.get('relation'), max_len=32),
+        'object':       _kg_clean_token(entry.get('object')),
+    }
+    # Skip if predicate (relation) is missing or nonsensical
+    if not _kg_valid_predicate(fields['relation']):
+        return 'skipped', f"Skipping malformed relation: '{fields['relation']}'"
+    missing = [f for f, v in [('subject', fields['subject']), ('subject_type', fields['subject_type']),
+                              ('source_context', fields['source'])] if not v]
+    if missing:
+        return 'warn', f"KG entry missing required fields: {', '.join(missing)}"
+    if not _kg_valid_name(fields['subject']):
+        return 'skipped', f"Subject failed quality gate: '{fields['subject']}'"
+    if fields['object'] and not _kg_valid_name(fields['object']):
+        return 'skipped', f"Object failed quality gate: '{fields['object']}'"
+    # Accept: always-valid builtins, existing DB contexts, OR any new
+    # well-formed "type:Title" string (allows creating new contexts on the fly).
+    src = fields['source']
+    if not (src in KG_ALWAYS_VALID_CONTEXTS or src in known_contexts
+            or re.match(r'^[a-zA-Z0-9_]+:[a-zA-Z0-9_]+$', src)):
+        return 'warn', (f"Malformed source_context '{src}'. "
+                        f"Use format type:Title (e.g. show:Death_Note, audiobook:Dune)")
+    return fields
+
+
+def kg_apply_entries(actor_id, entries):
+    """
+    Validate and write one turn's kg_entries in a single transaction.
+    Returns one outcome per entry, in order: {'status', 'text', 'entry'} with
+    status 'written', 'skipped' (quality gate), 'warn' (malformed entry) or
+    'error' (the write itself failed).
+    """
+    outcomes = []
+    with transaction() as cursor:
         cursor.execute('''
-            UPDATE kg_relations 
-            SET confidence=?, source=?, timestamp=CURRENT_TIMESTAMP
-            WHERE relation_id=?
-        ''', (confidence, source, existing['relation_id']))
-    else:
+            SELECT DISTINCT source FROM kg_subjects
+            WHERE actor_id = ? AND source IS NOT NULL AND source != ''
+        ''', (actor_id,))
+        known_contexts = {r['source'] for r in cursor.fetchall()}
+
+        for entry in entries:
+            checked = _kg_check_entry(entry, known_contexts)
+            if isinstance(checked, tuple):
+                outcomes.append({'status': checked[0], 'text': checked[1], 'entry': entry})
+                continue
+            subj, stype, src = checked['subject'], checked['subject_type'], checked['source']
+            rel, obj = checked['relation'], checked['object']
+
+            cursor.execute('SAVEPOINT kg_entry')
+            try:
+                sid = _kg_upsert_subject(cursor, actor_id, subj, stype,
+                                         description=checked['description'] or None,
+                                         source=src, confidence=KG_SELF_WRITE_CONFIDENCE)
+                if rel and obj:
+                    # Resolve object to an ID so relations link properly in both directions
+                    cursor.execute(_kg_lookup_sql('s.subject_id') + ' LIMIT 1', (actor_id, _norm_name(obj)))
+                    existing_obj = cursor.fetchone()
+                    if existing_obj:
+                        oid = existing_obj['subject_id']
+                    else:
+                        oid = _kg_upsert_subject(cursor, actor_id, obj, "Entity", source=src,
+                                                 confidence=KG_SELF_WRITE_CONFIDENCE)
+                    _kg_upsert_relation(cursor, actor_id, sid, rel,
+                                        object_id=oid, object_literal=obj, source=src)
+            except sqlite3.Error as e:
+                cursor.execute('ROLLBACK TO kg_entry')
+                cursor.execute('RELEASE kg_entry')
+                outcomes.append({'status': 'error', 'text': f"KG write failed: {e}", 'entry': entry})
+                continue
+            cursor.execute('RELEASE kg_entry')
+            known_contexts.add(src)
+
+            confirm = f"{subj} [{stype}, ctx: {src}]"
+            if rel and obj:
+                confirm += f" → {rel} → {obj}"
+            outcomes.append({'status': 'written', 'text': confirm, 'entry': entry})
+    if any(o['status'] == 'written' for o in outcomes):
+        _notify_change('kg', actor_id)
+    return outcomes
+
+# --- Subject embeddings ---
+# Vectors are float32 BLOBs keyed by subject; kg_vectors computes and searches
+# them. text_hash identifies the subject text a vector was computed from, so
+# a changed description or alias list marks the row stale.
+
+def kg_embedding_sources(actor_id, model):
+    """Every subject of the actor with the text fields to embed and the text_hash stored for `model`."""
+    with transaction(readonly=True) as cursor:
         cursor.execute('''
-            INSERT INTO kg_relations (actor_id, subject_id, predicate, object_id, object_literal, confidence, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (actor_id, subject_id, predicate, object_id, object_literal, confidence, source))
-        
-    conn.commit()
-    conn.close()
+            SELECT s.subject_id, s.canonical_name, s.subject_type, s.description, s.aliases,
+                   e.text_hash
+            FROM kg_subjects s
+            LEFT JOIN kg_embeddings e ON e.subject_id = s.subject_id AND e.model_used = ?
+            WHERE s.actor_id = ?
+            ORDER BY s.subject_id
+        ''', (model, actor_id))
+        return [dict(r) for r in cursor.fetchall()]
+
+def kg_store_embeddings(model, rows):
+    """Upsert (subject_id, embedding_blob, dim, text_hash) rows computed with `model`."""
+    with transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO kg_embeddings (subject_id, embedding, dim, text_hash, model_used, embedding_json)
+            VALUES (?, ?, ?, ?, ?, NULL)
+            ON CONFLICT (subject_id) DO UPDATE SET
+                embedding      = excluded.embedding,
+                dim            = excluded.dim,
+                text_hash      = excluded.text_hash,
+                model_used     = excluded.model_used,
+                embedding_json = NULL,
+                indexed_at     = CURRENT_TIMESTAMP
+        ''', [(sid, blob, dim, text_hash, model) for sid, blob, dim, text_hash in rows])
+
+def kg_load_embeddings(actor_id, model):
+    """[(subject_id, canonical_name, embedding_blob)] for the actor's subjects embedded with `model`."""
+    with transaction(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT e.subject_id, s.canonical_name, e.embedding
+            FROM kg_embeddings e
+            JOIN kg_subjects s ON s.subject_id = e.subject_id
+            WHERE s.actor_id = ? AND e.model_used = ? AND e.embedding IS NOT NULL
+            ORDER BY e.subject_id
+        ''', (actor_id, model))
+        return [(r['subject_id'], r['canonical_name'], r['embedding']) for r in cursor.fetchall()]
+
 
 def kg_get_relations(actor_id, subject_id, min_confidence=0.5, include_incoming=True):
     """Get relations for a subject. Incoming edges are optional."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    if include_incoming:
-        cursor.execute('''
-            SELECT r.*, ss.canonical_name AS subject_name, os.canonical_name AS object_name
-            FROM kg_relations r
-            JOIN kg_subjects ss ON ss.subject_id = r.subject_id
-            LEFT JOIN kg_subjects os ON os.subject_id = r.object_id
-            WHERE r.actor_id = ?
-              AND (r.subject_id = ? OR r.object_id = ?)
-              AND r.confidence >= ?
-            ORDER BY r.confidence DESC, r.timestamp DESC
-        ''', (actor_id, subject_id, subject_id, min_confidence))
-    else:
-        cursor.execute('''
-            SELECT r.*, ss.canonical_name AS subject_name, os.canonical_name AS object_name
+    with transaction(readonly=True) as cursor:
+        if include_incoming:
+            cursor.execute('''
+                SELECT r.*, ss.canonical_name AS subject_name, os.canonical_name AS object_name
+                FROM kg_relations r
+                JOIN kg_subjects ss ON ss.subject_id = r.subject_id
+                LEFT JOIN kg_subjects os ON os.subject_id = r.object_id
+                WHERE r.actor_id = ?
+                  AND (r.subject_id = ? OR r.object_id = ?)
+                  AND r.confidence >= ?
+                ORDER BY r.confidence DESC, r.timestamp DESC
+            ''', (actor_id, subject_id, subject_id, min_confidence))
+        else:
+            cursor.execute('''
+                SELECT r.*, ss.canonical_name AS subject_name, os.canonical_name AS object_name
+                FROM kg_relations r
+                JOIN kg_subjects ss ON ss.subject_id = r.subject_id
+                LEFT JOIN kg_subjects os ON os.subject_id = r.object_id
+                WHERE r.actor_id = ?
+                  AND r.subject_id = ?
+                  AND r.confidence >= ?
+                ORDER BY r.confidence DESC, r.timestamp DESC
+            ''', (actor_id, subject_id, min_confidence))
+        rows = cursor.fetchall()
+    return [dict(r) for r in rows]
+
+def _kg_top_relations(cursor, actor_id, subject_ids, min_confidence=0.5, per_subject=4):
+    """Strongest outgoing relations of several subjects in one query: {subject_id: [...]}."""
+    if not subject_ids:
+        return {}
+    placeholders = ','.join('?' for _ in subject_ids)
+    cursor.execute(f'''
+        SELECT * FROM (
+            SELECT r.*, ss.canonical_name AS subject_name, os.canonical_name AS object_name,
+                   ROW_NUMBER() OVER (PARTITION BY r.subject_id
+                                      ORDER BY r.confidence DESC, r.timestamp DESC) AS rank
             FROM kg_relations r
             JOIN kg_subjects ss ON ss.subject_id = r.subject_id
             LEFT JOIN kg_subjects os ON os.subject_id = r.object_id
             WHERE r.actor_id = ?
-              AND r.subject_id = ?
+              AND r.subject_id IN ({placeholders})
               AND r.confidence >= ?
-            ORDER BY r.confidence DESC, r.timestamp DESC
-        ''', (actor_id, subject_id, min_confidence))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+        )
+        WHERE rank <= ?
+        ORDER BY subject_id, rank
+    ''', (actor_id, *subject_ids, min_confidence, per_subject))
+    relations = {}
+    for r in cursor.fetchall():
+        relations.setdefault(r['subject_id'], []).append(dict(r))
+    return relations
 
 def kg_retrieve_context(actor_id, names_mentioned, min_confidence=0.5, max_subjects=5,
                         active_context=None):
@@ -973,69 +1964,68 @@ def kg_retrieve_context(actor_id, names_mentioned, min_confidence=0.5, max_subje
     ambiguous names that exist across multiple contexts are listed separately
     so the LLM can distinguish them.
     Returns a formatted string ready for injection into the prompt.
+    Runs three queries however many subjects match: names, ancestry, relations.
     """
     if not names_mentioned:
         return ""
 
-    results = []
-    seen_subject_ids = set()
-
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    for name in names_mentioned[:max_subjects]:
-        # Fetch ALL matching subjects for this name (may be from multiple contexts)
-        cursor.execute(
-            'SELECT * FROM kg_subjects WHERE actor_id = ? AND canonical_name = ? COLLATE NOCASE ORDER BY last_updated DESC',
-            (actor_id, name)
-        )
-        matches = [dict(r) for r in cursor.fetchall()]
-
-        # Also scan aliases
-        if not matches:
-            cursor.execute('SELECT * FROM kg_subjects WHERE actor_id = ?', (actor_id,))
-            for r in cursor.fetchall():
-                try:
-                    aliases = json.loads(r['aliases'] or '[]')
-                    if any(name.lower() == a.lower() for a in aliases):
-                        matches.append(dict(r))
-                except Exception:
-                    pass
-
-        if not matches:
-            continue
-
-        # Sort: active_context first, then by recency
-        if active_context:
-            matches.sort(key=lambda s: (0 if s.get('source') == active_context else 1, s['subject_id'] * -1))
-
-        for subject in matches:
-            sid = subject['subject_id']
-            if sid in seen_subject_ids:
-                continue
-            seen_subject_ids.add(sid)
-
-            conf_label = 'high' if subject['confidence'] >= 0.8 else ('medium' if subject['confidence'] >= 0.5 else 'low')
-            source_tag = f" [ctx: {subject['source']}]" if subject.get('source') else ""
-            line = (f"• {subject['canonical_name']} [{subject['subject_type']}]{source_tag}"
-                    f" — {subject['description'] or 'no description'} (confidence: {conf_label})")
-
-            # Ancestry context
-            ancestors = kg_get_ancestors(sid)
-            if ancestors:
-                ancestry_str = ' → '.join(f"{a['canonical_name']} ({a['relation_label']})" for a in ancestors[:3])
-                line += f"\n  ↳ {ancestry_str}"
-
-            # Relations
-            # Prompt context prefers direct (outgoing) facts to avoid inverted/odd phrasing.
-            relations = kg_get_relations(actor_id, sid, min_confidence, include_incoming=False)
-            for rel in relations[:4]:
-                obj_str = rel.get('object_name') or rel.get('object_literal') or '?'
-                line += f"\n  • {rel['subject_name']} → {rel['predicate']} → {obj_str}"
-
-            results.append(line)
+    names = [_norm_name(name or '') for name in names_mentioned[:max_subjects]]
+    with transaction(readonly=True) as cursor:
+        # Fetch ALL matching subjects for every name (may be from multiple contexts).
+        placeholders = ','.join('?' for _ in names)
+        cursor.execute(f'''
+            SELECT s.*, a.alias_norm, a.is_canonical
+            FROM kg_aliases a
+            JOIN kg_subjects s ON s.subject_id = a.subject_id
+            WHERE a.actor_id = ? AND a.alias_norm IN ({placeholders})
+            ORDER BY a.is_canonical DESC, s.last_updated DESC, s.subject_id DESC
+        ''', (actor_id, *names))
+        by_name = {}
+        for r in cursor.fetchall():
+            by_name.setdefault(r['alias_norm'], []).append(dict(r))
+
+        ordered = []
+        seen_subject_ids = set()
+        for name in names:
+            matches = by_name.get(name, [])
+            # Alias hits only count when no canonical name matches.
+            if matches and matches[0]['is_canonical']:
+                matches = [m for m in matches if m['is_canonical']]
+
+            # Sort: active_context first, then by recency
+            if active_context:
+                matches.sort(key=lambda s: (0 if s.get('source') == active_context else 1, s['subject_id'] * -1))
+
+            for subject in matches:
+                if subject['subject_id'] not in seen_subject_ids:
+                    seen_subject_ids.add(subject['subject_id'])
+                    ordered.append(subject)
+
+        ids = [subject['subject_id'] for subject in ordered]
+        ancestry = _kg_ancestry(cursor, ids)
+        # Prompt context prefers direct (outgoing) facts to avoid inverted/odd phrasing.
+        relations = _kg_top_relations(cursor, actor_id, ids, min_confidence, per_subject=4)
 
-    conn.close()
+    results = []
+    for subject in ordered:
+        sid = subject['subject_id']
+        conf_label = 'high' if subject['confidence'] >= 0.8 else ('medium' if subject['confidence'] >= 0.5 else 'low')
+        source_tag = f" [ctx: {subject['source']}]" if subject.get('source') else ""
+        line = (f"• {subject['canonical_name']} [{subject['subject_type']}]{source_tag}"
+                f" — {subject['description'] or 'no description'} (confidence: {conf_label})")
+
+        # Ancestry context
+        ancestors = ancestry.get(sid)
+        if ancestors:
+            ancestry_str = ' → '.join(f"{a['canonical_name']} ({a['relation_label']})" for a in ancestors[:3])
+            line += f"\n  ↳ {ancestry_str}"
+
+        # Relations
+        for rel in relations.get(sid, []):
+            obj_str = rel.get('object_name') or rel.get('object_literal') or '?'
+            line += f"\n  • {rel['subject_name']} → {rel['predicate']} → {obj_str}"
+
+        results.append(line)
 
     if not results:
         return ""
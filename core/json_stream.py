@@ -0,0 +1,175 @@
+"""
+Incremental field extraction for streamed `format: json` LLM output.
+
+Ollama streams the reply object token by token. IncrementalJSONFieldParser
+consumes those fragments and reports each top-level field of the root object
+the moment its value is closed, so the bridge can react to `response_mode`,
+`action` or `response` long before trailing fields such as `kg_entries` or
+`memory_note` have been generated.
+
+The parser is deliberately forgiving: anything before the first '{' (markdown
+fences, chatter) is skipped, and a field whose raw value fails to decode is
+simply not reported — the full-text parse in chat_bridge remains the
+authority once the stream completes.
+"""
+
+import json
+import re
+
+_SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*(?=\s)|\n+')
+_DANGLING_ESCAPE = re.compile(r'(\\+)(u[0-9a-fA-F]{0,3})?$')
+
+
+class IncrementalJSONFieldParser:
+
+    def __init__(self):
+        self.fields = {}          # key -> decoded value, for every closed top-level field
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._root_closed = False
+        self._in_str = False
+        self._esc = False
+        self._str_start = -1
+        self._expect = "key"      # "key" | "colon" | "value" | "done_value" (tracked at depth 1)
+        self._cur_key = None
+        self._val_start = -1
+        self._val_is_str = False
+
+    def feed(self, chunk):
+        """Consume a text fragment. Returns [(key, value), ...] closed by this fragment."""
+        closed = []
+        if not chunk or self._root_closed:
+            return closed
+        self._buf += chunk
+        buf = self._buf
+        n = len(buf)
+        i = self._pos
+        while i < n:
+            ch = buf[i]
+
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == '\\':
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    if self._depth == 1:
+                        if self._expect == "key":
+                            self._cur_key = self._decode(buf[self._str_start:i + 1])
+                            self._expect = "colon"
+                        elif self._expect == "value" and self._val_is_str:
+                            self._close_value(buf[self._val_start:i + 1], closed)
+                i += 1
+                continue
+
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._expect = "key"
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                self._str_start = i
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1 and self._expect == "value":
+                    self._close_value(buf[self._val_start:i + 1], closed)
+                elif self._depth == 0:
+                    if self._expect == "value" and self._val_start != -1:
+                        self._close_value(buf[self._val_start:i], closed)
+                    self._root_closed = True
+                    i += 1
+                    break
+            elif self._depth == 1:
+                if ch == ':' and self._expect == "colon":
+                    self._expect = "value"
+                    self._val_start = -1
+                    self._val_is_str = False
+                elif ch == ',' and self._expect == "value":
+                    if self._val_start != -1:
+                        self._close_value(buf[self._val_start:i], closed)
+                    self._expect = "key"
+                elif ch == ',':
+                    self._expect = "key"
+
+            if self._depth >= 1 and self._expect == "value" and self._val_start == -1 and not ch.isspace() and ch != ':':
+                # First significant character of a top-level value.
+                self._val_start = i
+                self._val_is_str = ch == '"'
+            i += 1
+        self._pos = i
+        return closed
+
+    def partial_string(self, key):
+        """Decoded text of `key` while its string value is still being streamed.
+
+        Returns the closed value if the field already finished, or None when the
+        field has not started (or is not a string).
+        """
+        if key in self.fields:
+            value = self.fields[key]
+            return value if isinstance(value, str) else None
+        if not (self._in_str and self._val_is_str and self._cur_key == key and self._expect == "value"):
+            return None
+        raw = self._buf[self._val_start + 1:self._pos]
+        # Trim a dangling escape sequence so the prefix decodes cleanly.
+        m = _DANGLING_ESCAPE.search(raw)
+        if m and len(m.group(1)) % 2 == 1:
+            raw = raw[:m.end(1) - 1]
+        try:
+            return json.loads('"' + raw + '"')
+        except Exception:
+            return None
+
+    @property
+    def done(self):
+        return self._root_closed
+
+    def _close_value(self, raw, closed):
+        key = self._cur_key
+        self._expect = "done_value"
+        self._val_start = -1
+        self._val_is_str = False
+        if key is None:
+            return
+        try:
+            value = json.loads(raw.strip())
+        except Exception:
+            return
+        self.fields[key] = value
+        closed.append((key, value))
+
+    @staticmethod
+    def _decode(raw):
+        try:
+            return json.loads(raw)
+        except Exception:
+            return None
+
+
+def split_complete_sentences(text, start=0):
+    """
+    Return (chunk, new_offset) for whole sentences in text[start:], or ("", start).
+
+    Only cuts outside parentheses, so a multi-sentence aside such as
+    "(leans in. Smiles.)" stays in one chunk and is stripped whole before TTS.
+    Callers always resume from a previous cut, so text[start:] opens at depth 0.
+    """
+    last = -1
+    depth = 0
+    pos = start
+    for m in _SENTENCE_END.finditer(text, start):
+        span = text[pos:m.end()]
+        depth = max(0, depth + span.count('(') - span.count(')'))
+        pos = m.end()
+        if depth == 0:
+            last = m.end()
+    if last == -1:
+        return "", start
+    return text[start:last], last
@@ -0,0 +1,342 @@
+"""
+SubjectVectorIndex — semantic recall over knowledge-graph subjects.
+
+extract_subject_names only finds subjects the message names outright. This
+index embeds every subject ("name (type): description; aliases") and lets the
+composer pull in subjects whose meaning is close to the message even when no
+name matches.
+
+  - Vectors are L2-normalised float32, stored as BLOBs in kg_embeddings with a
+    hash of the embedded text, so only new or edited subjects are re-embedded.
+  - Embedders are pluggable. OllamaEmbedder (/api/embeddings) is the real
+    one, opt-in since it needs a second model next to the chat one.
+    HashEmbedder is a deterministic hashed word/trigram stand-in for
+    benchmarks and tests: it only scores lexical overlap, so it is not
+    offered by make_embedder.
+  - Each actor's vectors are held in memory as one matrix (NumPy when
+    installed, plain float arrays otherwise); a search is one matrix-vector
+    product plus a top-k selection.
+  - db_manager reports KG writes ('kg' change topic, e.g. kg_add_subject);
+    the affected actor is re-synced incrementally on a background thread.
+    OllamaEmbedder's subject embeddings go through model_residency like any
+    background job, so they wait rather than evict the chat model.
+  - The query is embedded on the chat path, but OllamaEmbedder only does it
+    when its model is already loaded and no chat turn is generating, with a
+    QUERY_EMBED_TIMEOUT_SEC timeout; otherwise the turn goes without semantic
+    recall (counted in stats()['skipped_queries']).
+"""
+
+import heapq
+import hashlib
+import json
+import math
+import re
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+import db_manager
+from model_residency import residency
+from ollama_client import ollama
+
+try:
+    import numpy as np
+except ImportError:     # pure-Python fallback, fine for a few thousand subjects
+    np = None
+
+EMBED_BATCH = 32
+EMBED_RETRY_SEC = 300       # back-off after the embedder fails (e.g. model not pulled)
+RELATED_TOP_K = 3
+QUERY_EMBED_TIMEOUT_SEC = 2
+
+
+class HashEmbedder:
+    """Deterministic stand-in for benchmarks/tests: signed feature hashing of words and character trigrams."""
+
+    min_score = 0.2     # lexical overlap only, so related texts score lower than with a real model
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def embed(self, texts):
+        return [self._embed_one(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed_one(text)
+
+    def _embed_one(self, text):
+        vec = [0.0] * self.dim
+        words = re.findall(r'\w+', (text or '').lower())
+        features = words + [f"#{w[i:i + 3]}" for w in words for i in range(max(1, len(w) - 2))]
+        for feature in features:
+            h = zlib.crc32(feature.encode('utf-8'))
+            vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vec
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama model via /api/embeddings."""
+
+    min_score = 0.5
+
+    def __init__(self, model="nomic-embed-text"):
+        self.model = model
+        self.name = f"ollama:{model}"
+
+    def embed(self, texts):
+        """Background sync: waits (model_residency) while loading the model would evict chat."""
+        model, keep_alive = residency.background(self.model, workload='embed')
+        return [ollama.embeddings(model, t, keep_alive=keep_alive) for t in texts]
+
+    def embed_query(self, text):
+        """Chat path: None unless the model is already loaded and no chat turn is generating."""
+        if residency.busy() or not residency.is_loaded(self.model):
+            return None
+        return ollama.embeddings(self.model, text, timeout=QUERY_EMBED_TIMEOUT_SEC)
+
+
+def make_embedder(kind, model=None):
+    """'ollama' -> embedder instance (chat_bridge.KG_EMBEDDER)."""
+    if kind == 'ollama':
+        return OllamaEmbedder(model) if model else OllamaEmbedder()
+    raise ValueError(f"Unknown embedder: {kind!r}")
+
+
+def subject_text(subject):
+    """The text a subject is embedded from."""
+    text = f"{subject['canonical_name']} ({subject.get('subject_type') or 'entity'})"
+    if subject.get('description'):
+        text += f": {subject['description']}"
+    try:
+        aliases = json.loads(subject.get('aliases') or '[]')
+    except ValueError:
+        aliases = []
+    if aliases:
+        text += "; also known as " + ", ".join(str(a) for a in aliases)
+    return text
+
+
+def _normalise(vec):
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return array('f', (x / norm for x in vec))
+
+
+def pack(vec):
+    """Normalised float32 little-endian bytes for kg_embeddings.embedding."""
+    out = _normalise(vec)
+    if sys.byteorder != 'little':
+        out.byteswap()
+    return out.tobytes()
+
+
+def unpack(blob):
+    out = array('f')
+    out.frombytes(blob)
+    if sys.byteorder != 'little':
+        out.byteswap()
+    return out
+
+
+class _ActorVectors:
+    """One actor's vectors; the search matrix is rebuilt lazily after changes."""
+
+    def __init__(self, rows):
+        self.rows = rows            # subject_id -> (canonical_name, array('f'))
+        self._ids = None
+        self._matrix = None
+
+    def matrix(self):
+        if self._ids is None:
+            self._ids = list(self.rows)
+            vectors = [self.rows[sid][1] for sid in self._ids]
+            if np is not None:
+                self._matrix = (np.frombuffer(b''.join(v.tobytes() for v in vectors), dtype=np.float32)
+                                .reshape(len(vectors), -1) if vectors else None)
+            else:
+                self._matrix = vectors
+        return self._ids, self._matrix
+
+    def patched(self, updates, live_ids):
+        rows = {sid: row for sid, row in self.rows.items() if sid in live_ids}
+        rows.update(updates)
+        return _ActorVectors(rows)
+
+
+class SubjectVectorIndex:
+
+    def __init__(self, embedder, batch_size=EMBED_BATCH, retry_sec=EMBED_RETRY_SEC):
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.retry_sec = retry_sec
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._actors = {}           # actor_id -> _ActorVectors
+        self._pending = set()
+        self._down_until = 0.0
+        self._thread = None
+        self._closed = False
+        self.last_error = None
+        self.embedded = 0
+        self.searches = 0
+        self.search_ms = 0.0
+        self.skipped_queries = 0
+        db_manager.add_change_listener(self.on_change)
+
+    # ---- sync ----------------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="kg-vectors", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def request_sync(self, actor_id):
+        with self._cond:
+            self._pending.add(actor_id)
+            self._cond.notify_all()
+
+    def on_change(self, topic, actor_id=None):
+        if topic != 'kg':
+            return
+        if actor_id is not None:
+            self.request_sync(actor_id)
+            return
+        with self._lock:
+            actors = list(self._actors)
+        for a in actors:
+            self.request_sync(a)
+
+    def sync(self, actor_id):
+        """Embed the actor's new/edited subjects, store them and refresh its matrix; returns count embedded."""
+        sources = db_manager.kg_embedding_sources(actor_id, self.embedder.name)
+        with self._lock:
+            current = self._actors.get(actor_id)
+        if current is None:
+            current = _ActorVectors({
+                sid: (name, unpack(blob))
+                for sid, name, blob in db_manager.kg_load_embeddings(actor_id, self.embedder.name)
+            })
+
+        stale = []
+        for s in sources:
+            text = subject_text(s)
+            text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if s['text_hash'] != text_hash or s['subject_id'] not in current.rows:
+                stale.append((s['subject_id'], s['canonical_name'], text, text_hash))
+
+        updates = {}
+        for i in range(0, len(stale), self.batch_size):
+            batch = stale[i:i + self.batch_size]
+            vectors = self.embedder.embed([text for _, _, text, _ in batch])
+            rows = []
+            for (sid, name, _, text_hash), vec in zip(batch, vectors):
+                blob = pack(vec)
+                rows.append((sid, blob, len(vec), text_hash))
+                updates[sid] = (name, unpack(blob))
+            db_manager.kg_store_embeddings(self.embedder.name, rows)
+        # Names can change without the vector changing (case-only renames).
+        names = {s['subject_id']: s['canonical_name'] for s in sources}
+        for sid, (name, vec) in current.rows.items():
+            if sid in names and sid not in updates and names[sid] != name:
+                updates[sid] = (names[sid], vec)
+
+        with self._lock:
+            self._actors[actor_id] = current.patched(updates, set(names))
+        self.embedded += len(stale)
+        return len(stale)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._pending or time.time() < self._down_until):
+                    wait = self._down_until - time.time() if self._pending else None
+                    self._cond.wait(timeout=wait if wait and wait > 0 else None)
+                if self._closed:
+                    return
+                actor_id = self._pending.pop()
+            try:
+                count = self.sync(actor_id)
+                if count:
+                    print(f"--- KG Vectors: embedded {count} subject(s) for {actor_id} ---")
+                self.last_error = None
+            except Exception as e:
+                self._embedder_failed(e)
+                self.request_sync(actor_id)
+
+    def _embedder_failed(self, e):
+        self.last_error = str(e)
+        self._down_until = time.time() + self.retry_sec
+        print(f"--- KG Vectors: {self.embedder.name} unavailable ({e}); retrying in {self.retry_sec}s ---")
+
+    # ---- search --------------------------------------------------------
+
+    def search(self, actor_id, text, k=RELATED_TOP_K, min_score=None):
+        """
+        Top-k subjects by cosine similarity: [{'subject_id', 'name', 'score'}], best first.
+        min_score defaults to the embedder's own threshold.
+        """
+        if min_score is None:
+            min_score = getattr(self.embedder, 'min_score', 0.0)
+        with self._lock:
+            vectors = self._actors.get(actor_id)
+        if vectors is None:
+            self.request_sync(actor_id)     # first use: load/embed in the background
+            return []
+        if not vectors.rows or not (text or '').strip() or time.time() < self._down_until:
+            return []
+        start = time.perf_counter()
+        try:
+            query = self.embedder.embed_query(text)
+        except Exception as e:
+            self._embedder_failed(e)
+            return []
+        if query is None:
+            self.skipped_queries += 1
+            return []
+        query = _normalise(query)
+        ids, matrix = vectors.matrix()
+        if len(query) != len(vectors.rows[ids[0]][1]):
+            return []   # embedder changed dimensions; the next sync replaces the vectors
+
+        if np is not None:
+            scores = matrix @ np.frombuffer(query.tobytes(), dtype=np.float32)
+            k = min(k, len(ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            best = sorted(((float(scores[i]), ids[i]) for i in top), reverse=True)
+        else:
+            best = heapq.nlargest(k, ((sum(a * b for a, b in zip(row, query)), sid)
+                                      for sid, row in zip(ids, matrix)))
+        self.searches += 1
+        self.search_ms += (time.perf_counter() - start) * 1000
+        return [{'subject_id': sid, 'name': vectors.rows[sid][0], 'score': round(score, 4)}
+                for score, sid in best if score >= min_score]
+
+    def related_names(self, actor_id, text, k=RELATED_TOP_K, min_score=None):
+        return [hit['name'] for hit in self.search(actor_id, text, k, min_score)]
+
+    # ---- introspection -------------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            actors = {a: len(v.rows) for a, v in self._actors.items()}
+        with self._cond:
+            pending = sorted(self._pending)
+        return {
+            'embedder': self.embedder.name,
+            'numpy': np is not None,
+            'actors': actors,
+            'pending_sync': pending,
+            'embedded': self.embedded,
+            'searches': self.searches,
+            'skipped_queries': self.skipped_queries,
+            'avg_search_ms': round(self.search_ms / self.searches, 3) if self.searches else 0.0,
+            'last_error': self.last_error,
+        }
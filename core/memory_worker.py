@@ -0,0 +1,271 @@
+"""
+MemoryConsolidator — background worker for the hierarchical life story.
+
+Pages, chapters and books used to be written inline after every chat turn,
+so hitting a page boundary blocked the chat worker for one extraction plus up
+to two refinement LLM calls. The chat path now only calls submit(actor_id),
+which queues the work and returns; one daemon thread runs it.
+
+Jobs are idempotent and keyed so they can be submitted any number of times:
+
+  ('page',    actor_id, start_id, end_id)   — one dialogue id range (PAGE_ROWS turns)
+  ('chapter', actor_id, page_count)         — refine 5 pages once page_count hits a multiple of 5
+  ('book',    actor_id, chapter_count)      — refine 5 chapters likewise
+
+A key already queued or running is not queued again, and every job re-checks
+the database before calling the LLM (heartbeat watermark for pages, block
+counts for chapters/books), so a restart, a repeated submit or a memory reset
+never writes the same page twice.
+
+The worker is a low-priority lane: before each job it waits while
+`should_yield()` is true (user/NPC turns queued or running), for at most
+`yield_max_sec` so consolidation cannot be starved forever.
+
+stats() reports pending pages/chapters/books per actor, the running job and
+completed/skipped/failed counters.
+"""
+
+import threading
+import time
+from collections import deque
+
+import db_manager
+
+PAGE_ROWS = 15
+PAGES_PER_CHAPTER = 5
+CHAPTERS_PER_BOOK = 5
+
+JOB_KINDS = ('page', 'chapter', 'book')
+
+
+def heartbeat_key(actor_id):
+    """reality_state key holding the last dialogue id already written into a page."""
+    return f"heartbeat_last_processed_dialogue_id_{actor_id}"
+
+
+class MemoryConsolidator:
+
+    def __init__(self, brain, should_yield=None, notify=None, page_rows=PAGE_ROWS,
+                 yield_poll_sec=0.5, yield_max_sec=120):
+        """
+        Args:
+            brain:          BrainTool providing extract_concepts() and refine_memory().
+            should_yield:   fn() -> truthy while interactive turns need the model.
+            notify:         fn(text) for progress messages (observer feed).
+            page_rows:      Dialogue rows per page.
+            yield_poll_sec: How often a yielding worker re-checks should_yield().
+            yield_max_sec:  Longest a job waits for interactive traffic before running anyway.
+        """
+        self.brain = brain
+        self.should_yield = should_yield
+        self.notify = notify
+        self.page_rows = max(1, int(page_rows))
+        self.yield_poll_sec = yield_poll_sec
+        self.yield_max_sec = yield_max_sec
+        self._cond = threading.Condition()
+        self._queue = deque()       # pending job keys, FIFO
+        self._keys = set()          # keys queued or running
+        self._page_tail = {}        # actor_id -> end_id of the last page queued
+        self._running = None
+        self._closed = False
+        self._thread = None
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.yield_wait_sec = 0.0
+
+    # ---- producer side -------------------------------------------------
+
+    def submit(self, actor_id):
+        """Queue every complete page range not yet written or queued. Cheap; returns jobs added."""
+        try:
+            marker = int(db_manager.get_reality(heartbeat_key(actor_id), "0") or 0)
+        except (TypeError, ValueError):
+            marker = 0
+        with self._cond:
+            after_id = max(marker, self._page_tail.get(actor_id, 0))
+        if db_manager.get_max_dialogue_id(actor_id) <= after_id:
+            return 0
+
+        added = 0
+        while True:
+            chunk = db_manager.get_dialogue_after_id(actor_id, after_id, limit=self.page_rows)
+            if len(chunk) < self.page_rows:
+                break
+            start_id, end_id = int(chunk[0]['id']), int(chunk[-1]['id'])
+            added += self._enqueue(('page', actor_id, start_id, end_id))
+            with self._cond:
+                self._page_tail[actor_id] = max(self._page_tail.get(actor_id, 0), end_id)
+            after_id = end_id
+        return added
+
+    def forget(self, actor_id):
+        """Drop an actor's pending jobs (memory reset). A running job re-checks the DB itself."""
+        with self._cond:
+            kept = deque(k for k in self._queue if k[1] != actor_id)
+            for key in self._queue:
+                if key[1] == actor_id:
+                    self._keys.discard(key)
+            self._queue = kept
+            self._page_tail.pop(actor_id, None)
+
+    def _enqueue(self, key):
+        with self._cond:
+            if key in self._keys:
+                return 0
+            self._keys.add(key)
+            self._queue.append(key)
+            self._cond.notify_all()
+            return 1
+
+    # ---- worker side ---------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="memory-consolidator", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next_key(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            self._running = self._queue.popleft()
+            return self._running
+
+    def _yield_to_interactive(self):
+        if not self.should_yield:
+            return
+        start = time.time()
+        while self.should_yield() and time.time() - start < self.yield_max_sec:
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(timeout=self.yield_poll_sec)
+        self.yield_wait_sec += time.time() - start
+
+    def _worker(self):
+        while True:
+            key = self._next_key()
+            if key is None:
+                break
+            try:
+                self._yield_to_interactive()
+                handler = getattr(self, f"_run_{key[0]}")
+                if handler(*key[1:]):
+                    self.completed += 1
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"--- [Consolidator] {key[0]} job {key[1:]} failed: {e} ---")
+            finally:
+                with self._cond:
+                    self._keys.discard(key)
+                    self._running = None
+
+    def _say(self, text):
+        if self.notify:
+            try:
+                self.notify(text)
+            except Exception:
+                pass
+
+    # ---- jobs ----------------------------------------------------------
+
+    def _run_page(self, actor_id, start_id, end_id):
+        key_processed = heartbeat_key(actor_id)
+        try:
+            marker = int(db_manager.get_reality(key_processed, "0") or 0)
+        except (TypeError, ValueError):
+            marker = 0
+        if marker >= end_id:
+            return False    # already written
+        chunk = db_manager.get_dialogue_after_id(actor_id, marker, limit=self.page_rows)
+        if not chunk or int(chunk[0]['id']) != start_id or int(chunk[-1]['id']) != end_id:
+            # The history changed since this range was queued (reset, or an earlier page
+            # failed); resubmit from the current watermark instead.
+            with self._cond:
+                self._page_tail.pop(actor_id, None)
+            return False
+
+        print(f"--- [Heartbeat: Page] Triggering extraction for {actor_id} over msg_id_{start_id}:{end_id} ---")
+        self._say("📝 Writing a new page in the journal...")
+        ok = self.brain.extract_concepts(
+            actor_id,
+            f"msg_id_{start_id}:{end_id}",
+            dialogue_rows=chunk,
+            start_t=chunk[0].get('timestamp'),
+            end_t=chunk[-1].get('timestamp')
+        )
+        if not ok:
+            print(f"--- [Heartbeat WARN] Page extraction fallback failed for msg_id_{start_id}:{end_id} ---")
+            with self._cond:
+                self._page_tail.pop(actor_id, None)
+            return False
+
+        # Advance marker only after successful write.
+        db_manager.set_reality(key_processed, str(end_id))
+
+        # Everything up to the marker now lives in pages; move it out of the hot table.
+        try:
+            moved = db_manager.archive_dialogue(actor_id, end_id)
+            if moved:
+                print(f"--- [Heartbeat: Archive] Moved {moved} dialogue rows to the archive for {actor_id} ---")
+        except Exception as ae:
+            print(f"Dialogue Archive Error: {ae}")
+
+        page_count = db_manager.get_block_count(actor_id, block_type='page')
+        if page_count > 0 and page_count % PAGES_PER_CHAPTER == 0:
+            self._enqueue(('chapter', actor_id, page_count))
+        return True
+
+    def _run_chapter(self, actor_id, page_count):
+        if db_manager.get_block_count(actor_id, block_type='chapter') >= page_count // PAGES_PER_CHAPTER:
+            return False
+        print(f"--- [Heartbeat: Chapter] Refining {PAGES_PER_CHAPTER} pages into a chapter for {actor_id} ---")
+        self._say("📖 Consolidating pages into a new Chapter...")
+        if not self.brain.refine_memory(actor_id, target_type='chapter'):
+            return False
+        chapter_count = db_manager.get_block_count(actor_id, block_type='chapter')
+        if chapter_count > 0 and chapter_count % CHAPTERS_PER_BOOK == 0:
+            self._enqueue(('book', actor_id, chapter_count))
+        return True
+
+    def _run_book(self, actor_id, chapter_count):
+        if db_manager.get_block_count(actor_id, block_type='book') >= chapter_count // CHAPTERS_PER_BOOK:
+            return False
+        print(f"--- [Heartbeat: Book] Consolidating {CHAPTERS_PER_BOOK} chapters into a book for {actor_id} ---")
+        self._say("📚 Archiving chapters into a new Book of Life...")
+        return bool(self.brain.refine_memory(actor_id, target_type='book'))
+
+    # ---- introspection -------------------------------------------------
+
+    def stats(self):
+        with self._cond:
+            actors = {}
+            for kind, actor_id, *_ in self._queue:
+                pending = actors.setdefault(actor_id, {k: 0 for k in JOB_KINDS})
+                pending[kind] += 1
+            running = None
+            if self._running:
+                running = {'kind': self._running[0], 'actor_id': self._running[1],
+                           'key': list(self._running[2:])}
+            return {
+                'pending': len(self._queue),
+                'pending_by_kind': {k: sum(a[k] for a in actors.values()) for k in JOB_KINDS},
+                'actors': actors,
+                'running': running,
+                'yielding': bool(running and self.should_yield and self.should_yield()),
+                'completed': self.completed,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'yield_wait_sec': round(self.yield_wait_sec, 3),
+            }
@@ -0,0 +1,212 @@
+"""
+ModelResidency — keeps the interactive chat model loaded in Ollama.
+
+Chat turns run the actor's llm_model with keep_alive -1, while BrainTool's
+memory jobs ran their own default model with keep_alive 0: every page written
+either evicted the chat model or, when both used the same model, unloaded it
+outright, and the next user turn paid a full reload. Every Ollama caller now
+tells this module which workload it serves:
+
+  interactive(model)         — each chat turn; remembers the model and when it was last used.
+  generating(model)          — context manager around a chat turn's generation; busy() is
+                               true while one runs, so optional work can stay off the GPU.
+  background(model, workload, allow_resident=None) -> (model, keep_alive)
+                             — before each background LLM call. A job whose model is not
+                               loaded and would take the interactive model's slot is deferred
+                               until the chat model has been idle for INTERACTIVE_IDLE_SEC (at
+                               most BACKGROUND_DEFER_MAX_SEC). A workload allowed to run on
+                               the resident model (RUN_ON_RESIDENT, or allow_resident) is
+                               instead batched onto the interactive model: nothing to load,
+                               but its output comes from the chat model, not the one it asked for.
+  record(workload, model, reply)
+                             — reads load_duration from Ollama's final reply and logs a load
+                               event whenever a call had to load its model.
+
+Resident models come from /api/ps, cached for RESIDENT_POLL_SEC. stats()
+reports them with the workload -> model map, load events and deferrals.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from ollama_client import ollama
+
+# Models Ollama keeps loaded side by side (its own OLLAMA_MAX_LOADED_MODELS; 1 fits a single consumer GPU).
+RESIDENT_MODEL_SLOTS = int(os.environ.get("OLLAMA_MAX_LOADED_MODELS") or 1)
+# Workloads that may run on the resident interactive model instead of loading
+# their own (e.g. {'memory': True}). Anything not listed defers instead.
+RUN_ON_RESIDENT = {}
+# A background job may evict the chat model once no chat turn has used it for this long.
+INTERACTIVE_IDLE_SEC = 300
+BACKGROUND_DEFER_MAX_SEC = 600
+BACKGROUND_KEEP_ALIVE = "5m"
+DEFER_POLL_SEC = 2
+RESIDENT_POLL_SEC = 5
+# Calls whose load_duration exceeds this count as a model load.
+LOAD_EVENT_MIN_MS = 250
+
+
+def _norm(model):
+    """Ollama reports 'name:tag'; a bare name means ':latest'."""
+    if not model:
+        return model
+    return model if ':' in model else model + ':latest'
+
+
+class ModelResidency:
+
+    def __init__(self, client=ollama, slots=RESIDENT_MODEL_SLOTS, event_window=50):
+        self.client = client
+        self.slots = max(1, int(slots))
+        self._lock = threading.Lock()
+        self._workloads = {}            # workload -> model it last ran
+        self._interactive_model = None
+        self._interactive_at = 0.0
+        self._generating = 0
+        self._resident = []
+        self._resident_at = 0.0
+        self._events = deque(maxlen=event_window)
+        self._loads = {}                # model -> {'loads', 'load_ms'}
+        self.redirected = 0
+        self.deferred = 0
+        self.deferred_sec = 0.0
+
+    # ---- workloads -----------------------------------------------------
+
+    def interactive(self, model):
+        with self._lock:
+            self._interactive_model = _norm(model)
+            self._interactive_at = time.monotonic()
+            self._workloads['chat'] = self._interactive_model
+
+    @contextmanager
+    def generating(self, model):
+        self.interactive(model)
+        with self._lock:
+            self._generating += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._generating -= 1
+                self._interactive_at = time.monotonic()
+
+    def busy(self):
+        """True while a chat turn is generating."""
+        with self._lock:
+            return self._generating > 0
+
+    def background(self, model, workload='memory', allow_resident=None):
+        """
+        Pick the model and keep_alive for a background call, waiting while it
+        would evict chat. allow_resident (default: RUN_ON_RESIDENT[workload])
+        lets the call run on the interactive model instead.
+        """
+        model = _norm(model)
+        if allow_resident is None:
+            allow_resident = RUN_ON_RESIDENT.get(workload, False)
+        with self._lock:
+            interactive = self._interactive_model
+        if allow_resident and interactive:
+            if model != interactive:
+                self.redirected += 1
+                print(f"--- Residency: running {workload} on resident {interactive} instead of {model} ---")
+            return interactive, -1
+
+        start = time.monotonic()
+        waited = False
+        while self._would_evict(model) and time.monotonic() - start < BACKGROUND_DEFER_MAX_SEC:
+            with self._lock:
+                idle = time.monotonic() - self._interactive_at
+            if idle >= INTERACTIVE_IDLE_SEC:
+                break
+            if not waited:
+                print(f"--- Residency: deferring {workload} on {model} to keep {interactive} loaded ---")
+                waited = True
+            time.sleep(DEFER_POLL_SEC)
+        if waited:
+            self.deferred += 1
+            self.deferred_sec += time.monotonic() - start
+
+        if model == interactive:
+            return model, -1
+        return model, (0 if self.slots <= 1 else BACKGROUND_KEEP_ALIVE)
+
+    def record(self, workload, model, reply):
+        """Log a load event when Ollama's final reply shows the model had to be loaded."""
+        model = _norm(model)
+        load_ms = ((reply or {}).get('load_duration') or 0) / 1e6
+        with self._lock:
+            self._workloads[workload] = model
+            if load_ms < LOAD_EVENT_MIN_MS:
+                return
+            self._events.append({
+                'time': time.time(),
+                'workload': workload,
+                'model': model,
+                'load_ms': round(load_ms, 1),
+                'resident_before': list(self._resident),
+            })
+            totals = self._loads.setdefault(model, {'loads': 0, 'load_ms': 0.0})
+            totals['loads'] += 1
+            totals['load_ms'] += load_ms
+            self._resident_at = 0.0     # residency changed; re-poll /api/ps
+        print(f"--- Residency: {workload} loaded {model} in {load_ms:.0f} ms ---")
+
+    # ---- residency -----------------------------------------------------
+
+    def resident(self, refresh=False):
+        """Names of the models Ollama has loaded (cached; the last known list if /api/ps fails)."""
+        with self._lock:
+            if not refresh and time.monotonic() - self._resident_at < RESIDENT_POLL_SEC:
+                return list(self._resident)
+        try:
+            names = [m['name'] for m in self.client.running_models()]
+        except Exception as e:
+            print(f"--- Residency: /api/ps failed: {e} ---")
+            with self._lock:
+                return list(self._resident)
+        with self._lock:
+            self._resident = names
+            self._resident_at = time.monotonic()
+        return list(names)
+
+    def is_loaded(self, model):
+        return _norm(model) in self.resident()
+
+    def _would_evict(self, model):
+        with self._lock:
+            interactive = self._interactive_model
+        if not interactive or model == interactive:
+            return False
+        loaded = self.resident()
+        return model not in loaded and interactive in loaded and len(loaded) >= self.slots
+
+    # ---- introspection -------------------------------------------------
+
+    def stats(self):
+        resident = self.resident()
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'resident': resident,
+                'interactive_model': self._interactive_model,
+                'generating': self._generating,
+                'interactive_idle_sec': (round(time.monotonic() - self._interactive_at, 1)
+                                         if self._interactive_model else None),
+                'workloads': dict(self._workloads),
+                'run_on_resident': sorted(w for w, on in RUN_ON_RESIDENT.items() if on),
+                'redirected': self.redirected,
+                'deferred': self.deferred,
+                'deferred_sec': round(self.deferred_sec, 1),
+                'loads': {m: {'loads': t['loads'], 'load_ms': round(t['load_ms'], 1)}
+                          for m, t in self._loads.items()},
+                'load_events': list(self._events),
+            }
+
+
+# Process-wide shared manager.
+residency = ModelResidency()
@@ -0,0 +1,249 @@
+"""
+OllamaClient — the one way every component talks to the local Ollama server.
+
+The bridge, BrainTool and the HUD used to open a fresh urllib connection per
+call, and BrainTool fetched /api/tags before every memory extraction. This
+client keeps a small pool of keep-alive HTTP connections, applies explicit
+connect/read timeouts, retries failed connects and 502/503/504 with
+exponential backoff, and caches the installed model list for
+MODEL_LIST_TTL_SEC (a stale list is returned immediately while a background
+thread refreshes it).
+
+A request that was sent is never retried on a read timeout or a dropped
+connection: a non-streaming /api/chat or /api/generate sends no headers until
+the generation is done, so a retry would run it again. The one exception is a
+pooled keep-alive socket the server had already closed (the send fails, or the
+server disconnects without a byte of response); that request never reached
+Ollama and is resent on a fresh connection.
+"""
+
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+CONNECT_TIMEOUT_SEC = 5
+READ_TIMEOUT_SEC = 300          # model load + long generations
+TAGS_TIMEOUT_SEC = 5
+MAX_RETRIES = 2
+RETRY_BACKOFF_SEC = 0.5         # doubled after every failed attempt
+MAX_IDLE_CONNECTIONS = 4
+IDLE_CONNECTION_TTL_SEC = 30
+MODEL_LIST_TTL_SEC = 30
+
+_RETRY_STATUSES = (502, 503, 504)
+
+
+class OllamaError(Exception):
+    """Ollama answered with an error (`status` set) or could not be reached (`status` None)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class OllamaClient:
+
+    def __init__(self, base_url=OLLAMA_BASE_URL):
+        if "://" not in base_url:
+            base_url = "http://" + base_url
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 11434
+        self._lock = threading.Lock()
+        self._idle = []                 # [(HTTPConnection, last_used)] LIFO
+        self._models = None
+        self._models_at = 0.0
+        self._models_refreshing = False
+
+    # ---- public API ----------------------------------------------------
+
+    def chat(self, payload, timeout=READ_TIMEOUT_SEC):
+        """Non-streaming /api/chat; returns the decoded reply object."""
+        return self.request("POST", "/api/chat", dict(payload, stream=False), timeout=timeout)
+
+    def chat_stream(self, payload, timeout=READ_TIMEOUT_SEC):
+        """Streaming /api/chat; yields each NDJSON chunk until the 'done' chunk."""
+        return self.stream("POST", "/api/chat", dict(payload, stream=True), timeout=timeout)
+
+    def generate(self, payload, timeout=READ_TIMEOUT_SEC):
+        """Non-streaming /api/generate; returns the decoded reply object."""
+        return self.request("POST", "/api/generate", dict(payload, stream=False), timeout=timeout)
+
+    def embeddings(self, model, prompt, timeout=READ_TIMEOUT_SEC, keep_alive=None):
+        """/api/embeddings; returns the embedding vector (list of floats) for one text."""
+        payload = {"model": model, "prompt": prompt}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        data = self.request("POST", "/api/embeddings", payload, timeout=timeout)
+        if not data.get("embedding"):
+            raise OllamaError(f"No embedding returned by {model}")
+        return data["embedding"]
+
+    def running_models(self):
+        """Models currently loaded by the server (/api/ps): [{'name', 'size_vram', 'expires_at'}]."""
+        data = self.request("GET", "/api/ps", timeout=TAGS_TIMEOUT_SEC)
+        return [
+            {'name': m.get("name"), 'size_vram': m.get("size_vram", 0), 'expires_at': m.get("expires_at")}
+            for m in data.get("models", []) if m.get("name")
+        ]
+
+    def list_models(self, refresh=False):
+        """Installed model names, served from a TTL cache.
+
+        A stale cache is returned as-is and refreshed in the background; only
+        the very first call (or refresh=True) waits on /api/tags. Raises
+        OllamaError when Ollama is unreachable and nothing is cached yet.
+        """
+        with self._lock:
+            models = self._models
+            age = time.monotonic() - self._models_at
+            spawn = (not refresh and models is not None and age > MODEL_LIST_TTL_SEC
+                     and not self._models_refreshing)
+            if spawn:
+                self._models_refreshing = True
+        if models is None or refresh:
+            return self._fetch_models()
+        if spawn:
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+        return list(models)
+
+    def invalidate_models(self):
+        with self._lock:
+            self._models_at = 0.0
+
+    # ---- transport -----------------------------------------------------
+
+    def request(self, method, path, payload=None, timeout=READ_TIMEOUT_SEC):
+        conn, resp = self._open(method, path, payload, timeout)
+        try:
+            body = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn, resp)
+        try:
+            return json.loads(body.decode("utf-8") or "{}")
+        except ValueError as e:
+            raise OllamaError(f"Invalid JSON from Ollama {path}: {e}")
+
+    def stream(self, method, path, payload=None, timeout=READ_TIMEOUT_SEC):
+        conn, resp = self._open(method, path, payload, timeout)
+        finished = False
+        try:
+            for line in resp:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = json.loads(line.decode("utf-8"))
+                if chunk.get("error"):
+                    raise OllamaError(chunk["error"])
+                yield chunk
+                if chunk.get("done"):
+                    break
+            resp.read()     # drain the chunked terminator so the connection can be reused
+            finished = True
+        finally:
+            if finished:
+                self._release(conn, resp)
+            else:
+                conn.close()
+
+    def _open(self, method, path, payload, timeout):
+        """Send the request and return (conn, response) once a non-error status arrives."""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        attempt = 0
+        delay = RETRY_BACKOFF_SEC
+        while True:
+            conn, reused = self._acquire()
+            if conn.sock is None:
+                try:
+                    conn.connect()
+                except OSError as e:
+                    conn.close()
+                    if attempt >= MAX_RETRIES:
+                        raise OllamaError(f"Ollama unreachable at {self.host}:{self.port}: {e}")
+                    print(f"--- Ollama: {method} {path} could not connect ({e}), retrying in {delay:.1f}s ---")
+                    attempt += 1
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+            try:
+                conn.sock.settimeout(timeout)
+                conn.request(method, path, body=body, headers=headers)
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused:
+                    continue    # the server closed an idle keep-alive socket; resend on a fresh one
+                raise OllamaError(f"Ollama {method} {path} failed while sending: {e}")
+            try:
+                resp = conn.getresponse()
+            except http.client.RemoteDisconnected as e:
+                conn.close()
+                if reused:
+                    continue    # stale keep-alive socket: closed before the server read the request
+                raise OllamaError(f"Ollama {method} {path} failed: {e}")
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()    # read timeout or dropped connection: the request may be running
+                raise OllamaError(f"Ollama {method} {path} failed after sending: {e}")
+            if resp.status < 400:
+                return conn, resp
+            raw = resp.read()
+            self._release(conn, resp)
+            try:
+                message = json.loads(raw.decode("utf-8")).get("error") or raw.decode("utf-8", "replace")
+            except ValueError:
+                message = raw.decode("utf-8", "replace")
+            if resp.status not in _RETRY_STATUSES or attempt >= MAX_RETRIES:
+                raise OllamaError(f"HTTP {resp.status}: {message}", status=resp.status)
+            print(f"--- Ollama: {method} {path} returned {resp.status}, retrying in {delay:.1f}s ---")
+            attempt += 1
+            time.sleep(delay)
+            delay *= 2
+
+    def _acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used < IDLE_CONNECTION_TTL_SEC:
+                    return conn, True
+                conn.close()
+        return http.client.HTTPConnection(self.host, self.port, timeout=CONNECT_TIMEOUT_SEC), False
+
+    def _release(self, conn, resp):
+        if resp.will_close:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    # ---- model list ----------------------------------------------------
+
+    def _fetch_models(self):
+        data = self.request("GET", "/api/tags", timeout=TAGS_TIMEOUT_SEC)
+        models = [m.get("name") for m in data.get("models", []) if m.get("name")]
+        with self._lock:
+            self._models = models
+            self._models_at = time.monotonic()
+        return list(models)
+
+    def _background_refresh(self):
+        try:
+            self._fetch_models()
+        except Exception as e:
+            print(f"--- Ollama: model list refresh failed: {e} ---")
+        finally:
+            with self._lock:
+                self._models_refreshing = False
+
+
+# Process-wide shared client.
+ollama = OllamaClient()
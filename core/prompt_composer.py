@@ -10,11 +10,28 @@ Assembles the final system prompt from five composable layers:
 
 Falls back gracefully to legacy manifest_data.persona if no identity row exists.
 The `extra_context` argument is the RAG Phase 2 hook — pass pre-fetched chunks there.
+
+Layouts:
+  legacy        — the order above, with the system time inside the identity block.
+  stable_prefix — most-static to most-volatile: rules, action engine, identity,
+                  mood, mode, background | known contexts, time, KG, extra context.
+                  Everything before the '|' is byte-identical across turns while
+                  its inputs are unchanged, so Ollama can reuse the KV cache for it
+                  instead of re-prefilling the whole system prompt every turn.
+
+After each build the composer records how many leading characters matched the
+previous prompt built for the same prefix key (see last_prefix_report()).
+
+The DB-backed sections (identity + interests, mood, mode, action library) are
+cached per actor as prebuilt strings and dropped when db_manager reports a
+write to the underlying data (see db_manager.add_change_listener). Writes made
+by another process are not seen; restart the bridge after offline edits.
 """
 
 import re
 import sys
 import os
+import threading
 from datetime import datetime
 
 # Allow import from either core/ or project root
@@ -23,6 +40,7 @@ if _CORE_DIR not in sys.path:
     sys.path.insert(0, _CORE_DIR)
 
 import db_manager
+from subject_matcher import subject_matcher
 
 
 # ---------------------------------------------------------------------------
@@ -52,38 +70,53 @@ def detect_mode(message: str) -> str:
 def extract_subject_names(message: str, actor_id: str) -> list:
     """
     Extract names from the message that match known KG subjects.
-    Phase 1: scan known canonical names + aliases against message tokens.
-    Phase 2: replace with NER / embedding similarity.
+    Phase 1: canonical names + aliases, matched on word boundaries in one pass
+    over the message by the shared subject_matcher automaton.
+    Embedding similarity is layered on top by PromptComposer's subject_index.
     """
-    subjects = db_manager.kg_get_all_subjects(actor_id)
-    if not subjects:
-        return []
-
-    message_lower = message.lower()
-    found = []
-    for s in subjects:
-        if s['canonical_name'].lower() in message_lower:
-            found.append(s['canonical_name'])
-            continue
-        # Check aliases
-        try:
-            import json
-            aliases = json.loads(s['aliases'] or '[]')
-            for alias in aliases:
-                if alias.lower() in message_lower:
-                    found.append(s['canonical_name'])
-                    break
-        except Exception:
-            pass
-    return list(dict.fromkeys(found))  # deduplicate, preserve order
+    return subject_matcher.subject_names(actor_id, message)
 
 
 # ---------------------------------------------------------------------------
 # PromptComposer
 # ---------------------------------------------------------------------------
 
+PROMPT_LAYOUT_LEGACY = 'legacy'
+PROMPT_LAYOUT_STABLE_PREFIX = 'stable_prefix'
+
+
+# Sections that follow the byte-stable prefix in the stable_prefix layout
+_VOLATILE_SECTIONS = ('known_contexts', 'time', 'kg', 'extra')
+
+# db_manager change topic -> cached sections it invalidates
+_TOPIC_SECTIONS = {
+    'identity':   ('identity',),
+    'interests':  ('identity',),
+    'mood':       ('mood',),
+    'mode':       ('mode',),
+    'animations': ('action_library',),
+}
+
+
+def _speech_rule(mode_id: str) -> str:
+    if mode_id == 'user_dialogue':
+        return "You MUST provide spoken words in the 'response' field."
+    return "Verbal response is OPTIONAL. Use 'absorb' for routine observations."
+
+
 class PromptComposer:
 
+    def __init__(self, layout: str = PROMPT_LAYOUT_LEGACY, subject_index=None):
+        self.layout = layout
+        self.subject_index = subject_index  # kg_vectors.SubjectVectorIndex for semantic recall, optional
+        self._lock = threading.Lock()
+        self._last_prompts = {}     # prefix_key -> previous prompt text
+        self._prefix_reports = {}   # prefix_key -> report for the latest build
+        self._sections = {}         # (section, actor_id, ...) -> prebuilt string or None
+        self._section_stats = {}    # section -> {'hits', 'misses', 'invalidations'}
+        self._generation = 0        # bumped on every invalidation
+        db_manager.add_change_listener(self.invalidate)
+
     def build_system_prompt(
         self,
         actor_id: str,
@@ -94,6 +127,7 @@ class PromptComposer:
         extra_context: str = None,   # RAG Phase 2 hook
         known_contexts: list = None, # Available KG source contexts for self-writing
         active_context: str = None,  # Currently active context (for retrieval ranking)
+        prefix_key: str = None,      # Whose KV cache this prompt lands in (default: actor_id)
     ) -> str:
         """
         Assemble the full system prompt for the given actor and message.
@@ -105,71 +139,242 @@ class PromptComposer:
             legacy_persona:     Fallback persona string if no actor_identity row exists.
             legacy_background:  Fallback background_memory string.
             extra_context:      Pre-fetched RAG chunks (Phase 2).
+            prefix_key:         Key for prefix-reuse tracking; pass the model name when
+                                several actors share one loaded model.
         """
-        sections = []
+        sections = self.compose_sections(
+            actor_id, message, action_library_str, legacy_persona, legacy_background,
+            extra_context, known_contexts, active_context,
+        )
+        return self.join_sections(sections, prefix_key or actor_id)
 
-        # ---- Layer 1: Identity Core ----------------------------------------
-        identity = db_manager.get_actor_identity(actor_id)
+    def compose_sections(
+        self,
+        actor_id: str,
+        message: str,
+        action_library_str: str = '',
+        legacy_persona: str = None,
+        legacy_background: str = None,
+        extra_context: str = None,
+        known_contexts: list = None,
+        active_context: str = None,
+    ) -> list:
+        """
+        Same inputs as build_system_prompt, but returns the ordered, non-empty
+        sections as [(name, text), ...] so a caller (e.g. TokenBudget) can trim
+        them before join_sections(). Names: rules, action_library, identity,
+        mood, mode, background, known_contexts, time, kg, extra.
+        """
+        stable = self.layout == PROMPT_LAYOUT_STABLE_PREFIX
         current_time = datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")
-        
-        if identity:
+        mode_id = detect_mode(message)
+
+        identity_block = self._identity_section(actor_id, legacy_persona, None if stable else current_time)
+        mood_block = self._mood_section(actor_id)
+        mode_block = self._mode_section(actor_id, mode_id, _speech_rule(mode_id) if stable else None)
+
+        # ---- Layer 4: Knowledge Graph Context -----------------------------
+        names = extract_subject_names(message, actor_id)
+        if self.subject_index is not None:
+            # Semantically related subjects the message does not name outright; exact matches stay first.
+            names += [n for n in self.subject_index.related_names(actor_id, message) if n not in names]
+        kg_context = db_manager.kg_retrieve_context(actor_id, names, active_context=active_context)
+        kg_block = f"--- {kg_context}" if kg_context else None
+
+        # ---- Legacy background memory (pre-KG) ---------------------------
+        background_block = f"--- BACKGROUND KNOWLEDGE ---\n{legacy_background}" if legacy_background else None
+
+        # ---- RAG Phase 2 hook ------------------------------------------
+        extra_block = f"--- RETRIEVED CONTEXT ---\n{extra_context}" if extra_context else None
+
+        if not stable:
+            rules_block = self._rules_section(_speech_rule(mode_id))
+            action_block = self._action_section(action_library_str, self._contexts_section(known_contexts))
+            sections = [('identity', identity_block), ('mood', mood_block), ('mode', mode_block),
+                        ('kg', kg_block), ('background', background_block), ('extra', extra_block),
+                        ('rules', rules_block), ('action_library', action_block)]
+            return [(name, text) for name, text in sections if text]
+
+        # Mode-dependent speech rule lives in the mode block, so the rules
+        # block stays identical across user turns and pulses.
+        rules_block = self._rules_section("Follow the SPEECH RULE given under CURRENT MODE below.")
+        action_block = self._action_section(action_library_str, "")
+        time_block = (
+            f"--- CURRENT TIME ---\n"
+            f"Current System Time: {current_time}\n"
+            "CRITICAL: The system time above is the TRUE current date. Always trust it over your internal training data. You are living in the present."
+        )
+        contexts_block = self._contexts_section(known_contexts).strip() if action_library_str else None
+        sections = [('rules', rules_block), ('action_library', action_block), ('identity', identity_block),
+                    ('mood', mood_block), ('mode', mode_block), ('background', background_block),
+                    ('known_contexts', contexts_block), ('time', time_block), ('kg', kg_block),
+                    ('extra', extra_block)]
+        return [(name, text) for name, text in sections if text]
+
+    def join_sections(self, sections: list, prefix_key: str) -> str:
+        """Join compose_sections() output into the prompt and record prefix reuse."""
+        prompt = "\n\n".join(text for _, text in sections)
+        stable_chars = 0
+        if self.layout == PROMPT_LAYOUT_STABLE_PREFIX:
+            static = []
+            for name, text in sections:
+                if name in _VOLATILE_SECTIONS:
+                    break
+                static.append(text)
+            stable_chars = len("\n\n".join(static))
+        self._record_prefix(prefix_key, prompt, stable_chars)
+        return prompt
+
+    def last_prefix_report(self, prefix_key: str) -> dict:
+        """Prefix-reuse report for the latest prompt built under `prefix_key`."""
+        with self._lock:
+            return dict(self._prefix_reports.get(prefix_key) or {})
+
+    def prefix_reports(self) -> dict:
+        with self._lock:
+            return {k: dict(v) for k, v in self._prefix_reports.items()}
+
+    # ------------------------------------------------------------------
+    # Section cache
+    # ------------------------------------------------------------------
+
+    def action_library(self) -> str:
+        """Indexed animations formatted for the prompt (cached until the registry changes)."""
+        return self._cached('action_library', (), self._build_action_library)
+
+    def invalidate(self, topic: str = None, actor_id: str = None):
+        """Drop cached sections for a db_manager change topic (None = everything)."""
+        sections = _TOPIC_SECTIONS.get(topic, ()) if topic else None
+        with self._lock:
+            self._generation += 1
+            for key in list(self._sections):
+                if sections is not None and key[0] not in sections:
+                    continue
+                if actor_id is not None and len(key) > 1 and key[1] != actor_id:
+                    continue
+                del self._sections[key]
+                self._stats_for(key[0])['invalidations'] += 1
+
+    def cache_stats(self) -> dict:
+        with self._lock:
+            return {k: dict(v) for k, v in self._section_stats.items()}
+
+    def _stats_for(self, section):
+        return self._section_stats.setdefault(section, {'hits': 0, 'misses': 0, 'invalidations': 0})
+
+    def _cached(self, section, key, build):
+        full_key = (section,) + key
+        with self._lock:
+            stats = self._stats_for(section)
+            if full_key in self._sections:
+                stats['hits'] += 1
+                return self._sections[full_key]
+            stats['misses'] += 1
+            generation = self._generation
+        value = build()
+        with self._lock:
+            # A write that landed while we were building may have made `value` stale.
+            if generation == self._generation:
+                self._sections[full_key] = value
+        return value
+
+    def _record_prefix(self, key, prompt, stable_chars):
+        with self._lock:
+            previous = self._last_prompts.get(key, '')
+            self._last_prompts[key] = prompt
+            reused = len(os.path.commonprefix([previous, prompt]))
+            self._prefix_reports[key] = {
+                'layout': self.layout,
+                'prompt_chars': len(prompt),
+                'stable_prefix_chars': stable_chars,
+                'reused_prefix_chars': reused,
+                'reused_ratio': round(reused / len(prompt), 3) if prompt else 0.0,
+            }
+
+    # ------------------------------------------------------------------
+    # Section builders
+    # ------------------------------------------------------------------
+
+    def _identity_section(self, actor_id, legacy_persona, current_time):
+        # ---- Layer 1: Identity Core ----------------------------------------
+        body = self._cached('identity', (actor_id,), lambda: self._build_identity_body(actor_id))
+
+        if body is not None:
             id_block = f"--- WHO I AM ---\n"
-            id_block += f"Current System Time: {current_time}\n"
-            id_block += "CRITICAL: The system time above is the TRUE current date. Always trust it over your internal training data. You are living in the present.\n"
-            if identity.get('name'):
-                id_block += f"My name is {identity['name']}.\n"
-            
-            # Inject Interests
-            interests = db_manager.get_actor_interests(actor_id)
-            if interests:
-                id_block += f"Active Interests: {', '.join(interests)}\n"
-            
-            if identity.get('core_traits'):
-                id_block += f"{identity['core_traits']}\n"
-            if identity.get('speech_style'):
-                id_block += f"\nSpeech: {identity['speech_style']}\n"
-            if identity.get('values'):
-                id_block += f"\nValues: {identity['values']}\n"
-            sections.append(id_block.strip())
-        elif legacy_persona:
+            if current_time:
+                id_block += f"Current System Time: {current_time}\n"
+                id_block += "CRITICAL: The system time above is the TRUE current date. Always trust it over your internal training data. You are living in the present.\n"
+            id_block += body
+            return id_block.strip()
+        if legacy_persona:
             # Graceful fallback for actors not yet migrated
-            sections.append(legacy_persona.strip())
+            return legacy_persona.strip()
+        return None
 
+    def _build_identity_body(self, actor_id):
+        identity = db_manager.get_actor_identity(actor_id)
+        if not identity:
+            return None
+        body = ""
+        if identity.get('name'):
+            body += f"My name is {identity['name']}.\n"
+
+        # Inject Interests
+        interests = db_manager.get_actor_interests(actor_id)
+        if interests:
+            body += f"Active Interests: {', '.join(interests)}\n"
+
+        if identity.get('core_traits'):
+            body += f"{identity['core_traits']}\n"
+        if identity.get('speech_style'):
+            body += f"\nSpeech: {identity['speech_style']}\n"
+        if identity.get('values'):
+            body += f"\nValues: {identity['values']}\n"
+        return body
+
+    def _mood_section(self, actor_id):
+        return self._cached('mood', (actor_id,), lambda: self._build_mood_section(actor_id))
+
+    def _build_mood_section(self, actor_id):
         # ---- Layer 2: Mood State -------------------------------------------
         mood_id = db_manager.get_current_mood(actor_id)
         mood = db_manager.get_mood(actor_id, mood_id) if mood_id else None
         if mood and mood.get('behavioral_text'):
-            mood_block = f"--- CURRENT MOOD: {mood['display_name'].upper()} ---\n{mood['behavioral_text']}"
-            sections.append(mood_block)
+            return f"--- CURRENT MOOD: {mood['display_name'].upper()} ---\n{mood['behavioral_text']}"
+        return None
+
+    def _mode_section(self, actor_id, mode_id, speech_rule=None):
+        return self._cached('mode', (actor_id, mode_id, speech_rule),
+                            lambda: self._build_mode_section(actor_id, mode_id, speech_rule))
 
+    def _build_mode_section(self, actor_id, mode_id, speech_rule):
         # ---- Layer 3: Mode / Environmental Rules ---------------------------
-        mode_id = detect_mode(message)
         mode_prompt = db_manager.get_mode_prompt(actor_id, mode_id)
 
+        mode_block = None
         if mode_prompt:
             mode_block = f"--- CURRENT MODE: {mode_prompt['display_name']} ---\n"
             mode_block += f"{mode_prompt['system_text']}"
-            sections.append(mode_block)
-
-        # ---- Layer 4: Knowledge Graph Context -----------------------------
-        names = extract_subject_names(message, actor_id)
-        kg_context = db_manager.kg_retrieve_context(actor_id, names, active_context=active_context)
-        if kg_context:
-            sections.append(f"--- {kg_context}")
-
-        # ---- Legacy background memory (pre-KG) ---------------------------
-        if legacy_background:
-            sections.append(f"--- BACKGROUND KNOWLEDGE ---\n{legacy_background}")
-
-        # ---- RAG Phase 2 hook ------------------------------------------
-        if extra_context:
-            sections.append(f"--- RETRIEVED CONTEXT ---\n{extra_context}")
-
+        if speech_rule:
+            mode_block = mode_block or f"--- CURRENT MODE: {mode_id} ---"
+            mode_block += f"\nSPEECH RULE: {speech_rule}"
+        return mode_block
+
+    def _build_action_library(self):
+        """Formats the indexed animations into a concise string for LLM awareness."""
+        anims = db_manager.get_all_animations()
+        if not anims:
+            return "No special actions available."
+
+        lib_str = "Available Actions:\n"
+        # Sorted so the library text (part of the cached prompt prefix) is deterministic.
+        for a in sorted(anims, key=lambda a: a['filename']):
+            lib_str += f"- {a['filename']} (Purpose: {a['action_purpose']}, Trigger: {a['trigger_condition']})\n"
+        return lib_str
+
+    def _rules_section(self, speech_rule):
         # ---- Layer 5: Universal Performance Rules -------------------------
-        # Dynamically adjust rules based on mode
-        speech_rule = "You MUST provide spoken words in the 'response' field." if mode_id == 'user_dialogue' else "Verbal response is OPTIONAL. Use 'absorb' for routine observations."
-
-        sections.append(f"""--- STRICT DIALOGUE RULES ---
+        return f"""--- STRICT DIALOGUE RULES ---
 1. You are a vocal performer in a recording booth. Your 'response' field is your script.
 2. {speech_rule}
 3. Provide ONLY SPOKEN WORDS. Express emotion through word choice, not symbols.
@@ -187,27 +392,28 @@ IDEAL RESPONSE EXAMPLES (NO ASTERISKS):
 - "Keep your voice down... did you catch that faint sound coming from the hall just now?"
 - "Hmm... give me a moment to think. Actually, I believe the path to the left is our best bet."
 
-THE 'response' FIELD MUST BE CRISP, CLEAN DIALOGUE ONLY. ABSOLUTELY NO ASTERISKS.""")
+THE 'response' FIELD MUST BE CRISP, CLEAN DIALOGUE ONLY. ABSOLUTELY NO ASTERISKS."""
 
-        # ---- Action Reasoning Engine (unchanged from original) -----------
-        if action_library_str:
-            # Build known-contexts block for KG self-write guidance
-            ctx_block = ""
-            if known_contexts:
-                ctx_list = '\n'.join(f'  - {c}' for c in known_contexts)
-                ctx_block = f"""
+    def _contexts_section(self, known_contexts):
+        # Build known-contexts block for KG self-write guidance
+        if known_contexts:
+            ctx_list = '\n'.join(f'  - {c}' for c in known_contexts)
+            return f"""
 --- KNOWN KG CONTEXTS (use EXACT spelling when writing kg_entries) ---
 {ctx_list}
   - user_dialogue   (always valid — for things learned from direct conversation)
 """
-            else:
-                ctx_block = """
+        return """
 --- KNOWN KG CONTEXTS ---
 No contexts yet. You may create a new one using the format: type:SourceName
 Examples: audiobook:We_Are_Legion, show:The_Last_of_Us, user_dialogue
 """
 
-            action_block = f"""
+    def _action_section(self, action_library_str, ctx_block):
+        # ---- Action Reasoning Engine (unchanged from original) -----------
+        if not action_library_str:
+            return None
+        action_block = f"""
 --- ACTION REASONING ENGINE ---
 You have access to a library of physical actions to enhance your performance.
 Before responding, you must REASON about whether a physical gesture is appropriate.
@@ -250,14 +456,14 @@ JSON OUTPUT FORMAT (MANDATORY STRUCTURE):
   "action": "filename.fbx or null",
   "confidence": 0.9,
   "response_mode": "speak | absorb | speak_and_absorb",
-  "memory_note": "Knowledge to save.",
   "search_query": "Search term ONLY if explicitly requested, else null",
   "memory_query": "Name to look up in your Knowledge Graph (e.g. 'Nori'), else null",
-  "kg_entries": [{{"subject": "NamedEntity", "subject_type": "Person/Place/Thing", "source_context": "audiobook:Title", "description": "fact", "relation": "predicate", "object": "NamedEntity"}}] or null,
-  "response": "Clean spoken dialogue."
+  "response": "Clean spoken dialogue.",
+  "memory_note": "Knowledge to save.",
+  "kg_entries": [{{"subject": "NamedEntity", "subject_type": "Person/Place/Thing", "source_context": "audiobook:Title", "description": "fact", "relation": "predicate", "object": "NamedEntity"}}] or null
 }}
 
-CRITICAL: Do NOT add extra fields other than what is listed above. Use EXACTLY these keys.
+CRITICAL: Do NOT add extra fields other than what is listed above. Use EXACTLY these keys, in EXACTLY this order.
 If response_mode is 'speak', you MUST fill the 'response' field with dialogue.
 
 kg_entries RULES:
@@ -265,6 +471,4 @@ kg_entries RULES:
 - OMIT kg_entries entirely (do not include the key at all) for vague references, pronouns, or purely conversational turns.
 - source_context MUST exactly match one of the listed KNOWN KG CONTEXTS.
 - If the source is a new audiobook or show not yet listed, create it as: audiobook:Title or show:Title."""
-            sections.append(action_block.strip())
-
-        return "\n\n".join(sections)
+        return action_block.strip()
@@ -0,0 +1,180 @@
+"""
+SubjectMatcher — find the KG subjects a text mentions in one pass over the text.
+
+extract_subject_names (prompt composer, every turn) and BrainTool._link_to_kg
+(every memory block) used to load all of an actor's subjects and test
+`name in text` for each one, plus a JSON alias parse per subject, so their
+cost grew with the size of the knowledge graph. Both now share one
+Aho-Corasick automaton per actor over every canonical name and alias
+(kg_aliases), so a match costs O(len(text) + matches).
+
+  - Case-folded: patterns and text are str.casefold()ed.
+  - Word-boundary aware: "Nori" matches "Nori's bowl" but not "Noriko"; a
+    pattern edge that is not a word character (e.g. "C++") needs no boundary.
+  - Kept current by the trigger-maintained kg_revision counter, so writes from
+    other processes (HUD, tools) are seen too. When the revision moves, the
+    alias rows are diffed against the automaton and only added/removed
+    patterns are applied; failure links are rebuilt lazily before the next
+    search.
+"""
+
+import threading
+from collections import deque
+
+import db_manager
+
+
+class AhoCorasick:
+    """Multi-pattern automaton; patterns map to sets of values and can be added/removed between searches."""
+
+    def __init__(self):
+        self._goto = [{}]           # node -> {char: child node}
+        self._fail = [0]
+        self._term = [None]         # node -> pattern ending here, if it has values
+        self._next_term = [0]       # node -> nearest terminal node along the failure chain (0 = none)
+        self._values = {}           # pattern -> set of values
+        self._stale = False
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, pattern, value):
+        if not pattern:
+            return
+        values = self._values.setdefault(pattern, set())
+        if not values:
+            node = 0
+            for ch in pattern:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][ch] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._term.append(None)
+                    self._next_term.append(0)
+                node = child
+            self._term[node] = pattern
+            self._stale = True
+        values.add(value)
+
+    def remove(self, pattern, value):
+        values = self._values.get(pattern)
+        if not values:
+            return
+        values.discard(value)
+        if values:
+            return
+        del self._values[pattern]
+        node = 0
+        for ch in pattern:
+            node = self._goto[node][ch]
+        self._term[node] = None     # the trie path stays; only its output goes
+        self._stale = True
+
+    def _build(self):
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._next_term[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._next_term[child] = fail if self._term[fail] is not None else self._next_term[fail]
+                queue.append(child)
+        self._stale = False
+
+    def finditer(self, text):
+        """Yield (start, end, pattern) for every occurrence, overlapping ones included."""
+        if self._stale:
+            self._build()
+        goto, fail, term, next_term = self._goto, self._fail, self._term, self._next_term
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            out = node if term[node] is not None else next_term[node]
+            while out:
+                pattern = term[out]
+                yield i + 1 - len(pattern), i + 1, pattern
+                out = next_term[out]
+
+    def values(self, pattern):
+        return self._values.get(pattern, ())
+
+
+def _is_word(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class SubjectMatcher:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._actors = {}   # actor_id -> {'revision', 'automaton', 'entries': {(pattern, sid)}, 'names': {sid: name}}
+        self.rebuilds = 0
+
+    def _state(self, actor_id):
+        revision = db_manager.kg_get_revision(actor_id)
+        with self._lock:
+            state = self._actors.get(actor_id)
+            if state is not None and state['revision'] == revision:
+                return state
+        revision, rows = db_manager.kg_get_alias_patterns(actor_id)
+        entries = {(alias.casefold(), sid) for alias, sid, _ in rows if alias and alias.strip()}
+        names = {sid: name for _, sid, name in rows}
+        with self._lock:
+            state = self._actors.setdefault(actor_id, {
+                'revision': None, 'automaton': AhoCorasick(), 'entries': set(), 'names': {},
+            })
+            automaton = state['automaton']
+            for pattern, sid in state['entries'] - entries:
+                automaton.remove(pattern, sid)
+            for pattern, sid in entries - state['entries']:
+                automaton.add(pattern, sid)
+            state.update(revision=revision, entries=entries, names=names)
+            self.rebuilds += 1
+            return state
+
+    def matches(self, actor_id, text):
+        """[(subject_id, canonical_name)] mentioned in `text`, in order of first mention."""
+        if not text:
+            return []
+        state = self._state(actor_id)
+        folded = text.casefold()
+        found = {}
+        with self._lock:
+            for start, end, pattern in state['automaton'].finditer(folded):
+                if start > 0 and _is_word(pattern[0]) and _is_word(folded[start - 1]):
+                    continue
+                if end < len(folded) and _is_word(pattern[-1]) and _is_word(folded[end]):
+                    continue
+                for sid in sorted(state['automaton'].values(pattern)):
+                    found.setdefault(sid, start)
+            names = state['names']
+        return [(sid, names.get(sid)) for sid in sorted(found, key=found.get)]
+
+    def subject_names(self, actor_id, text):
+        return [name for _, name in self.matches(actor_id, text)]
+
+    def subject_ids(self, actor_id, text):
+        return [sid for sid, _ in self.matches(actor_id, text)]
+
+    def invalidate(self, actor_id=None):
+        with self._lock:
+            if actor_id is None:
+                self._actors.clear()
+            else:
+                self._actors.pop(actor_id, None)
+
+
+# Process-wide shared matcher (prompt composer and BrainTool).
+subject_matcher = SubjectMatcher()
@@ -0,0 +1,149 @@
+"""
+TokenBudget — keeps an Ollama chat request inside its context window.
+
+The system prompt (rules + action library + identity + KG + background +
+extra context), the chat history and any images are estimated in tokens and,
+if they would not leave `num_predict` tokens free for the reply, trimmed in
+this order:
+
+  1. history     — oldest turns first, down to `min_history` messages
+  2. kg          — whole subject entries from the end of WHAT I KNOW
+  3. background  — truncated from the end
+  4. extra       — retrieved/observer context, truncated from the end
+  5. history     — down to the triggering message itself
+
+Rules, action library, identity, mood, mode and time are never trimmed.
+With `dynamic_ctx` the plan also picks num_ctx: the smallest multiple of
+`ctx_step` that fits (never below the configured num_ctx, never above
+`max_ctx`). Changing num_ctx makes Ollama reload the model, so the step
+should be coarse.
+
+Token counts are estimates (characters / CHARS_PER_TOKEN), erring high.
+"""
+
+import math
+
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4     # role markers / separators per chat message
+IMAGE_TOKENS = 576              # typical vision-projector cost per image
+
+_TRUNCATION_MARK = "\n[…trimmed]"
+
+
+def estimate_tokens(text) -> int:
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _message_tokens(msg) -> int:
+    return estimate_tokens(msg.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+
+
+class BudgetPlan:
+
+    def __init__(self, sections, history, num_ctx, report):
+        self.sections = sections    # [(name, text)] ready for PromptComposer.join_sections
+        self.history = history      # trimmed chat messages
+        self.num_ctx = num_ctx
+        self.report = report        # per-section token counts and what was trimmed
+
+
+class TokenBudget:
+
+    def __init__(self, num_ctx=4096, num_predict=1024, dynamic_ctx=False,
+                 max_ctx=16384, ctx_step=2048, min_history=4):
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.dynamic_ctx = dynamic_ctx
+        self.max_ctx = max(max_ctx, num_ctx)
+        self.ctx_step = ctx_step
+        self.min_history = min_history
+
+    def fit(self, sections, history, images=None) -> BudgetPlan:
+        sections = list(sections)
+        history = list(history or [])
+        image_tokens = IMAGE_TOKENS * len(images or [])
+        window = self.max_ctx if self.dynamic_ctx else self.num_ctx
+        limit = window - self.num_predict
+        trimmed = {}
+
+        def section_tokens():
+            # Sections are joined with blank lines into one system message.
+            return sum(estimate_tokens(text) + 1 for _, text in sections) + MESSAGE_OVERHEAD_TOKENS
+
+        def total():
+            return section_tokens() + sum(_message_tokens(m) for m in history) + image_tokens
+
+        def trim_history(keep):
+            dropped = 0
+            while total() > limit and len(history) > keep:
+                history.pop(0)
+                dropped += 1
+            # Don't open the conversation with an orphaned assistant reply.
+            while len(history) > keep and history[0].get('role') == 'assistant':
+                history.pop(0)
+                dropped += 1
+            if dropped:
+                trimmed['history'] = trimmed.get('history', 0) + dropped
+
+        def trim_section(name, shrink):
+            for i, (sec_name, text) in enumerate(sections):
+                if sec_name != name:
+                    continue
+                over = total() - limit
+                if over <= 0:
+                    return
+                new_text = shrink(text, estimate_tokens(text) - over)
+                if new_text:
+                    sections[i] = (name, new_text)
+                else:
+                    del sections[i]
+                trimmed[name] = estimate_tokens(text) - estimate_tokens(new_text)
+                return
+
+        if total() > limit:
+            trim_history(self.min_history)
+            trim_section('kg', self._shrink_kg)
+            trim_section('background', self._shrink_text)
+            trim_section('extra', self._shrink_text)
+            trim_history(1)
+
+        used = total()
+        num_ctx = self.num_ctx
+        if self.dynamic_ctx:
+            needed = used + self.num_predict
+            num_ctx = min(self.max_ctx, max(self.num_ctx, int(math.ceil(needed / self.ctx_step)) * self.ctx_step))
+
+        report = {
+            'sections': {name: estimate_tokens(text) for name, text in sections},
+            'history_tokens': sum(_message_tokens(m) for m in history),
+            'history_messages': len(history),
+            'image_tokens': image_tokens,
+            'prompt_tokens': used,
+            'num_predict': self.num_predict,
+            'num_ctx': num_ctx,
+            'over_budget': used > num_ctx - self.num_predict,
+            'trimmed': trimmed,
+        }
+        return BudgetPlan(sections, history, num_ctx, report)
+
+    @staticmethod
+    def _shrink_kg(text, max_tokens):
+        """Drop whole subject entries ('\\n• ...' blocks) from the end until it fits."""
+        header, _, body = text.partition("\n• ")
+        if not body:
+            return TokenBudget._shrink_text(text, max_tokens)
+        entries = ["• " + body.split("\n• ")[0]] + ["• " + e for e in body.split("\n• ")[1:]]
+        while entries and estimate_tokens("\n".join([header] + entries)) > max_tokens:
+            entries.pop()
+        return "\n".join([header] + entries) if entries else ""
+
+    @staticmethod
+    def _shrink_text(text, max_tokens):
+        max_chars = int(max_tokens * CHARS_PER_TOKEN) - len(_TRUNCATION_MARK)
+        if max_chars <= 0:
+            return ""
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars].rstrip() + _TRUNCATION_MARK
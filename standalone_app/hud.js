@@ -627,7 +627,8 @@ async function handleCharacterChat(text, imageJson) {
         console.log("[HUD] Chat status:", result.status);
 
         // 2. Listen for Response Stream (SSE)
-        const eventSource = new EventSource(`${BRIDGE_URL}/stream_audio`);
+        const turnQuery = result.turn_id ? `?turn_id=${encodeURIComponent(result.turn_id)}` : "";
+        const eventSource = new EventSource(`${BRIDGE_URL}/stream_audio${turnQuery}`);
 
         // Safety Watchdog: Reset streaming state if hanging for 15s without activity
         let watchdog = setTimeout(() => {
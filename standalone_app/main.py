@@ -2,7 +2,6 @@ import os
 import sys
 import threading
 import json
-import urllib.request
 import time
 import tempfile
 import subprocess
@@ -29,6 +28,7 @@ PROJECT_ROOT = os.path.dirname(MAIN_DIR)
 
 sys.path.append(os.path.join(PROJECT_ROOT, "core"))
 import db_manager
+from ollama_client import ollama
 
 # --- MONITOR CAPTURE CONFIG ---
 # Set to the monitor you want the Observer to watch.
@@ -411,10 +411,7 @@ class HUDAPI:
     def get_available_models(self):
         """Fetches available models from Ollama API."""
         try:
-            req = urllib.request.Request("http://localhost:11434/api/tags")
-            with urllib.request.urlopen(req) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                return [m.get('name') for m in data.get('models', [])]
+            return ollama.list_models()
         except Exception as e:
             print(f"[HUD] Failed to fetch Ollama models: {e}")
             return ["fimbulvetr-v2.1:latest"] # Fallback
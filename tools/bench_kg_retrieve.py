@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark kg_retrieve_context on a synthetic knowledge graph.
+
+Builds a throwaway database with N subjects (hierarchy chains, aliases and
+several relations each), then times the set-based kg_retrieve_context against
+the previous per-subject implementation (one ancestry query per level and one
+relations query per matched subject) and checks both produce identical text.
+
+Usage:
+  python3 tools/bench_kg_retrieve.py
+  python3 tools/bench_kg_retrieve.py --subjects 50000 --names 5 --rounds 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "core"))
+
+import db_manager  # noqa: E402
+
+ACTOR = "bench_actor"
+CONTEXTS = ["user_dialogue", "audiobook:Dune", "show:Death_Note", "observer"]
+
+
+def build_graph(n_subjects: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    names = [f"Subject_{i}" for i in range(n_subjects)]
+    with db_manager.transaction() as cur:
+        cur.executemany(
+            "INSERT INTO kg_subjects (actor_id, canonical_name, aliases, subject_type, description, confidence, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (ACTOR, name, f'["alias {i}"]', "concept", f"description of {name}",
+                 rng.uniform(0.4, 1.0), rng.choice(CONTEXTS))
+                for i, name in enumerate(names)
+            ],
+        )
+        cur.execute("SELECT subject_id FROM kg_subjects WHERE actor_id = ? ORDER BY subject_id", (ACTOR,))
+        ids = [r[0] for r in cur.fetchall()]
+        # Every subject gets a parent (chains up to depth ~6) and a few relations.
+        cur.executemany(
+            "INSERT OR IGNORE INTO kg_hierarchy (child_id, parent_id, relation_label) VALUES (?, ?, ?)",
+            [(ids[i], ids[i // 2], rng.choice(["is_a", "part_of"])) for i in range(1, len(ids))],
+        )
+        cur.executemany(
+            "INSERT INTO kg_relations (actor_id, subject_id, predicate, object_id, object_literal, confidence, source) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (ACTOR, sid, rng.choice(["likes", "knows", "fears", "owns"]), oid, None,
+                 rng.uniform(0.3, 1.0), "manual")
+                for sid in ids
+                for oid in rng.sample(ids, 6)
+            ],
+        )
+    return names
+
+
+def legacy_ancestors(subject_id: int, max_depth: int = 4) -> list:
+    with db_manager.transaction(readonly=True) as cursor:
+        ancestors = []
+        current_ids = [subject_id]
+        for _ in range(max_depth):
+            if not current_ids:
+                break
+            placeholders = ','.join('?' for _ in current_ids)
+            cursor.execute(f'''
+                SELECT h.parent_id, s.canonical_name, s.subject_type, h.relation_label
+                FROM kg_hierarchy h
+                JOIN kg_subjects s ON s.subject_id = h.parent_id
+                WHERE h.child_id IN ({placeholders})
+            ''', current_ids)
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ancestors.extend([dict(r) for r in rows])
+            current_ids = [r['parent_id'] for r in rows]
+    return ancestors
+
+
+def legacy_retrieve_context(actor_id, names_mentioned, min_confidence=0.5, max_subjects=5, active_context=None):
+    """The per-subject implementation kg_retrieve_context replaced."""
+    results = []
+    seen = set()
+    for name in names_mentioned[:max_subjects]:
+        subject = db_manager.kg_get_subject(actor_id, name)
+        if not subject or subject['subject_id'] in seen:
+            continue
+        sid = subject['subject_id']
+        seen.add(sid)
+        conf_label = 'high' if subject['confidence'] >= 0.8 else ('medium' if subject['confidence'] >= 0.5 else 'low')
+        source_tag = f" [ctx: {subject['source']}]" if subject.get('source') else ""
+        line = (f"• {subject['canonical_name']} [{subject['subject_type']}]{source_tag}"
+                f" — {subject['description'] or 'no description'} (confidence: {conf_label})")
+        ancestors = legacy_ancestors(sid)
+        if ancestors:
+            line += "\n  ↳ " + ' → '.join(f"{a['canonical_name']} ({a['relation_label']})" for a in ancestors[:3])
+        for rel in db_manager.kg_get_relations(actor_id, sid, min_confidence, include_incoming=False)[:4]:
+            obj_str = rel.get('object_name') or rel.get('object_literal') or '?'
+            line += f"\n  • {rel['subject_name']} → {rel['predicate']} → {obj_str}"
+        results.append(line)
+    return "WHAT I KNOW:\n" + "\n".join(results) if results else ""
+
+
+def timed(fn, queries) -> float:
+    start = time.perf_counter()
+    for names in queries:
+        fn(ACTOR, names)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--subjects", type=int, default=10000)
+    parser.add_argument("--names", type=int, default=5, help="names mentioned per query")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_PATH = str(Path(tmp) / "bench.db")
+        db_manager.init_db()
+        t0 = time.perf_counter()
+        names = build_graph(args.subjects, args.seed)
+        print(f"Built {args.subjects} subjects in {time.perf_counter() - t0:.1f}s")
+
+        rng = random.Random(args.seed)
+        queries = [rng.sample(names, args.names) for _ in range(args.rounds)]
+
+        mismatches = sum(
+            legacy_retrieve_context(ACTOR, q) != db_manager.kg_retrieve_context(ACTOR, q) for q in queries
+        )
+        legacy_ms = timed(legacy_retrieve_context, queries)
+        current_ms = timed(db_manager.kg_retrieve_context, queries)
+
+    print(f"legacy (per subject): {legacy_ms:8.2f} ms/query")
+    print(f"set-based:            {current_ms:8.2f} ms/query  ({legacy_ms / current_ms:.1f}x)")
+    print(f"output mismatches:    {mismatches} / {len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
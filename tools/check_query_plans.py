@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Check that the hot queries are served by indexes.
+
+Creates a throwaway database with init_db (so every schema migration runs),
+asks SQLite for EXPLAIN QUERY PLAN of each hot query and fails if a query
+scans its table or misses the index it is expected to use.
+
+Usage:
+  python3 tools/check_query_plans.py            # fresh database
+  python3 tools/check_query_plans.py --db core/persistence.db
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "core"))
+
+import db_manager  # noqa: E402
+
+# (label, sql, params, index the plan must mention)
+HOT_QUERIES: List[Tuple[str, str, tuple, str]] = [
+    ("recent history",
+     "SELECT role, content FROM memory_dialogue WHERE actor_id = ? ORDER BY id DESC LIMIT ?",
+     ("a", 15), "idx_memory_dialogue_actor_id"),
+    ("dialogue after watermark",
+     "SELECT id, role, content, timestamp FROM memory_dialogue WHERE actor_id = ? AND id > ? ORDER BY id ASC LIMIT ?",
+     ("a", 0, 15), "idx_memory_dialogue_actor_id"),
+    ("max dialogue id",
+     "SELECT MAX(id) FROM memory_dialogue WHERE actor_id = ?",
+     ("a",), "idx_memory_dialogue_actor_id"),
+    ("memory blocks by type",
+     "SELECT * FROM memory_blocks WHERE actor_id = ? AND block_type = ? ORDER BY timestamp DESC LIMIT ?",
+     ("a", "page", 5), "idx_memory_blocks_actor_type_time"),
+    ("outgoing relations",
+     "SELECT * FROM kg_relations WHERE actor_id = ? AND subject_id = ? AND confidence >= ? "
+     "ORDER BY confidence DESC",
+     ("a", 1, 0.5), "idx_kg_relations_actor_subject_conf"),
+    ("hierarchy children",
+     "SELECT child_id FROM kg_hierarchy WHERE parent_id = ?",
+     (1,), "idx_kg_hierarchy_parent"),
+    ("alias lookup",
+     db_manager._kg_lookup_sql(),
+     ("a", "nori"), "PRIMARY KEY"),
+    ("subject by name",
+     "SELECT subject_id FROM kg_subjects WHERE actor_id = ? AND canonical_name = ? COLLATE NOCASE",
+     ("a", "Nori"), "idx_kg_subjects_unique_name"),
+    ("blocks by concept",
+     "SELECT block_id FROM memory_block_concepts WHERE actor_id = ? AND concept_norm = ? "
+     "ORDER BY block_time DESC LIMIT ?",
+     ("a", "music", 10), "idx_memory_block_concepts_actor_concept"),
+    ("concepts in a time range",
+     "SELECT concept_norm, COUNT(*) FROM memory_block_concepts WHERE actor_id = ? "
+     "AND block_time >= ? AND block_time <= ? GROUP BY +concept_norm",
+     ("a", "2026-01-01", "2026-02-01"), "idx_memory_block_concepts_actor_time"),
+]
+
+
+def explain(cursor, sql: str, params: tuple) -> List[str]:
+    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row["detail"] for row in cursor.fetchall()]
+
+
+def check(cursor) -> int:
+    failures = 0
+    for label, sql, params, expected in HOT_QUERIES:
+        plan = explain(cursor, sql, params)
+        first = plan[0] if plan else ""
+        ok = expected in first and not first.startswith("SCAN")
+        failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {label}: {' | '.join(plan)}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", help="Check an existing database (migrations are applied to it)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_PATH = str(Path(args.db).resolve()) if args.db else str(Path(tmp) / "plans.db")
+        db_manager.init_db()
+        print(f"Schema version: {db_manager.get_schema_version()}")
+        with db_manager.transaction(readonly=True) as cursor:
+            failures = check(cursor)
+
+    if failures:
+        raise SystemExit(f"{failures} hot quer{'y' if failures == 1 else 'ies'} not using the expected index")
+    print("All hot queries use their indexes.")
+
+
+if __name__ == "__main__":
+    main()
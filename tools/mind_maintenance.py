@@ -12,6 +12,7 @@ from __future__ import annotations
 import argparse
 import json
 import sqlite3
+import sys
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple
@@ -21,6 +22,9 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DB_PATH = PROJECT_ROOT / "core" / "persistence.db"
 BACKUP_DIR = PROJECT_ROOT / "core" / "mind_backups"
 
+sys.path.insert(0, str(PROJECT_ROOT / "core"))
+import db_manager  # noqa: E402
+
 
 BAD_MEMORY_PHRASES = [
     "even if fabricated",
@@ -35,9 +39,14 @@ BAD_BLOCK_PHRASES = [
 
 
 def connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # init_db brings older databases up to date (archive table, views).
+    # A plain sqlite3 connection won't do: db_manager's registers
+    # dialogue_text() for the memory_dialogue_all view (hot + archived
+    # dialogue), norm_name() for the KG alias triggers, and the TEMP trigger
+    # that un-indexes deleted archive rows from full-text search.
+    db_manager.DB_PATH = str(DB_PATH)
+    db_manager.init_db()
+    return db_manager.get_connection()
 
 
 def normalize_name(name: str) -> str:
@@ -92,7 +101,8 @@ def backup_actor(conn: sqlite3.Connection, actor_id: str) -> Path:
         ],
         "memory_dialogue": [
             dict(r) for r in cur.execute(
-                "SELECT * FROM memory_dialogue WHERE actor_id = ? ORDER BY id", (actor_id,)
+                "SELECT id, actor_id, role, content, timestamp FROM memory_dialogue_all "
+                "WHERE actor_id = ? ORDER BY id", (actor_id,)
             ).fetchall()
         ],
         "memory_blocks": [
@@ -157,7 +167,7 @@ def collect_plan(conn: sqlite3.Connection, actor_id: str) -> Dict:
     for phrase in BAD_MEMORY_PHRASES:
         rows = cur.execute(
             """
-            SELECT id FROM memory_dialogue
+            SELECT id FROM memory_dialogue_all
             WHERE actor_id = ? AND role = 'memory' AND lower(content) LIKE ?
             """,
             (actor_id, f"%{phrase.lower()}%"),
@@ -236,13 +246,8 @@ def apply_plan(conn: sqlite3.Connection, actor_id: str, plan: Dict) -> Dict[str,
         "memory_blocks_deleted": 0,
     }
 
-    for sid, _old, new in plan["renames"]:
-        cur.execute(
-            "UPDATE kg_subjects SET canonical_name = ?, last_updated = CURRENT_TIMESTAMP WHERE subject_id = ?",
-            (new, sid),
-        )
-        stats["subjects_renamed"] += cur.rowcount
-
+    # Merges run before renames: subject names are unique per actor (case-insensitive),
+    # so a winner can only take a loser's spelling once the loser is gone.
     for merge in plan["merges"]:
         winner = merge["winner"]
         winner_id = winner["subject_id"]
@@ -264,6 +269,23 @@ def apply_plan(conn: sqlite3.Connection, actor_id: str, plan: Dict) -> Dict[str,
         best_desc = max(descs, key=len) if descs else None
         best_conf = max(float((x.get("confidence") or 0.0)) for x in [winner] + merge["losers"])
 
+        for loser in merge["losers"]:
+            lid = loser["subject_id"]
+            # OR IGNORE + DELETE: references the winner already has (same relation
+            # triple, hierarchy edge or memory link) are dropped instead of conflicting.
+            for table, column in (
+                ("kg_relations", "subject_id"),
+                ("kg_relations", "object_id"),
+                ("kg_hierarchy", "child_id"),
+                ("kg_hierarchy", "parent_id"),
+                ("kg_memory_links", "subject_id"),
+            ):
+                cur.execute(f"UPDATE OR IGNORE {table} SET {column} = ? WHERE {column} = ?", (winner_id, lid))
+                cur.execute(f"DELETE FROM {table} WHERE {column} = ?", (lid,))
+            cur.execute("DELETE FROM kg_embeddings WHERE subject_id = ?", (lid,))
+            cur.execute("DELETE FROM kg_subjects WHERE subject_id = ?", (lid,))
+            stats["subjects_merged"] += cur.rowcount
+
         cur.execute(
             """
             UPDATE kg_subjects
@@ -273,15 +295,12 @@ def apply_plan(conn: sqlite3.Connection, actor_id: str, plan: Dict) -> Dict[str,
             (json.dumps(aliases, ensure_ascii=False), best_desc, best_conf, merge["target_name"], winner_id),
         )
 
-        for loser in merge["losers"]:
-            lid = loser["subject_id"]
-            cur.execute("UPDATE kg_relations SET subject_id = ? WHERE subject_id = ?", (winner_id, lid))
-            cur.execute("UPDATE kg_relations SET object_id = ? WHERE object_id = ?", (winner_id, lid))
-            cur.execute("UPDATE kg_hierarchy SET child_id = ? WHERE child_id = ?", (winner_id, lid))
-            cur.execute("UPDATE kg_hierarchy SET parent_id = ? WHERE parent_id = ?", (winner_id, lid))
-            cur.execute("UPDATE kg_memory_links SET subject_id = ? WHERE subject_id = ?", (winner_id, lid))
-            cur.execute("DELETE FROM kg_subjects WHERE subject_id = ?", (lid,))
-            stats["subjects_merged"] += cur.rowcount
+    for sid, _old, new in plan["renames"]:
+        cur.execute(
+            "UPDATE kg_subjects SET canonical_name = ?, last_updated = CURRENT_TIMESTAMP WHERE subject_id = ?",
+            (new, sid),
+        )
+        stats["subjects_renamed"] += cur.rowcount
 
     # Deduplicate relations by full triple.
     cur.execute(
@@ -345,11 +364,12 @@ def apply_plan(conn: sqlite3.Connection, actor_id: str, plan: Dict) -> Dict[str,
 
     if plan["delete_memory_ids"]:
         q = ",".join("?" for _ in plan["delete_memory_ids"])
-        cur.execute(
-            f"DELETE FROM memory_dialogue WHERE actor_id = ? AND id IN ({q})",
-            [actor_id] + plan["delete_memory_ids"],
-        )
-        stats["memory_rows_deleted"] = cur.rowcount
+        for table in ("memory_dialogue", "memory_dialogue_archive"):
+            cur.execute(
+                f"DELETE FROM {table} WHERE actor_id = ? AND id IN ({q})",
+                [actor_id] + plan["delete_memory_ids"],
+            )
+            stats["memory_rows_deleted"] += cur.rowcount
 
     if plan["delete_block_ids"]:
         q = ",".join("?" for _ in plan["delete_block_ids"])
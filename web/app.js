@@ -1522,10 +1522,12 @@ async function renderChatTab() {
       });
 
       if (!response.ok) throw new Error("Bridge failed to start stream");
+      const { turn_id: turnId } = await response.json();
 
       // 2. Connect to SSE (GET)
       status.textContent = "Thinking...";
-      const evtSource = new EventSource("http://localhost:8001/stream_audio");
+      const turnQuery = turnId ? `?turn_id=${encodeURIComponent(turnId)}` : "";
+      const evtSource = new EventSource(`http://localhost:8001/stream_audio${turnQuery}`);
 
       evtSource.onmessage = (e) => {
         const msg = JSON.parse(e.data);
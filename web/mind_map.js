@@ -91,15 +91,40 @@ async function refreshAll() {
     }
 }
 
+// Only the fields the graph renders; ancestors are skipped server-side.
+const KG_FIELDS = 'subject_id,canonical_name,subject_type,confidence,source,description,relations';
+const KG_PAGE_SIZE = 500;
+let kgEtag = { actor: null, tag: null };
+
+async function fetchKGSubjects(actor) {
+    // First page is conditional: an unchanged KG answers 304 and nothing is re-rendered.
+    const base = `${BRIDGE_URL}/kg/${actor}?fields=${KG_FIELDS}&limit=${KG_PAGE_SIZE}`;
+    const headers = (kgEtag.actor === actor && kgEtag.tag) ? { 'If-None-Match': kgEtag.tag } : {};
+    const first = await fetch(base, { headers, cache: 'no-store' });
+    if (first.status === 304) return null;
+    if (!first.ok) throw new Error(`KG fetch failed: ${first.status}`);
+
+    let page = await first.json();
+    const subjects = page.subjects;
+    while (page.next_cursor) {
+        const resp = await fetch(`${base}&cursor=${encodeURIComponent(page.next_cursor)}`, { cache: 'no-store' });
+        if (!resp.ok) throw new Error(`KG fetch failed: ${resp.status}`);
+        page = await resp.json();
+        subjects.push(...page.subjects);
+    }
+    kgEtag = { actor, tag: first.headers.get('ETag') };
+    return subjects;
+}
+
 async function loadKG(actor) {
-    const resp = await fetch(`${BRIDGE_URL}/kg/${actor}`);
-    const data = await resp.json();
+    const subjects = await fetchKGSubjects(actor);
+    if (subjects === null) return;
 
     const nodes = [];
     const links = [];
     const literalIds = new Set();
 
-    data.subjects.forEach(s => {
+    subjects.forEach(s => {
         nodes.push({
             id: s.subject_id,
             label: s.canonical_name,